@@ -0,0 +1,136 @@
+# app/change_feed.py
+
+"""
+    Job transitions made by other scheduler replicas.
+
+    The event bus only carries what this process publishes, so an SSE stream or a
+    cached status view served here would never see a job another replica claimed,
+    finished or appended. Every REPLICA_SYNC_INTERVAL seconds the feed reads the
+    PENDING / RUNNING jobs of the users and workflows someone is watching here
+    (stream subscribers, cached status views), plus the ones it saw active last
+    time, and publishes a `job` event for each row whose status or progress differs
+    from what this process last published. Local events keep its view current, so
+    nothing is sent twice; progress of jobs running in this process is left to the
+    ProgressTracker.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import or_, select
+
+from .db import SessionLocal
+from .models import Job, JobStatus
+from .events import event_bus
+from .progress import progress_tracker
+from .status_cache import workflow_status_cache
+from . import config
+
+
+_ACTIVE = ("PENDING", "RUNNING")
+
+
+class ChangeFeed:
+    def __init__(self, interval: Optional[float]) -> None:
+        self.interval = interval
+        # job_id -> (status, progress) last published here, for jobs still active
+        self._known: Dict[str, Tuple[str, float]] = {}
+        # job_id -> when a local event last touched it; such rows may be read stale
+        self._touched: Dict[str, float] = {}
+        self._users: Set[str] = set()
+        self._workflows: Set[str] = set()
+        self._poller: Optional[asyncio.Task] = None
+        event_bus.add_listener(self._on_event)
+
+    def _on_event(self, event: dict) -> None:
+        if event.get("event") != "job":
+            return
+        job_id = event["job_id"]
+        self._touched[job_id] = time.monotonic()
+        if event["status"] in _ACTIVE:
+            previous = self._known.get(job_id, (None, 0.0))
+            self._known[job_id] = (event["status"], event.get("progress", previous[1]))
+        else:
+            self._known.pop(job_id, None)
+
+    async def poll(self) -> int:
+        """
+        Publish what changed in the watched scope since the last poll.
+
+        return how many events were published
+        """
+        workflows, users = event_bus.watched()
+        workflows |= workflow_status_cache.workflow_ids()
+        if not workflows and not users:
+            self._known.clear()
+            self._touched.clear()
+            self._users, self._workflows = set(), set()
+            return 0
+
+        started = time.monotonic()
+        tracked = list(self._known)
+        scope = []
+        if users:
+            scope.append(Job.user_id.in_(users))
+        if workflows:
+            scope.append(Job.workflow_id.in_(workflows))
+        active = Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING])
+        async with SessionLocal() as db:
+            rows = (await db.execute(
+                select(
+                    Job.id, Job.workflow_id, Job.user_id, Job.status, Job.progress,
+                    Job.branch_id, Job.order_index,
+                ).where(or_(*scope), or_(active, Job.id.in_(tracked)) if tracked else active)
+            )).all()
+
+        published = 0
+        known: Dict[str, Tuple[str, float]] = {}
+        for row in rows:
+            status, progress = row.status.value, row.progress or 0.0
+            if self._touched.get(row.id, 0.0) >= started:
+                # a local event is newer than what was just read
+                if row.id in self._known:
+                    known[row.id] = self._known[row.id]
+                continue
+            previous = self._known.get(row.id)
+            if status in _ACTIVE:
+                known[row.id] = (status, progress)
+            if previous is None:
+                # active before its user / workflow was watched: the subscriber's snapshot has it
+                if row.user_id not in self._users and row.workflow_id not in self._workflows:
+                    continue
+            elif previous[0] == status and (previous[1] == progress or progress_tracker.get(row.id) is not None):
+                continue
+            event_bus.job_status(
+                row.id, row.workflow_id, row.user_id, status, progress=progress,
+                branch_id=row.branch_id, order_index=row.order_index,
+            )
+            published += 1
+
+        self._known = known
+        self._touched = {j: t for j, t in self._touched.items() if t >= started}
+        self._users, self._workflows = users, workflows
+        return published
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"[ChangeFeed] Poll failed: {e}")
+
+    def start(self) -> None:
+        if self._poller is None and self.interval is not None:
+            self._poller = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+
+
+change_feed = ChangeFeed(config.REPLICA_SYNC_INTERVAL)
@@ -1,5 +1,50 @@
 # app/config.py
 
+import os
+
 MAX_WORKERS = 4          
 MAX_ACTIVE_USERS = 3     
-SCHEDULER_INTERVAL = 0.5 
+SCHEDULER_SWEEP_INTERVAL = 10.0  # safety-net pass when no wakeup event arrives
+IMAGE_WORKER_PROCESSES = MAX_WORKERS  # process pool for CPU-bound image tasks
+INSTANSEG_BATCH_SIZE = 4  # tiles per forward pass; override per job with params.batch_size
+INSTANSEG_MIN_TISSUE_FRACTION = 0.05  # skip tiles with less tissue; override per job with params.min_tissue_fraction
+INSTANSEG_READ_WORKERS = 2  # tile decode threads per job (params.read_workers)
+INSTANSEG_PREFETCH_BATCHES = 4  # bounded queue depth between pipeline stages (params.prefetch_batches)
+INSTANSEG_MAX_BATCH_SIZE = 32  # upper bounds for the per-job params above: one request must not exhaust host memory / threads
+INSTANSEG_MAX_READ_WORKERS = 8
+INSTANSEG_MAX_PREFETCH_BATCHES = 16
+RESULT_CACHE_DIR = "outputs/.result_cache"  # same filesystem as outputs/ so hits can hardlink
+RESULT_CACHE_MAX_BYTES = 5 * 1024 ** 3  # LRU eviction above this size
+RESULT_CACHE_HASH_CONTENT = False  # fingerprint inputs by sha256 instead of size+mtime
+FOLLOWER_SYNC_INTERVAL = 1.0  # seconds between progress copies from a single-flight leader to its followers
+SLIDE_POOL_IDLE_SECONDS = 300.0  # close shared slide handles unused for this long
+SLIDE_POOL_MAX_IDLE = 8  # cap on idle open slides kept around for reuse
+SLIDE_REGION_CACHE_BYTES = 512 * 1024 ** 2  # decoded thumbnails/regions shared across jobs
+FLAT_TILED_MIN_PIXELS = 8192 * 8192  # non-WSI images at least this large are read through a memmap pyramid
+FLAT_PYRAMID_CACHE_DIR = "outputs/.pyramid_cache"  # safe to delete; rebuilt on next open
+FLAT_PYRAMID_CACHE_MAX_BYTES = 20 * 1024 ** 3  # least recently opened pyramids are removed above this size
+INSTANSEG_SHARD_TILES = 2000  # tiles per shard when the scheduler can fan a job out (params.shards overrides the count)
+INSTANSEG_MAX_SHARDS = MAX_WORKERS
+SCHEDULING_POLICY = "fair_share"  # "fair_share" (weighted stride scheduling) or "fifo"
+USER_WEIGHTS = {}  # user_id -> share weight (default 1.0); a weight of 2 gets twice the worker-seconds
+FAIR_SHARE_HALF_LIFE = 3600.0  # seconds for past usage to count half as much
+FAIR_SHARE_QUANTUM = 60.0  # worker-seconds charged per dispatch when interleaving one pass
+NODE_CPUS = os.cpu_count() or MAX_WORKERS  # CPU budget jobs are admitted against (see app/resources.py)
+NODE_MEMORY_MB = 16 * 1024  # memory budget for running jobs
+BACKFILL_MAX_DELAY = 120.0  # seconds a job that does not fit may be overtaken before capacity is held for it
+DEFAULT_USER_MAX_CONCURRENCY = MAX_WORKERS  # worker slots (jobs + shards) one user may hold; None = unlimited
+USER_MAX_CONCURRENCY = {}  # user_id -> per-user override
+DEFAULT_WORKFLOW_MAX_CONCURRENCY = None  # worker slots one workflow may hold
+WORKFLOW_MAX_CONCURRENCY = {}  # workflow_id -> per-workflow override
+JOB_TYPE_MAX_CONCURRENCY = {}  # job type value -> cap, e.g. {"instanseg_cell_seg": 2}
+PROGRESS_FLUSH_INTERVAL = 2.0  # seconds between batched progress writes; reads of running jobs come from memory
+EVENT_QUEUE_SIZE = 1000  # buffered events per stream; a client that falls further behind gets a fresh snapshot
+PROGRESS_EVENT_INTERVAL = 0.5  # min seconds between progress events of one job
+EVENT_HEARTBEAT_INTERVAL = 15.0  # keep-alive comment on idle streams (proxies drop silent connections)
+STATUS_CACHE_MAX_WORKFLOWS = 1024  # materialized workflow status views kept in memory (LRU)
+STATUS_CACHE_MAX_AGE = 30.0  # seconds before a view is reloaded, a backstop for changes no event announced here; None = never
+REPLICA_SYNC_INTERVAL = 2.0  # seconds between polls for other replicas' job transitions (app/change_feed.py); None = off
+BULK_MAX_JOBS = 10000  # jobs accepted by one POST /workflows/bulk
+JOB_LEASE_SECONDS = 30.0  # a RUNNING job whose replica stops renewing it for this long is re-queued
+LEASE_HEARTBEAT_INTERVAL = 10.0  # seconds between lease renewals / expired-lease sweeps; well below JOB_LEASE_SECONDS
+REPLICA_ID = os.getenv("REPLICA_ID")  # name of this scheduler in lease_owner; default <hostname>:<pid>:<random>
@@ -1,6 +1,6 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import UniqueConstraint, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -12,24 +12,84 @@ SQLALCHEMY_DATABASE_URL = os.getenv(
 print(f"[Database] Connecting to: {SQLALCHEMY_DATABASE_URL}")
 
 
-if SQLALCHEMY_DATABASE_URL.startswith("postgresql"):
-    # PostgreSQL
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
-else:
-    # SQLite 
-    engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+def async_url(url: str) -> str:
+    """
+    Same database through an asyncio driver: sqlite -> aiosqlite, postgresql -> asyncpg.
+    """
+    scheme, sep, rest = url.partition("://")
+    if scheme in ("sqlite", "sqlite+pysqlite"):
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if scheme in ("postgresql", "postgres", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+if SQLALCHEMY_DATABASE_URL.startswith("postgres"):
+    # PostgreSQL: the pool bounds concurrent DB work (API requests + scheduler + running jobs)
+    engine = create_async_engine(
+        async_url(SQLALCHEMY_DATABASE_URL),
+        pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),  # below typical server / proxy idle timeouts
+        pool_pre_ping=True,  # drop connections the server closed (restart, failover) before using them
     )
+else:
+    # SQLite
+    engine = create_async_engine(async_url(SQLALCHEMY_DATABASE_URL))
 
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: attributes stay readable after commit without an (async) reload
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+
+def upgrade_schema(conn) -> None:
+    """
+    create_all only creates missing tables; bring the ones an older version created up
+    to the models: missing columns are added (and filled with their scalar default),
+    missing indexes and unique constraints are created (a constraint as a unique index,
+    which SQLite can add to an existing table too). Idempotent, runs on every start.
+    Fails, rolling the whole upgrade back, if existing rows violate a new unique index.
+    """
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            conn.execute(text(
+                f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} "
+                f"{column.type.compile(dialect=conn.dialect)}"
+            ))
+            if column.default is not None and column.default.is_scalar:
+                conn.execute(table.update().values({column.name: column.default.arg}))
+            print(f"[Database] Added column {table.name}.{column.name}")
+
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        indexes |= {u["name"] for u in inspector.get_unique_constraints(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(conn)
+                print(f"[Database] Created index {index.name}")
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in indexes:
+                conn.execute(text(
+                    f"CREATE UNIQUE INDEX {quote(constraint.name)} ON {quote(table.name)} "
+                    f"({', '.join(quote(c.name) for c in constraint.columns)})"
+                ))
+                print(f"[Database] Created unique index {constraint.name}")
+
+
+async def create_tables() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
@@ -0,0 +1,197 @@
+# app/events.py
+
+"""
+    In-process pub/sub for job status streaming.
+
+    The scheduler and API publish job state transitions here; progress comes in
+    from the ProgressTracker and is throttled per job (at most one event every
+    PROGRESS_EVENT_INTERVAL seconds, the latest value always delivered last).
+    Subscribers are indexed by workflow and by user, so a publish only touches the
+    streams that asked for that workflow or user.
+
+    Each subscriber has a bounded queue. A client too slow to keep up is not
+    allowed to grow it: the queue is dropped and the stream marked for resync,
+    which makes it send a fresh snapshot instead.
+
+    Listeners (add_listener) are in-process consumers such as the status cache:
+    they get every job and progress event, unthrottled, in the publishing thread.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from . import config
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, workflow_id: Optional[str], user_id: Optional[str]) -> None:
+        self.loop = loop
+        self.workflow_id = workflow_id
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=config.EVENT_QUEUE_SIZE)
+        self.resync = False
+
+    def _put(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+            self.queue.put_nowait({"event": "resync"})
+
+
+class EventBus:
+    def __init__(self) -> None:
+        self._by_workflow: Dict[str, Set[Subscription]] = {}
+        self._by_user: Dict[str, Set[Subscription]] = {}
+        # job_id -> (workflow_id, user_id), for progress reports that only carry the job id
+        self._routes: Dict[str, Tuple[str, str]] = {}
+        # progress throttling: job_id -> last sent time, pending event, scheduled trailing send
+        self._last_sent: Dict[str, float] = {}
+        self._pending: Dict[str, dict] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listeners: List[Callable[[dict], None]] = []
+
+    # --- subscribers ---
+
+    def subscribe(self, *, workflow_id: Optional[str] = None, user_id: Optional[str] = None) -> Subscription:
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        sub = Subscription(loop, workflow_id, user_id)
+        if workflow_id is not None:
+            self._by_workflow.setdefault(workflow_id, set()).add(sub)
+        else:
+            self._by_user.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        index, key = (self._by_workflow, sub.workflow_id) if sub.workflow_id is not None else (self._by_user, sub.user_id)
+        subs = index.get(key)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del index[key]
+
+    def watched(self) -> Tuple[Set[str], Set[str]]:
+        """
+        (workflow ids, user ids) that have at least one stream open here.
+        """
+        return set(self._by_workflow), set(self._by_user)
+
+    def add_listener(self, listener: Callable[[dict], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, event: dict) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"[Events] Listener failed: {e}")
+
+    # --- publishing ---
+
+    def publish(self, event: dict) -> None:
+        """
+        Deliver to the streams of event['workflow_id'] and event['user_id']. Thread-safe.
+        """
+        loop = self._loop
+        if loop is None:
+            return  # nobody has ever subscribed
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event)
+
+    def _deliver(self, event: dict) -> None:
+        # a workflow stream must only see its owner's jobs
+        for sub in self._by_workflow.get(event.get("workflow_id"), ()):
+            if sub.user_id == event.get("user_id"):
+                sub._put(event)
+        for sub in self._by_user.get(event.get("user_id"), ()):
+            sub._put(event)
+
+    def job_status(self, job_id: str, workflow_id: str, user_id: str, status, progress: Optional[float] = None, **extra) -> None:
+        status = getattr(status, "value", status)
+        if status == "RUNNING":
+            self._routes[job_id] = (workflow_id, user_id)
+        else:
+            self._routes.pop(job_id, None)
+            self._drop_progress(job_id)
+        event = {"event": "job", "job_id": job_id, "workflow_id": workflow_id, "user_id": user_id, "status": status}
+        if progress is not None:
+            event["progress"] = progress
+        event.update(extra)
+        self._notify(event)
+        self.publish(event)
+
+    def job_changed(self, job) -> None:
+        """
+        Publish the current state of an ORM Job.
+        """
+        self.job_status(
+            job.id, job.workflow_id, job.user_id, job.status,
+            progress=job.progress or 0.0,
+            branch_id=job.branch_id, order_index=job.order_index,
+        )
+
+    def successors_cancelled(self, job, job_ids) -> None:
+        """
+        Fail-fast cascade: the cancelled successors share the job's workflow and owner.
+        """
+        for job_id in job_ids:
+            self.job_status(job_id, job.workflow_id, job.user_id, "CANCELLED", branch_id=job.branch_id)
+
+    def progress(self, job_id: str, progress: float, processed_tiles=None, total_tiles=None) -> None:
+        """
+        Throttled per job; called from ProgressTracker.report.
+        """
+        if self._listeners:
+            self._notify({"event": "progress", "job_id": job_id, "progress": progress})
+        route = self._routes.get(job_id)
+        if route is None or self._loop is None:
+            return
+        workflow_id, user_id = route
+        if workflow_id not in self._by_workflow and user_id not in self._by_user:
+            return
+        self._pending[job_id] = {
+            "event": "progress", "job_id": job_id, "workflow_id": workflow_id, "user_id": user_id,
+            "progress": progress, "processed_tiles": processed_tiles, "total_tiles": total_tiles,
+        }
+        self._loop.call_soon_threadsafe(self._send_progress, job_id)
+
+    def _send_progress(self, job_id: str) -> None:
+        event = self._pending.get(job_id)
+        if event is None:
+            return
+        wait = self._last_sent.get(job_id, 0.0) + config.PROGRESS_EVENT_INTERVAL - time.monotonic()
+        if wait > 0:
+            # coalesce: one trailing send with whatever is latest by then
+            if job_id not in self._timers:
+                self._timers[job_id] = self._loop.call_later(wait, self._trailing_send, job_id)
+            return
+        del self._pending[job_id]
+        self._last_sent[job_id] = time.monotonic()
+        self._deliver(event)
+
+    def _trailing_send(self, job_id: str) -> None:
+        self._timers.pop(job_id, None)
+        self._send_progress(job_id)
+
+    def _drop_progress(self, job_id: str) -> None:
+        self._pending.pop(job_id, None)
+        self._last_sent.pop(job_id, None)
+        timer = self._timers.pop(job_id, None)
+        if timer is not None:
+            timer.cancel()
+
+
+event_bus = EventBus()
@@ -0,0 +1,221 @@
+# app/image_tasks/cell_writer.py
+
+"""
+    Streaming cell output for segmentation jobs.
+
+    Cells are appended as NDJSON (one JSON object per line) while tiles complete,
+    so memory stays flat however many nuclei a slide has. The first line is a
+    {"metadata": ...} header; every following line is one cell.
+    Everything goes to `<output>.part` and is atomically renamed on commit.
+
+    Checkpointing: after each batch, `<output>.ckpt` gets one line recording the
+    finished tiles and the byte offset the .part file had reached. A re-run with
+    the same checkpoint key truncates .part back to the last recorded offset and
+    continues from there, skipping the tiles that are already done.
+
+    Tiles of a batch that failed are reported with `mark_failed`; the writer then
+    refuses to commit, so the checkpoint stays and a re-run retries just those tiles.
+"""
+
+import json
+import os
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .polygons import polygon_bbox
+
+
+Tile = Tuple[int, int, int, int]
+
+
+class CellWriter:
+    def __init__(self, output_path: str, metadata: dict, checkpoint_key: Optional[dict] = None) -> None:
+        self.output_path = output_path
+        self.part_path = output_path + ".part"
+        self.ckpt_path = output_path + ".ckpt"
+        self.checkpoint_key = checkpoint_key
+        self.cell_count = 0
+        self.done_tiles: Set[Tile] = set()
+        self.failed_tiles: Set[Tile] = set()
+
+        out_dir = os.path.dirname(output_path)
+        if out_dir: os.makedirs(out_dir, exist_ok=True)
+
+        self._ckpt = None
+        if checkpoint_key is not None and self._resume():
+            return
+
+        self._f = open(self.part_path, "wb")
+        self._f.write((json.dumps({"metadata": metadata}) + "\n").encode())
+        if checkpoint_key is not None:
+            self._ckpt = open(self.ckpt_path, "w")
+            self._write_ckpt({"key": checkpoint_key, "offset": self._f.tell()})
+
+    def _resume(self) -> bool:
+        """
+        Pick up an earlier run of the same job. Returns False (start fresh) when there is
+        no checkpoint or it was written for a different input / tiling.
+        """
+        if not (os.path.exists(self.ckpt_path) and os.path.exists(self.part_path)):
+            return False
+
+        records = []
+        with open(self.ckpt_path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break # torn last line from a crash
+        if not records or records[0].get("key") != self.checkpoint_key:
+            return False
+
+        last = records[-1]
+        for rec in records[1:]:
+            self.done_tiles.update(tuple(t) for t in rec["tiles"])
+        self.cell_count = last.get("cells", 0)
+
+        # drop cells written after the last checkpoint; those tiles run again
+        self._f = open(self.part_path, "r+b")
+        self._f.truncate(last["offset"])
+        self._f.seek(last["offset"])
+
+        # rewrite the log without a possibly torn tail
+        self._ckpt = open(self.ckpt_path, "w")
+        for rec in records:
+            self._ckpt.write(json.dumps(rec) + "\n")
+        self._ckpt.flush()
+
+        print(f"[CellWriter] Resuming {self.output_path}: {len(self.done_tiles)} tiles, {self.cell_count} cells already done")
+        return True
+
+    def _write_ckpt(self, record: dict) -> None:
+        self._ckpt.write(json.dumps(record) + "\n")
+        self._ckpt.flush()
+        os.fsync(self._ckpt.fileno())
+
+    def write_polygons(self, polygons: List[np.ndarray], score: float = 0.95) -> None:
+        """
+        Append one tile's cells and flush, so a crash loses at most the tile in hand.
+        """
+        lines = []
+        for poly in polygons:
+            self.cell_count += 1
+            lines.append(json.dumps({
+                "id": self.cell_count,
+                "polygon": poly.tolist(),
+                "bbox": polygon_bbox(poly),
+                "score": score,
+            }))
+        if lines:
+            self._f.write(("\n".join(lines) + "\n").encode())
+            self._f.flush()
+
+    def append_cells(self, cells: Iterable[dict]) -> None:
+        """
+        Append already-built cells (e.g. from shard outputs), renumbering their ids
+        so they continue this writer's sequence.
+        """
+        buf = []
+        for cell in cells:
+            self.cell_count += 1
+            buf.append(json.dumps({**cell, "id": self.cell_count}))
+            if len(buf) >= 1000:
+                self._f.write(("\n".join(buf) + "\n").encode())
+                buf = []
+        if buf:
+            self._f.write(("\n".join(buf) + "\n").encode())
+        self._f.flush()
+
+    def checkpoint(self, tiles: List[Tile]) -> None:
+        """
+        Mark `tiles` as done. Their cells must already have been written.
+        """
+        if self._ckpt is None:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._write_ckpt({"tiles": [list(t) for t in tiles], "offset": self._f.tell(), "cells": self.cell_count})
+        self.done_tiles.update(tuple(t) for t in tiles)
+
+    def mark_failed(self, tiles: List[Tile]) -> None:
+        """
+        Record tiles whose batch errored: they are missing from the output.
+        """
+        self.failed_tiles.update(tuple(t) for t in tiles)
+
+    def commit(self) -> None:
+        """
+        Finish the stream. `.ndjson` outputs are renamed into place; any other
+        output path gets the legacy {"metadata", "cells"} JSON layout via export_cells_json.
+        Raises, leaving .part and .ckpt in place, if any tiles failed.
+        """
+        if self.failed_tiles:
+            raise RuntimeError(f"{len(self.failed_tiles)} tile(s) failed, not publishing {self.output_path}")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+
+        if self.output_path.endswith(".ndjson"):
+            os.replace(self.part_path, self.output_path)
+        else:
+            export_cells_json(self.part_path, self.output_path)
+            os.remove(self.part_path)
+
+        if self._ckpt is not None:
+            self._ckpt.close()
+            os.remove(self.ckpt_path)
+
+    def abort(self) -> None:
+        """
+        Stop without publishing. With checkpointing on, .part and .ckpt stay for the next run.
+        """
+        self._f.close()
+        if self._ckpt is not None:
+            self._ckpt.close()
+            return
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+
+def iter_cells(ndjson_path: str) -> Iterator[dict]:
+    """
+    Lazily yield the cells of an NDJSON cell file (the metadata header is skipped).
+    """
+    with open(ndjson_path) as f:
+        f.readline()
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_metadata(ndjson_path: str) -> dict:
+    """
+    The {"metadata": ...} header of an NDJSON cell file.
+    """
+    with open(ndjson_path) as f:
+        return json.loads(f.readline() or "{}").get("metadata", {})
+
+
+def export_cells_json(ndjson_path: str, json_path: str) -> None:
+    """
+    Post-processing export to {"metadata": ..., "cells": [...]}.
+    Streams line by line into a temp file and renames it, so memory stays flat here too.
+    """
+    tmp_path = json_path + ".tmp"
+
+    with open(tmp_path, "w") as out, open(ndjson_path) as src:
+        header = json.loads(src.readline() or "{}")
+        out.write('{"metadata": ' + json.dumps(header.get("metadata", {})) + ', "cells": [')
+        first = True
+        for line in src:
+            line = line.strip()
+            if not line: continue
+            if not first: out.write(", ")
+            out.write(line)
+            first = False
+        out.write("]}")
+        out.flush()
+        os.fsync(out.fileno())
+
+    os.replace(tmp_path, json_path)
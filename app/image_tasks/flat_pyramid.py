@@ -0,0 +1,169 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+
+from .. import config
+
+# rows per conversion strip are sized so one strip stays around this many bytes
+STRIP_BYTES = 64 * 1024 ** 2
+# stop halving once the smallest level fits in this many pixels per side
+MIN_LEVEL_SIZE = 1024
+
+_build_lock = threading.Lock()
+
+
+def _cache_root(path):
+    st = os.stat(path)
+    ident = f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return os.path.join(config.FLAT_PYRAMID_CACHE_DIR, hashlib.sha1(ident.encode()).hexdigest())
+
+
+def _pyramid_bytes(root):
+    with open(os.path.join(root, "meta.json")) as f:
+        return sum(w * h * 3 for w, h in json.load(f)["levels"])
+
+
+def _evict(keep):
+    """
+    Remove the least recently opened pyramids (directory mtime, touched on every
+    open) until the cache fits FLAT_PYRAMID_CACHE_MAX_BYTES; `keep` always stays.
+    An evicted pyramid still open elsewhere keeps working: its mapped files are only
+    freed once unmapped.
+    """
+    cache_dir = config.FLAT_PYRAMID_CACHE_DIR
+    found, total = [], 0
+    for name in os.listdir(cache_dir):
+        root = os.path.join(cache_dir, name)
+        try:
+            size = _pyramid_bytes(root)
+            found.append((os.path.getmtime(root), root, size))
+        except (OSError, ValueError, KeyError):
+            continue  # a build in progress (.tmp) or an unreadable leftover
+        total += size
+    for _, root, size in sorted(found):
+        if total <= config.FLAT_PYRAMID_CACHE_MAX_BYTES:
+            break
+        if root == keep:
+            continue
+        shutil.rmtree(root, ignore_errors=True)
+        total -= size
+        print(f"[FlatPyramid] Evicted {root} ({size / 1024 ** 2:.0f} MB)")
+
+
+def _strip_rows(width):
+    return max(1, STRIP_BYTES // max(1, width * 3))
+
+
+def _build(img, root):
+    """
+    Decode img once into level_0.raw (RGB, row-major) strip by strip, then halve
+    into further levels from the memmap, so only one strip is held beyond the
+    decoder's own buffer. Written to a temp dir and renamed into place.
+    """
+    tmp = f"{root}.tmp{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        width, height = img.size
+        prev = np.memmap(os.path.join(tmp, "level_0.raw"), dtype=np.uint8, mode="w+", shape=(height, width, 3))
+        rows = _strip_rows(width)
+        for y in range(0, height, rows):
+            y1 = min(height, y + rows)
+            prev[y:y1] = np.asarray(img.crop((0, y, width, y1)).convert("RGB"))
+        prev.flush()
+
+        levels = [[width, height]]
+        while max(width, height) > MIN_LEVEL_SIZE and min(width, height) >= 2:
+            width, height = width // 2, height // 2
+            cur = np.memmap(
+                os.path.join(tmp, f"level_{len(levels)}.raw"),
+                dtype=np.uint8, mode="w+", shape=(height, width, 3),
+            )
+            rows = _strip_rows(width * 4)
+            for y in range(0, height, rows):
+                y1 = min(height, y + rows)
+                block = prev[2 * y:2 * y1, :2 * width].astype(np.uint16)
+                cur[y:y1] = (
+                    (block[0::2, 0::2] + block[1::2, 0::2] + block[0::2, 1::2] + block[1::2, 1::2] + 2) // 4
+                ).astype(np.uint8)
+            cur.flush()
+            prev = cur
+            levels.append([width, height])
+        del prev
+
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"levels": levels}, f)
+        try:
+            os.rename(tmp, root)
+        except OSError:
+            # another process finished the same pyramid first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+class FlatPyramid:
+    """
+    On-disk, memory-mapped RGB pyramid for large flat images (PNG/JPG/TIFF that
+    OpenSlide cannot open). Built once per file version under FLAT_PYRAMID_CACHE_DIR,
+    which is kept under FLAT_PYRAMID_CACHE_MAX_BYTES by evicting the least recently
+    opened pyramids; reads only touch the pages of the region they cover. Level n is a 2^n downsample,
+    so read_region follows OpenSlide's conventions (level-0 coordinates, level size).
+    """
+    def __init__(self, root):
+        with open(os.path.join(root, "meta.json")) as f:
+            meta = json.load(f)
+        self.level_dimensions = [tuple(dims) for dims in meta["levels"]]
+        self.dimensions = self.level_dimensions[0]
+        self._levels = [
+            np.memmap(os.path.join(root, f"level_{i}.raw"), dtype=np.uint8, mode="r", shape=(h, w, 3))
+            for i, (w, h) in enumerate(self.level_dimensions)
+        ]
+
+    @classmethod
+    def open(cls, path, img):
+        root = _cache_root(path)
+        if not os.path.exists(os.path.join(root, "meta.json")):
+            with _build_lock:
+                if not os.path.exists(os.path.join(root, "meta.json")):
+                    print(f"[FlatPyramid] Building tiled cache for {path}")
+                    os.makedirs(config.FLAT_PYRAMID_CACHE_DIR, exist_ok=True)
+                    _build(img, root)
+                    _evict(keep=root)
+        else:
+            # last-used time for eviction
+            os.utime(root)
+        return cls(root)
+
+    def read_region(self, location, level, size):
+        level = min(level, len(self._levels) - 1)
+        scale = 2 ** level
+        x, y = location[0] // scale, location[1] // scale
+        w, h = size
+        lw, lh = self.level_dimensions[level]
+
+        # outside the image is transparent, as with OpenSlide
+        out = np.zeros((h, w, 4), dtype=np.uint8)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, lw), min(y + h, lh)
+        if x1 > x0 and y1 > y0:
+            out[y0 - y:y1 - y, x0 - x:x1 - x, :3] = self._levels[level][y0:y1, x0:x1]
+            out[y0 - y:y1 - y, x0 - x:x1 - x, 3] = 255
+        return Image.fromarray(out, "RGBA")
+
+    def get_thumbnail(self, size):
+        width, height = self.dimensions
+        downsample = max(width / size[0], height / size[1])
+        level = 0
+        while level + 1 < len(self._levels) and 2 ** (level + 1) <= downsample:
+            level += 1
+        img = Image.fromarray(np.array(self._levels[level]), "RGB")
+        img.thumbnail(size)
+        return img
+
+    def close(self):
+        self._levels = []
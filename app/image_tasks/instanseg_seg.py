@@ -1,26 +1,40 @@
 # app/image_tasks/instanseg_seg.py
 
 import os
-import json
+import math
+import time
 import asyncio
 import numpy as np
-import cv2
 from PIL import Image, ImageDraw
 
 
 import torch
 import instanseg
+# the helpers InstanSeg.eval_small_image preprocesses with, for batches of tiles
+from instanseg.utils.utils import _filter_kwargs, percentile_normalize
+from instanseg.utils.pytorch_utils import _to_tensor_float32
 
-from sqlalchemy.orm import Session
-from ..models import Job
-from .utils import SmartSlide  
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models import Job, JobType
+from ..repositories import job_repo
+from .. import config
+from ..progress import progress_tracker
+from .utils import save_image_atomic
+from .slide_pool import open_slide
+from .tissue_mask import threshold_tissue
+from .polygons import mask_to_polygons
+from .cell_writer import CellWriter, iter_cells, read_metadata
+from .tile_pipeline import run_tile_pipeline, format_stats
+from . import worker_pool
 
 
 TILE_SIZE = 512       
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
 
+# per-process cache: each pool worker loads the model once
 _model_cache = None
+
 def get_model():
     global _model_cache
     if _model_cache is None:
@@ -29,53 +43,179 @@ def get_model():
         _model_cache = instanseg.InstanSeg("nuclei", device=DEVICE)
     return _model_cache
 
-def mask_to_polygons(mask_array, offset_x, offset_y):
-    
-    polygons = []
-    cell_ids = np.unique(mask_array)
+def load_model():
+    get_model()
+
+def _label_plane(labels):
+    # InstanSeg returns (1, C, H, W) labels; the nuclei channel is the first plane
+    labels = np.asarray(labels)
+    while labels.ndim > 2:
+        labels = labels[0]
+    return labels
+
+def read_tiles(slide, tiles):
+    """
+    Read stage (parent process, reader threads): decode a batch of tiles to RGB arrays.
+    """
+    images = []
+    for tx, ty, tw, th in tiles:
+        # tiles are streamed once per job; keep them out of the shared region cache
+        region = slide.read_region((tx, ty), 0, (tw, th), cache=False)
+        images.append(np.array(region.convert("RGB")))
+    return images
+
+def _infer_batch(model, images):
+    """
+    One forward pass over a stack of equally sized tiles, with exactly the pre- and
+    postprocessing of model.eval_small_image: float32 channels-first, instanseg's own
+    per-channel percentile normalisation of each tile, all output targets, and the
+    first label plane back. A tile's labels do not depend on the batch it is in.
+    """
+    # normalised on the inference device, as eval_small_image does (quantiles differ on GPU)
+    batch = torch.stack([
+        percentile_normalize(_to_tensor_float32(img).to(model.inference_device)) for img in images
+    ])
+    kwargs = _filter_kwargs(model.instanseg, {"target_segmentation": torch.tensor([1, 1])})
+    with torch.no_grad(), torch.amp.autocast("cuda"):
+        labels = model.instanseg(batch, **kwargs)
+    return [_label_plane(plane) for plane in labels.cpu().numpy()]
+
+def _infer_tiles(model, images):
+    """
+    Label masks for a decoded batch, in order. Tiles of the same shape (all but the
+    slide's right / bottom edge) share a forward pass; nothing is padded.
+    """
+    by_shape = {}
+    for i, img in enumerate(images):
+        by_shape.setdefault(img.shape, []).append(i)
+
+    masks = [None] * len(images)
+    for indices in by_shape.values():
+        for i, mask in zip(indices, _infer_batch(model, [images[i] for i in indices])):
+            masks[i] = mask
+    return masks
+
+def segment_images(tiles, images):
+    """
+    Pool worker entry point: run InstanSeg on a decoded batch, return polygons per tile.
+    """
+    masks = _infer_tiles(get_model(), images)
+    return [
+        mask_to_polygons(mask_np, tx, ty)
+        for mask_np, (tx, ty, _, _) in zip(masks, tiles)
+    ]
+
+async def _resolve_tissue_mask_path(db, job):
+    params = job.params or {}
+    if params.get("tissue_mask_path"):
+        return params["tissue_mask_path"]
+
+    # analysis branches usually run tissue_mask on the same slide right before segmentation
+    mask_job = await job_repo.get_succeeded_branch_job(
+        db,
+        branch_id=job.branch_id,
+        job_type=JobType.TISSUE_MASK,
+        input_path=job.input_path,
+        before_order_index=job.order_index,
+    )
+    # end the read transaction here: segmentation keeps this session idle for a long time
+    await db.commit()
+    if mask_job and mask_job.output_path and os.path.exists(mask_job.output_path):
+        return mask_job.output_path
+    return None
+
+def load_tissue_mask(slide, mask_path):
+    """
+    Low-resolution boolean tissue mask: the given mask image, or a cheap one from the thumbnail.
+    """
+    if mask_path:
+        mask = Image.open(mask_path).convert("L")
+    else:
+        mask = threshold_tissue(slide.get_thumbnail((1024, 1024)))
+    return np.array(mask) > 0
+
+def tissue_fractions(mask, width, height, tiles):
+    """
+    Fraction of tissue pixels under each tile, measured on the mask's own grid.
+    """
+    mh, mw = mask.shape
+    sx, sy = mw / width, mh / height
+    fractions = []
+    for tx, ty, tw, th in tiles:
+        x0 = min(int(tx * sx), mw - 1)
+        y0 = min(int(ty * sy), mh - 1)
+        x1 = max(x0 + 1, int(np.ceil((tx + tw) * sx)))
+        y1 = max(y0 + 1, int(np.ceil((ty + th) * sy)))
+        fractions.append(float(mask[y0:y1, x0:x1].mean()))
+    return fractions
+
+def _checkpoint_key(job, width, height):
+    # a checkpoint is only reusable for the same file contents and tile grid
+    st = os.stat(job.input_path)
+    return {
+        "input_path": job.input_path,
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "dims": [width, height],
+        "tile_size": TILE_SIZE,
+    }
+
+def render_overlay(slide, width, height, cells_path, overlay_path):
+    thumb = slide.get_thumbnail((2048, 2048))
+    t_w, t_h = thumb.size
+    scale_x, scale_y = t_w / width, t_h / height
     
-    for cid in cell_ids:
-        if cid == 0: continue 
-        
+    draw = ImageDraw.Draw(thumb)
+    for cell in iter_cells(cells_path):
         
-        binary = (mask_array == cid).astype(np.uint8)
-        
-        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        for contour in contours:
-            if len(contour) < 3: continue 
-            
-            
-            points = []
-            for pt in contour:
-                px, py = pt[0]
-                points.append([int(px + offset_x), int(py + offset_y)])
-            
-            if len(points) >= 3:
-                polygons.append(points)
-    return polygons
+        poly = [(int(p[0]*scale_x), int(p[1]*scale_y)) for p in cell['polygon']]
+        if len(poly) > 2:
+            draw.line(poly + [poly[0]], fill="#00ff00", width=2)
+    
+    save_image_atomic(thumb, overlay_path)
 
-async def run_instanseg_job(db: Session, job: Job) -> None:
+async def run_instanseg_job(db: AsyncSession, job: Job, run_shards=None) -> None:
+    """
+    run_shards: scheduler hook that runs coroutine factories on free worker slots;
+    without it (or for small slides) the whole slide runs in this job's slot.
+    """
     if not os.path.exists(job.input_path):
         print(f"[InstanSeg] Missing: {job.input_path}")
         return 
 
     
     try:
-        slide = SmartSlide(job.input_path)
-        width, height = slide.dimensions
+        # may build the flat-image pyramid on first open
+        slide = await asyncio.to_thread(open_slide, job.input_path)
     except Exception as e:
         print(f"[InstanSeg] Error opening: {e}")
         return
 
+    try:
+        await _segment_slide(db, job, slide, run_shards)
+    finally:
+        slide.close()
+
+def _shard_count(params, n_tiles):
+    if "shards" in params:
+        n = _int_param(params, "shards", 1, config.INSTANSEG_MAX_SHARDS)
+    else:
+        n = -(-n_tiles // max(1, config.INSTANSEG_SHARD_TILES))
+    return max(1, min(n, config.INSTANSEG_MAX_SHARDS, n_tiles))
+
+def _shard_path(job, index, count):
+    return f"{os.path.splitext(job.output_path)[0]}.shard{index}of{count}.ndjson"
+
+async def _segment_slide(db: AsyncSession, job: Job, slide, run_shards=None) -> None:
+    width, height = slide.dimensions
     print(f"[InstanSeg] Processing {width}x{height} ({slide.mode}) | Job: {job.id}")
     
     
     try:
-        model = get_model()
+        await worker_pool.run_in_pool(load_model)
     except Exception as e:
         print(f"[InstanSeg] Model load failed: {e}")
-        return
+        raise
 
     
     tiles = []
@@ -84,73 +224,172 @@ async def run_instanseg_job(db: Session, job: Job) -> None:
             w = min(TILE_SIZE, width - x)
             h = min(TILE_SIZE, height - y)
             tiles.append((x, y, w, h))
-            
-    job.total_tiles = len(tiles)
-    job.processed_tiles = 0
-    job.progress = 0.0
-    db.commit()
 
-    all_cells = []
-    
-   
-    for i, (tx, ty, tw, th) in enumerate(tiles):
-        await asyncio.sleep(0) 
-        
+    params = job.params or {}
+    min_tissue = _fraction_param(params, "min_tissue_fraction", config.INSTANSEG_MIN_TISSUE_FRACTION)
+    if params.get("tissue_filter", True) and min_tissue > 0:
         try:
+            mask_path = await _resolve_tissue_mask_path(db, job)
+            mask = await asyncio.to_thread(load_tissue_mask, slide, mask_path)
+            fractions = tissue_fractions(mask, width, height, tiles)
+            grid_size = len(tiles)
+            tiles = [t for t, frac in zip(tiles, fractions) if frac >= min_tissue]
+            print(
+                f"[InstanSeg] Tissue filter ({mask_path or 'thumbnail'}): "
+                f"{len(tiles)}/{grid_size} tiles kept | Job: {job.id}"
+            )
+        except Exception as e:
+            print(f"[InstanSeg] Tissue filter failed, processing all tiles: {e}")
             
-            region = slide.read_region((tx, ty), 0, (tw, th))
-            img_np = np.array(region.convert("RGB"))
-            
-            
-            labeled_output = model.eval_small_image(img_np, progress_bar=False)
-            
-            
-            mask_np = labeled_output[0].cpu().numpy()
-            polys = mask_to_polygons(mask_np, tx, ty)
-            
-            for poly in polys:
-                xs = [p[0] for p in poly]
-                ys = [p[1] for p in poly]
-                all_cells.append({
-                    "id": len(all_cells) + 1,
-                    "polygon": poly,
-                    "bbox": [min(xs), min(ys), max(xs)-min(xs), max(ys)-min(ys)],
-                    "score": 0.95
-                })
+    # resume from an earlier run of this job (cancel / restart) when its checkpoint still matches
+    checkpoint_key = _checkpoint_key(job, width, height) if params.get("checkpoint", True) else None
+    n_shards = _shard_count(params, len(tiles)) if run_shards else 1
 
-        except Exception as e:
-            print(f"[InstanSeg] Tile error: {e}")
+    done_tiles = 0
+    progress_tracker.report(job.id, 0.0, processed_tiles=0, total_tiles=len(tiles))
 
-        
-        job.processed_tiles = i + 1
-        job.progress = (i + 1) / len(tiles)
-        if i % 5 == 0 or i == len(tiles)-1: db.commit()
+    def on_tiles_done(n, error):
+        # shards share this job: progress is the sum over all of them
+        nonlocal done_tiles
+        if error is not None:
+            print(f"[InstanSeg] Tile error: {error}")
 
-    
-    out_dir = os.path.dirname(job.output_path)
-    if out_dir: os.makedirs(out_dir, exist_ok=True)
+        done_tiles += n
+        progress_tracker.report(job.id, done_tiles / len(tiles), processed_tiles=done_tiles, total_tiles=len(tiles))
+
+    if n_shards == 1:
+        writer = CellWriter(job.output_path, {"dims": [width, height]}, checkpoint_key=checkpoint_key)
+        try:
+            await _segment_tiles(job, slide, tiles, writer, params, on_tiles_done)
+            # overlay is drawn from the streamed cells before the final rename/export
+            await _publish(job, slide, writer)
+        except BaseException:
+            writer.abort()
+            raise
+        return
+
+    # contiguous row-major ranges: each shard streams its own checkpointed cell file
+    bounds = [len(tiles) * i // n_shards for i in range(n_shards + 1)]
+    shard_paths = [_shard_path(job, i, n_shards) for i in range(n_shards)]
+    print(f"[InstanSeg] {len(tiles)} tiles split into {n_shards} shards | Job: {job.id}")
+
+    def shard_runner(index):
+        shard_tiles = tiles[bounds[index]:bounds[index + 1]]
+        shard_key = dict(checkpoint_key, shard=[index, n_shards]) if checkpoint_key else None
+
+        async def run():
+            path = shard_paths[index]
+            if shard_key and os.path.exists(path) and read_metadata(path).get("shard_key") == shard_key:
+                # finished in an earlier run that did not get to the merge
+                on_tiles_done(len(shard_tiles), None)
+                return path
+            writer = CellWriter(path, {"dims": [width, height], "shard_key": shard_key}, checkpoint_key=shard_key)
+            try:
+                await _segment_tiles(job, slide, shard_tiles, writer, params, on_tiles_done, shards=n_shards)
+                await asyncio.to_thread(writer.commit)
+            except BaseException:
+                writer.abort()
+                raise
+            return path
+        return run
+
+    await run_shards([shard_runner(i) for i in range(n_shards)])
 
-    with open(job.output_path, "w") as f:
-        json.dump({"metadata": {"dims": [width, height]}, "cells": all_cells}, f)
+    writer = CellWriter(job.output_path, {"dims": [width, height]})
+    try:
+        def merge():
+            for path in shard_paths:
+                writer.append_cells(iter_cells(path))
+        await asyncio.to_thread(merge)
+        print(f"[InstanSeg] Merged {n_shards} shards | Job: {job.id}")
+        await _publish(job, slide, writer)
+    except BaseException:
+        writer.abort()
+        raise
+    for path in shard_paths:
+        os.remove(path)
+
+def _int_param(params, name, default, maximum):
+    # client-supplied tuning knob: invalid -> default, clamped to [1, maximum]
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(1, min(value, maximum))
+
+def _fraction_param(params, name, default):
+    # client-supplied fraction: invalid or NaN -> default, clamped to [0, 1]
+    try:
+        value = float(params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    if math.isnan(value):
+        value = default
+    return max(0.0, min(value, 1.0))
+
+async def _segment_tiles(job, slide, tiles, writer, params, on_tiles_done, shards=1):
+    """
+    Run the read -> infer -> write pipeline over the tiles `writer` has not checkpointed yet.
+    shards: how many pipelines of this job run at once; they split the pool between them.
+    Raises if any batch failed: the healthy batches stay checkpointed, but the output is
+    incomplete and must not be published.
+    """
+    remaining = [t for t in tiles if t not in writer.done_tiles]
+    if len(remaining) < len(tiles):
+        on_tiles_done(len(tiles) - len(remaining), None)
 
+    batch_size = _int_param(params, "batch_size", config.INSTANSEG_BATCH_SIZE, config.INSTANSEG_MAX_BATCH_SIZE)
+    batches = [remaining[i:i + batch_size] for i in range(0, len(remaining), batch_size)]
     
+    # by default one batch per pool process in flight, so one job cannot flood the pool
+    read_workers = _int_param(params, "read_workers", config.INSTANSEG_READ_WORKERS, config.INSTANSEG_MAX_READ_WORKERS)
+    pool_share = max(1, worker_pool.pool_size() // shards)
+    infer_concurrency = _int_param(params, "infer_concurrency", pool_share, pool_share)
+    prefetch = _int_param(params, "prefetch_batches", config.INSTANSEG_PREFETCH_BATCHES, config.INSTANSEG_MAX_PREFETCH_BATCHES)
+    started = time.monotonic()
+
+    failed = []
+
+    def batch_done(batch, error):
+        if error is not None:
+            failed.append(error)
+            writer.mark_failed(batch)
+        on_tiles_done(len(batch), error)
+
+    def write_batch(batch, polys_per_tile):
+        for polys in polys_per_tile:
+            writer.write_polygons(polys)
+        writer.checkpoint(batch)
+
+    stats = await run_tile_pipeline(
+        batches,
+        read_batch=lambda batch: read_tiles(slide, batch),
+        infer_batch=lambda batch, images: worker_pool.run_in_pool(segment_images, batch, images),
+        write_batch=write_batch,
+        on_batch_done=batch_done,
+        read_workers=read_workers,
+        infer_concurrency=infer_concurrency,
+        prefetch=prefetch,
+    )
+
+    elapsed = time.monotonic() - started
+    print(
+        f"[InstanSeg] {len(remaining)} tiles in {elapsed:.1f}s "
+        f"({len(remaining) / max(elapsed, 1e-6):.2f} tiles/s, batch={batch_size}) | Job: {job.id}"
+    )
+    print(f"[InstanSeg] Stages: {format_stats(stats)} | Job: {job.id}")
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(batches)} tile batches failed (first: {failed[0]!r})")
+
+async def _publish(job, slide, writer):
+    width, height = slide.dimensions
     try:
-        thumb = slide.get_thumbnail((2048, 2048))
-        t_w, t_h = thumb.size
-        scale_x, scale_y = t_w / width, t_h / height
-        
-        draw = ImageDraw.Draw(thumb)
-        for cell in all_cells:
-            
-            poly = [(int(p[0]*scale_x), int(p[1]*scale_y)) for p in cell['polygon']]
-            if len(poly) > 2:
-                draw.line(poly + [poly[0]], fill="#00ff00", width=2)
-        
-        overlay_path = job.output_path.replace(".json", "_overlay.png")
-        thumb.save(overlay_path)
+        overlay_path = os.path.splitext(job.output_path)[0] + "_overlay.png"
+        await asyncio.to_thread(render_overlay, slide, width, height, writer.part_path, overlay_path)
         print(f"[InstanSeg] Overlay saved: {overlay_path}")
         
     except Exception as e:
         print(f"[InstanSeg] Viz failed: {e}")
 
-    slide.close()
\ No newline at end of file
+    await asyncio.to_thread(writer.commit)
+    print(f"[InstanSeg] {writer.cell_count} cells written: {job.output_path}")
@@ -1,41 +1,34 @@
 import os
 import asyncio
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models import Job
-from .utils import SmartSlide
+from ..progress import progress_tracker
+from .utils import save_image_atomic
+from .slide_pool import open_slide
 
-async def run_preview_job(db: Session, job: Job) -> None:
+async def run_preview_job(db: AsyncSession, job: Job) -> None:
     """
     生成 WSI 预览图 (Thumbnail)
     """
     if not os.path.exists(job.input_path):
         return
 
-    job.total_tiles = 1
-    job.processed_tiles = 0
-    job.progress = 0.1
-    db.commit()
+    progress_tracker.report(job.id, 0.1, processed_tiles=0, total_tiles=1)
 
     try:
-        slide = SmartSlide(job.input_path)
-        
-        
         await asyncio.sleep(0.5)
         
         
-        preview = slide.get_thumbnail((1024, 1024))
+        with await asyncio.to_thread(open_slide, job.input_path) as slide:
+            preview = await asyncio.to_thread(slide.get_thumbnail, (1024, 1024))
         
         out_dir = os.path.dirname(job.output_path)
         if out_dir: os.makedirs(out_dir, exist_ok=True)
         
-        preview.save(job.output_path)
+        save_image_atomic(preview, job.output_path)
         print(f"[Preview] Saved: {job.output_path}")
-        
-        slide.close()
 
-        job.processed_tiles = 1
-        job.progress = 1.0
-        db.commit()
+        progress_tracker.report(job.id, 1.0, processed_tiles=1, total_tiles=1)
 
     except Exception as e:
         print(f"[Preview] Failed: {e}")
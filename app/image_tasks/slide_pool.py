@@ -0,0 +1,231 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from .. import config
+from .utils import SmartSlide
+
+
+def _image_nbytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+class RegionCache:
+    """
+    Byte-bounded LRU of decoded images (thumbnails / regions), shared by every job
+    in the process. Callers always get a copy, so drawing on a result is safe.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (image, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, img):
+        nbytes = _image_nbytes(img)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (img, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def find_thumbnail(self, slide_key, min_scale):
+        """
+        Smallest cached thumbnail of this slide that is at least min_scale of the full
+        resolution, so a smaller thumbnail can be derived without another decode.
+        """
+        best = None
+        with self._lock:
+            for key, (img, _) in self._entries.items():
+                if key[0] != slide_key or key[1] != "thumb" or key[3] < min_scale:
+                    continue
+                if best is None or key[3] < best[0][3]:
+                    best = (key, img)
+            if best is not None:
+                self._entries.move_to_end(best[0])
+        return best[1] if best else None
+
+    def drop_slide(self, slide_key):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == slide_key]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SlideHandle:
+    """
+    A borrowed reference to a pooled SmartSlide, with the same read interface.
+    close() returns it to the pool instead of closing the underlying file.
+    """
+    def __init__(self, pool, key, slide):
+        self._pool = pool
+        self._key = key
+        self._slide = slide
+        self._closed = False
+        self.path = slide.path
+        self.mode = slide.mode
+        self.dimensions = slide.dimensions
+
+    def read_region(self, location, level, size, cache=True):
+        if not cache:
+            return self._slide.read_region(location, level, size)
+        key = (self._key, "region", tuple(location), level, tuple(size))
+        img = self._pool.regions.get(key)
+        if img is None:
+            img = self._slide.read_region(location, level, size)
+            self._pool.regions.put(key, img)
+        return img.copy()
+
+    def get_thumbnail(self, size):
+        width, height = self.dimensions
+        scale = min(1.0, size[0] / width, size[1] / height)
+        key = (self._key, "thumb", tuple(size), scale)
+        img = self._pool.regions.get(key)
+        if img is None:
+            # tissue mask / preview / overlay ask for different sizes of the same slide
+            larger = self._pool.regions.find_thumbnail(self._key, scale)
+            if larger is not None:
+                img = larger.copy()
+                img.thumbnail(size)
+            else:
+                img = self._slide.get_thumbnail(size)
+            self._pool.regions.put(key, img)
+        return img.copy()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool.release(self._key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SlidePool:
+    """
+    Process-wide cache of open slides keyed by (realpath, mtime), so jobs on the same
+    file share one handle and one set of decoded thumbnails. Entries are refcounted;
+    idle ones are closed after SLIDE_POOL_IDLE_SECONDS or when more than
+    SLIDE_POOL_MAX_IDLE are idle. A changed mtime opens a fresh handle.
+    """
+    def __init__(self, idle_seconds, max_idle, region_cache_bytes):
+        self.idle_seconds = idle_seconds
+        self.max_idle = max_idle
+        self.regions = RegionCache(region_cache_bytes)
+        self._slides = {}  # key -> {"slide", "refs", "last_used"}
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        real = os.path.realpath(path)
+        key = (real, os.stat(real).st_mtime_ns)
+        with self._lock:
+            entry = self._slides.get(key)
+            if entry is not None:
+                entry["refs"] += 1
+            to_close = self._collect_idle()
+        self._close(to_close)
+        if entry is not None:
+            return SlideHandle(self, key, entry["slide"])
+
+        # open outside the lock; a racing acquire of the same key keeps the first handle
+        slide = SmartSlide(path)
+        with self._lock:
+            entry = self._slides.get(key)
+            if entry is None:
+                entry = {"slide": slide, "refs": 0, "last_used": time.monotonic()}
+                self._slides[key] = entry
+                slide = None
+            entry["refs"] += 1
+            shared = entry["slide"]
+        if slide is not None:
+            slide.close()
+        return SlideHandle(self, key, shared)
+
+    def release(self, key):
+        with self._lock:
+            entry = self._slides.get(key)
+            if entry is None:
+                return
+            entry["refs"] -= 1
+            entry["last_used"] = time.monotonic()
+            to_close = self._collect_idle()
+        self._close(to_close)
+
+    def _collect_idle(self):
+        now = time.monotonic()
+        idle = sorted(
+            (e["last_used"], k) for k, e in self._slides.items() if e["refs"] <= 0
+        )
+        expired = [k for t, k in idle if now - t >= self.idle_seconds]
+        overflow = [k for _, k in idle[:max(0, len(idle) - self.max_idle)]]
+        return [(k, self._slides.pop(k)["slide"]) for k in dict.fromkeys(expired + overflow)]
+
+    def _close(self, entries):
+        for key, slide in entries:
+            self.regions.drop_slide(key)
+            try:
+                slide.close()
+            except Exception as e:
+                print(f"[SlidePool] Close failed for {key[0]}: {e}")
+
+    def sweep(self):
+        with self._lock:
+            to_close = self._collect_idle()
+        self._close(to_close)
+
+    def close_all(self):
+        with self._lock:
+            to_close = [(k, e["slide"]) for k, e in self._slides.items()]
+            self._slides.clear()
+        self._close(to_close)
+
+    def stats(self):
+        with self._lock:
+            open_slides = len(self._slides)
+            in_use = sum(1 for e in self._slides.values() if e["refs"] > 0)
+        return {"open": open_slides, "in_use": in_use, "regions": self.regions.stats()}
+
+
+slide_pool = SlidePool(
+    config.SLIDE_POOL_IDLE_SECONDS,
+    config.SLIDE_POOL_MAX_IDLE,
+    config.SLIDE_REGION_CACHE_BYTES,
+)
+
+
+def open_slide(path):
+    """
+    Borrow a shared handle for path; close() (or a with-block) gives it back.
+    """
+    return slide_pool.acquire(path)
@@ -0,0 +1,142 @@
+# app/image_tasks/tile_pipeline.py
+
+"""
+    Staged tile pipeline: read -> infer -> write.
+
+    read  : `read_workers` threads decode upcoming batches ahead of inference (prefetch)
+    infer : `infer_concurrency` batches in flight on the worker process pool
+    write : one thread serialises results in completion order
+
+    Stages are connected by bounded queues (`prefetch` batches each), so a slow stage
+    blocks the ones before it instead of letting decoded tiles pile up in memory.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    concurrency: int
+    busy_s: float = 0.0
+    items: int = 0
+
+    @property
+    def load(self) -> float:
+        # busy seconds per worker: the stage with the highest load bounds throughput
+        return self.busy_s / max(self.concurrency, 1)
+
+
+def format_stats(stats: Dict[str, StageStats]) -> str:
+    bottleneck = max(stats.values(), key=lambda s: s.load)
+    parts = [
+        f"{s.name} {s.busy_s:.1f}s/{s.concurrency}w ({s.items} batches)"
+        for s in stats.values()
+    ]
+    return ", ".join(parts) + f" -> bottleneck: {bottleneck.name}"
+
+
+async def run_tile_pipeline(
+    batches: List[Any],
+    *,
+    read_batch: Callable[[Any], Any],
+    infer_batch: Callable[[Any, Any], Awaitable[Any]],
+    write_batch: Callable[[Any, Any], None],
+    on_batch_done: Callable[[Any, Optional[BaseException]], None],
+    read_workers: int = 2,
+    infer_concurrency: int = 1,
+    prefetch: int = 4,
+) -> Dict[str, StageStats]:
+    """
+    Push every batch through the three stages.
+
+    read_batch(batch) runs in a thread, infer_batch(batch, data) is awaited,
+    write_batch(batch, result) runs in a thread, and on_batch_done(batch, error)
+    runs on the event loop once per batch (error is None on success).
+    A failing batch is reported and skipped; it does not stop the pipeline.
+    """
+    stats = {
+        "read": StageStats("read", read_workers),
+        "infer": StageStats("infer", infer_concurrency),
+        "write": StageStats("write", 1),
+    }
+
+    todo: asyncio.Queue = asyncio.Queue()
+    for batch in batches:
+        todo.put_nowait(batch)
+
+    read_q: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+    write_q: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+
+    async def reader() -> None:
+        while not todo.empty():
+            batch = todo.get_nowait()
+            t0 = time.monotonic()
+            try:
+                data, error = await asyncio.to_thread(read_batch, batch), None
+            except Exception as e:
+                data, error = None, e
+            stats["read"].busy_s += time.monotonic() - t0
+            stats["read"].items += 1
+            await read_q.put((batch, data, error))
+
+    async def inferrer() -> None:
+        while True:
+            item = await read_q.get()
+            if item is _DONE:
+                return
+            batch, data, error = item
+            if error is None:
+                t0 = time.monotonic()
+                try:
+                    data = await infer_batch(batch, data)
+                except Exception as e:
+                    error = e
+                stats["infer"].busy_s += time.monotonic() - t0
+                stats["infer"].items += 1
+            await write_q.put((batch, data, error))
+
+    async def writer() -> None:
+        while True:
+            item = await write_q.get()
+            if item is _DONE:
+                return
+            batch, result, error = item
+            if error is None:
+                t0 = time.monotonic()
+                try:
+                    await asyncio.to_thread(write_batch, batch, result)
+                except Exception as e:
+                    error = e
+                stats["write"].busy_s += time.monotonic() - t0
+                stats["write"].items += 1
+            on_batch_done(batch, error)
+
+    readers = [asyncio.ensure_future(reader()) for _ in range(read_workers)]
+    inferrers = [asyncio.ensure_future(inferrer()) for _ in range(infer_concurrency)]
+    write_task = asyncio.ensure_future(writer())
+    tasks = readers + inferrers + [write_task]
+
+    async def drain() -> None:
+        await asyncio.gather(*readers)
+        for _ in inferrers:
+            await read_q.put(_DONE)
+        await asyncio.gather(*inferrers)
+        await write_q.put(_DONE)
+
+    try:
+        # an error in on_batch_done ends the writer; surface it instead of blocking upstream
+        await asyncio.gather(drain(), write_task)
+    finally:
+        # cancelled job: stop every stage (a batch already running in a worker just finishes)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return stats
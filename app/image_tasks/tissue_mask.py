@@ -1,11 +1,23 @@
 import os
 from PIL import Image
 import asyncio
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..models import Job
-from .utils import SmartSlide
+from ..progress import progress_tracker
+from .utils import save_image_atomic
+from .slide_pool import open_slide
 
-async def run_tissue_mask_job(db: Session, job: Job) -> None:
+TISSUE_THRESHOLD = 220
+
+def threshold_tissue(img: Image.Image) -> Image.Image:
+    """
+    灰度 -> 阈值: 组织通常比背景暗 (背景是白的255)
+    小于 TISSUE_THRESHOLD 的认为是组织 (255)，否则是背景 (0)
+    """
+    gray = img.convert("L")
+    return gray.point(lambda p: 255 if p < TISSUE_THRESHOLD else 0)
+
+async def run_tissue_mask_job(db: AsyncSession, job: Job) -> None:
     """
     真实的 Tissue Mask 生成：
     1. 读取 WSI 的缩略图 (Level 2 或 3)
@@ -17,41 +29,31 @@ async def run_tissue_mask_job(db: Session, job: Job) -> None:
         return
 
     # 更新状态
-    job.total_tiles = 1
-    job.processed_tiles = 0
-    job.progress = 0.1
-    db.commit()
+    progress_tracker.report(job.id, 0.1, processed_tiles=0, total_tiles=1)
 
     try:
-        # 1. 使用智能加载器
-        slide = SmartSlide(job.input_path)
-        
+        # 1. 使用智能加载器 (同一张切片的句柄和缩略图在各任务间共享)
         # 2. 获取合适大小的图用于做 Mask (限制在 2048px 以内，处理速度快)
         # 对于 SVS，这会利用金字塔结构快速读取，不需要读全图
-        img = slide.get_thumbnail((2048, 2048))
+        # 首次打开超大普通图会构建金字塔缓存，放到线程里做
+        with await asyncio.to_thread(open_slide, job.input_path) as slide:
+            img = await asyncio.to_thread(slide.get_thumbnail, (2048, 2048))
         
         # 模拟处理耗时 (给前端一点反应时间)
         await asyncio.sleep(1.0)
         
         # 3. 图像处理 (灰度 -> 阈值)
-        gray = img.convert("L")
-        # 简单阈值: 组织通常比背景暗 (背景是白的255)
-        # 小于 220 的认为是组织 (255)，否则是背景 (0)
-        mask = gray.point(lambda p: 255 if p < 220 else 0)
+        mask = threshold_tissue(img)
 
         # 4. 保存
         out_dir = os.path.dirname(job.output_path)
         if out_dir: os.makedirs(out_dir, exist_ok=True)
         
-        mask.save(job.output_path)
+        save_image_atomic(mask, job.output_path)
         print(f"[TissueMask] Generated mask: {job.output_path}")
-        
-        slide.close()
 
         # 完成
-        job.processed_tiles = 1
-        job.progress = 1.0
-        db.commit()
+        progress_tracker.report(job.id, 1.0, processed_tiles=1, total_tiles=1)
 
     except Exception as e:
         print(f"[TissueMask] Failed: {e}")
@@ -1,6 +1,11 @@
+import os
+import threading
 import openslide
 from PIL import Image
 
+from .. import config
+from .flat_pyramid import FlatPyramid
+
 class SmartSlide:
     """
     智能滑片读取器：
@@ -9,6 +14,8 @@ class SmartSlide:
     def __init__(self, path):
         self.path = path
         self.mode = 'unknown'
+        # OpenSlide 句柄线程安全；PIL 的懒加载/crop 不是，读 tile 的线程需要串行
+        self._lock = threading.Lock()
         try:
             # 1. 优先尝试作为病理切片打开 (OpenSlide)
             self._slide = openslide.OpenSlide(path)
@@ -22,6 +29,13 @@ class SmartSlide:
             self._slide = Image.open(path)
             self.mode = 'pil'
             self.dimensions = self._slide.size
+            # 3. 超大普通图：转成磁盘上的 memmap 金字塔，之后按需读取，内存占用基本恒定
+            w, h = self.dimensions
+            if w * h >= config.FLAT_TILED_MIN_PIXELS:
+                img = self._slide
+                self._slide = FlatPyramid.open(path, img)
+                img.close()
+                self.mode = 'tiled'
 
     def read_region(self, location, level, size):
         """
@@ -30,27 +44,40 @@ class SmartSlide:
         level: 金字塔层级 (PIL 模式下忽略)
         size: (w, h) 读取尺寸
         """
-        if self.mode == 'wsi':
+        if self.mode in ('wsi', 'tiled'):
             return self._slide.read_region(location, level, size)
         else:
             # PIL 的 crop 区域: (left, top, right, bottom)
             x, y = location
             w, h = size
             # 注意：PIL 的 crop 是 lazy 的，这里强转一下防止后续资源占用
-            return self._slide.crop((x, y, x+w, y+h)).convert("RGBA")
+            with self._lock:
+                return self._slide.crop((x, y, x+w, y+h)).convert("RGBA")
     
     def get_thumbnail(self, size):
         """
         获取缩略图 (保持比例)
         size: (max_w, max_h)
         """
-        if self.mode == 'wsi':
+        if self.mode in ('wsi', 'tiled'):
             return self._slide.get_thumbnail(size)
         else:
-            img = self._slide.copy()
+            with self._lock:
+                img = self._slide.copy()
             img.thumbnail(size)
             return img
 
     def close(self):
         if hasattr(self._slide, 'close'):
-            self._slide.close()
\ No newline at end of file
+            self._slide.close()
+
+
+def save_image_atomic(img, path):
+    """
+    先写临时文件再 rename：读者不会看到写了一半的图，
+    已存在的文件 (可能与结果缓存硬链接) 也不会被原地截断。
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    img.save(tmp_path)
+    os.replace(tmp_path, path)
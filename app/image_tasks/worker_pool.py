@@ -0,0 +1,74 @@
+# app/image_tasks/worker_pool.py
+
+"""
+    Process pool for CPU-bound image work (tile inference, polygon extraction).
+    Keeps heavy compute off the asyncio event loop that serves the API and the scheduler.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from .. import config
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _init_worker(num_threads: int) -> None:
+    # split the cores between pool processes; must run before torch is imported
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+
+
+def pool_size() -> int:
+    return config.IMAGE_WORKER_PROCESSES
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        size = pool_size()
+        num_threads = max(1, (os.cpu_count() or 1) // size)
+        # spawn: forking a process that already holds torch / an event loop is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=size,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(num_threads,),
+        )
+        print(f"[WorkerPool] Started {size} processes x {num_threads} threads")
+    return _executor
+
+
+async def run_in_pool(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Run a picklable top-level function in the pool and await its result.
+    If a worker died (OOM kill, segfault) the pool is broken for good: it is
+    discarded so the next call starts a fresh one, and the error propagates.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, fn, *args)
+    except BrokenProcessPool:
+        _discard(executor)
+        raise
+
+
+def _discard(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    if _executor is executor:
+        _executor = None
+        print("[WorkerPool] A worker process died, pool will be restarted")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -2,19 +2,24 @@
 
 from __future__ import annotations
 
-from sqlalchemy.orm import Session
+import os
+from typing import List
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .models import Job, JobStatus, JobType
 from .image_tasks import tissue_mask, instanseg_seg, preview_downsample
 
 
-async def execute_job(db: Session, job: Job) -> None:
-    
+async def execute_job(db: AsyncSession, job: Job, run_shards=None) -> None:
+    """
+    run_shards: optional scheduler hook for job types that can fan out over worker slots.
+    """
     if job.type == JobType.TISSUE_MASK:
         await tissue_mask.run_tissue_mask_job(db, job)
 
     elif job.type == JobType.INSTANTSEG_CELL_SEG:
-        await instanseg_seg.run_instanseg_job(db, job)
+        await instanseg_seg.run_instanseg_job(db, job, run_shards=run_shards)
 
     elif job.type == JobType.PREVIEW_DOWNSAMPLE:
         await preview_downsample.run_preview_job(db, job)
@@ -22,6 +27,28 @@ async def execute_job(db: Session, job: Job) -> None:
     else:
         print(f"[jobs] Unknown job type {job.type}, mark FAILED")
         job.status = JobStatus.FAILED
-        db.commit()
+        await db.commit()
         
         raise RuntimeError(f"Unknown job type {job.type}")
+
+
+def job_artifacts(job: Job) -> List[str]:
+    """
+    Files a finished job leaves behind: its output plus per-type side outputs.
+    """
+    paths = [job.output_path]
+    if job.type == JobType.INSTANTSEG_CELL_SEG:
+        paths.append(os.path.splitext(job.output_path)[0] + "_overlay.png")
+    return paths
+
+
+def artifacts_complete(job: Job) -> bool:
+    """
+    Whether the job's artifacts are a finished result worth caching: all present, and no
+    unfinished cell stream (.part / .ckpt are only left behind when tiles failed).
+    """
+    if not all(os.path.isfile(p) for p in job_artifacts(job)):
+        return False
+    if job.type == JobType.INSTANTSEG_CELL_SEG:
+        return not any(os.path.exists(job.output_path + ext) for ext in (".part", ".ckpt"))
+    return True
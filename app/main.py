@@ -8,10 +8,14 @@ from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 
-from .db import Base, engine, SessionLocal
+from .db import create_tables, engine
 from .models import Job, Branch, Workflow
 from .scheduler import Scheduler
 from .routers import status, workflows
+from .image_tasks import worker_pool
+from .image_tasks.slide_pool import slide_pool
+from .progress import progress_tracker
+from .change_feed import change_feed
 from . import config
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -31,8 +35,6 @@ static_dir = BASE_DIR / "static"
 if static_dir.exists():
     app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
-Base.metadata.create_all(bind=engine)
-
 scheduler = Scheduler(
     max_workers=config.MAX_WORKERS,
     max_active_users=config.MAX_ACTIVE_USERS,
@@ -44,23 +46,24 @@ app.state.scheduler = scheduler
 @app.on_event("startup")
 async def startup_event():
     
-    db = SessionLocal()
-    try:
-        
-        db.query(Job).delete()
-        db.query(Branch).delete()
-        db.query(Workflow).delete()
-        db.commit()
-        print("[Startup] DB data cleared.")
-    finally:
-        db.close()
+    await create_tables()
+
+    # keep the queue across restarts: re-queue orphaned jobs and rebuild scheduler state
+    await scheduler.recover()
 
     print(f"[Startup] Scheduler started. Max Workers={config.MAX_WORKERS}, Max Users={config.MAX_ACTIVE_USERS}")
     asyncio.create_task(scheduler.start())
+    progress_tracker.start()
+    change_feed.start()
 
 @app.on_event("shutdown")
 async def shutdown_event() -> None:
     await scheduler.stop()
+    await change_feed.stop()
+    await progress_tracker.stop()
+    worker_pool.shutdown()
+    slide_pool.close_all()
+    await engine.dispose()
 
 
 @app.get("/dashboard", response_class=HTMLResponse)
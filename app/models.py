@@ -18,6 +18,10 @@ from sqlalchemy import (
     Float,
     Enum,
     ForeignKey,
+    Index,
+    JSON,
+    UniqueConstraint,
+    text,
 )
 from sqlalchemy.orm import relationship
 
@@ -47,6 +51,7 @@ class Workflow(Base):
     id = Column(String, primary_key=True, index=True) # primary key
     user_id = Column(String, index=True) 
     name = Column(String) 
+    weight = Column(Float, default=1.0) # fair-share priority among the owner's workflows
     created_at = Column(DateTime, default=datetime.utcnow)
 
     branches = relationship("Branch", back_populates="workflow") # One-to-many with Branch
@@ -63,6 +68,11 @@ class Branch(Base):
     workflow = relationship("Workflow", back_populates="branches")
     jobs = relationship("Job", back_populates="branch", order_by="Job.order_index")
 
+    __table_args__ = (
+        # one branch per name: concurrent job submissions to a new branch name share it
+        UniqueConstraint("workflow_id", "name", name="uq_branches_workflow_name"),
+    )
+
 
 # Job data table
 class Job(Base):
@@ -78,6 +88,7 @@ class Job(Base):
 
     input_path = Column(String)
     output_path = Column(String)
+    params = Column(JSON, nullable=True) # per-job task options, e.g. {"batch_size": 8}
 
     status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
     progress = Column(Float, default=0.0)
@@ -93,4 +104,32 @@ class Job(Base):
     started_at = Column(DateTime, nullable=True)
     finished_at = Column(DateTime, nullable=True)
 
+    # replica holding the job while RUNNING; it renews the lease, an expired one is re-queued
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
     branch = relationship("Branch", back_populates="jobs")
+
+    __table_args__ = (
+        # predecessor lookup: (branch_id, order_index - 1); unique, so concurrent appends cannot share a position
+        Index("ix_jobs_branch_order", "branch_id", "order_index", unique=True),
+        # runnable frontier scan: PENDING jobs of active users, FIFO
+        Index("ix_jobs_status_user_created", "status", "user_id", "created_at"),
+        # branch serialization across replicas: at most one RUNNING job per branch
+        Index(
+            "ux_jobs_branch_running", "branch_id", unique=True,
+            postgresql_where=text("status = 'RUNNING'"),
+            sqlite_where=text("status = 'RUNNING'"),
+        ),
+        # lease reaper: RUNNING jobs by expiry
+        Index("ix_jobs_status_lease", "status", "lease_expires_at"),
+    )
+
+
+# Active user slots (MAX_ACTIVE_USERS rows), shared by all scheduler replicas
+class UserSlot(Base):
+    __tablename__ = "user_slots" # table name
+
+    slot = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(String, unique=True, nullable=True) # NULL = free; one slot per user
+    admitted_at = Column(DateTime, nullable=True)
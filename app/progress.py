@@ -0,0 +1,143 @@
+# app/progress.py
+
+"""
+    Buffered progress tracking.
+
+    Running tasks report progress here instead of committing it themselves. The
+    tracker keeps the latest values in memory, serves them to status reads, and
+    writes whatever changed since the last flush in one batched UPDATE every
+    PROGRESS_FLUSH_INTERVAL seconds. When a job settles, the scheduler copies the
+    final values onto the job row as part of its own status commit.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Dict, Optional
+
+from sqlalchemy import Integer, bindparam, func, update
+
+from .db import SessionLocal
+from .models import Job, JobStatus
+from .events import event_bus
+from . import config
+
+
+class ProgressTracker:
+    def __init__(self, flush_interval: float) -> None:
+        self.flush_interval = flush_interval
+        self._state: Dict[str, dict] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    def report(
+        self,
+        job_id: str,
+        progress: float,
+        *,
+        processed_tiles: Optional[int] = None,
+        total_tiles: Optional[int] = None,
+    ) -> None:
+        """
+        Record the latest progress of a running job. Cheap: no DB access.
+        """
+        with self._lock:
+            state = self._state.setdefault(job_id, {})
+            state["progress"] = progress
+            if processed_tiles is not None:
+                state["processed_tiles"] = processed_tiles
+            if total_tiles is not None:
+                state["total_tiles"] = total_tiles
+            self._dirty.add(job_id)
+        event_bus.progress(job_id, progress, processed_tiles, total_tiles)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            state = self._state.get(job_id)
+            return dict(state) if state else None
+
+    def settle(self, job: Job) -> None:
+        """
+        Job is leaving RUNNING: copy its last reported values onto the row (the caller
+        commits) and stop tracking it.
+        """
+        with self._lock:
+            state = self._state.pop(job.id, None)
+            self._dirty.discard(job.id)
+        if not state:
+            return
+        job.progress = state["progress"]
+        if "processed_tiles" in state:
+            job.processed_tiles = state["processed_tiles"]
+        if "total_tiles" in state:
+            job.total_tiles = state["total_tiles"]
+
+    def forget(self, job_id: str) -> None:
+        with self._lock:
+            self._state.pop(job_id, None)
+            self._dirty.discard(job_id)
+
+    async def flush(self) -> int:
+        """
+        Write all changed progress in one executemany UPDATE. Rows that already left
+        RUNNING are skipped, so a late flush cannot overwrite a final state.
+        """
+        with self._lock:
+            rows = [
+                {
+                    "_id": job_id,
+                    "_progress": self._state[job_id]["progress"],
+                    "_processed": self._state[job_id].get("processed_tiles"),
+                    "_total": self._state[job_id].get("total_tiles"),
+                }
+                for job_id in self._dirty
+                if job_id in self._state
+            ]
+            self._dirty.clear()
+        if not rows:
+            return 0
+
+        # unknown tile counts (None) keep the stored value
+        stmt = (
+            update(Job)
+            .where(Job.id == bindparam("_id"), Job.status == JobStatus.RUNNING)
+            .values(
+                progress=bindparam("_progress"),
+                processed_tiles=func.coalesce(bindparam("_processed", type_=Integer), Job.processed_tiles),
+                total_tiles=func.coalesce(bindparam("_total", type_=Integer), Job.total_tiles),
+            )
+        )
+        try:
+            async with SessionLocal() as db:
+                # Core executemany: session.execute() would treat a list as an ORM bulk update by PK
+                await (await db.connection()).execute(stmt, rows)
+                await db.commit()
+        except Exception:
+            # keep them for the next flush
+            with self._lock:
+                self._dirty.update(r["_id"] for r in rows)
+            raise
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[Progress] Flush failed: {e}")
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+
+progress_tracker = ProgressTracker(config.PROGRESS_FLUSH_INTERVAL)
@@ -0,0 +1,97 @@
+# app/quotas.py
+
+"""
+    Concurrency quotas for the dispatcher.
+
+    RunningIndex keeps counters of what currently holds a worker slot (per user,
+    per workflow, per job type) and which branch is running, updated when a slot is
+    taken or released. Every dispatch check is a dict lookup, however many jobs are
+    running or queued.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from .models import JobType
+from . import config
+
+
+class RunningIndex:
+    def __init__(self) -> None:
+        self.by_user: Counter = Counter()
+        self.by_workflow: Counter = Counter()
+        self.by_type: Counter = Counter()
+        self._branch_owner: Dict[str, str] = {}
+        # slot key -> (user_id, workflow_id, job_type, branch_id or None)
+        self._entries: Dict[str, Tuple[str, str, JobType, Optional[str]]] = {}
+
+    def add(self, key: str, *, user_id: str, workflow_id: str, job_type: JobType, branch_id: Optional[str] = None) -> None:
+        """
+        Register a slot. Pass branch_id for jobs; shards leave it out, their parent holds the branch.
+        """
+        self.remove(key)
+        self._entries[key] = (user_id, workflow_id, job_type, branch_id)
+        self.by_user[user_id] += 1
+        self.by_workflow[workflow_id] += 1
+        self.by_type[job_type] += 1
+        if branch_id is not None:
+            self._branch_owner[branch_id] = key
+
+    def remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id, workflow_id, job_type, branch_id = entry
+        for counter, k in ((self.by_user, user_id), (self.by_workflow, workflow_id), (self.by_type, job_type)):
+            counter[k] -= 1
+            if counter[k] <= 0:
+                del counter[k]
+        if branch_id is not None and self._branch_owner.get(branch_id) == key:
+            del self._branch_owner[branch_id]
+
+    def branch_running(self, branch_id: str) -> bool:
+        return branch_id in self._branch_owner
+
+    def clear(self) -> None:
+        self.by_user.clear()
+        self.by_workflow.clear()
+        self.by_type.clear()
+        self._branch_owner.clear()
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "slots": len(self._entries),
+            "by_user": dict(self.by_user),
+            "by_workflow": dict(self.by_workflow),
+            "by_type": {t.value: n for t, n in self.by_type.items()},
+            "branches": len(self._branch_owner),
+        }
+
+
+def user_limit(user_id: str) -> Optional[int]:
+    return config.USER_MAX_CONCURRENCY.get(user_id, config.DEFAULT_USER_MAX_CONCURRENCY)
+
+
+def workflow_limit(workflow_id: str) -> Optional[int]:
+    return config.WORKFLOW_MAX_CONCURRENCY.get(workflow_id, config.DEFAULT_WORKFLOW_MAX_CONCURRENCY)
+
+
+def type_limit(job_type: JobType) -> Optional[int]:
+    return config.JOB_TYPE_MAX_CONCURRENCY.get(job_type.value)
+
+
+def quota_allows(index: RunningIndex, user_id: str, workflow_id: str, job_type: JobType) -> bool:
+    """
+    Whether one more slot for this user / workflow / type stays within its limits (None = unlimited).
+    """
+    for limit, running in (
+        (user_limit(user_id), index.by_user[user_id]),
+        (workflow_limit(workflow_id), index.by_workflow[workflow_id]),
+        (type_limit(job_type), index.by_type[job_type]),
+    ):
+        if limit is not None and running >= limit:
+            return False
+    return True
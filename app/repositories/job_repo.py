@@ -1,76 +1,255 @@
 # app/repositories/job_repo.py
 
 from __future__ import annotations
-from typing import List, Optional, Set
-from sqlalchemy import asc, desc
-from sqlalchemy.orm import Session
-from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import exists, func, insert, select, update
+from sqlalchemy import asc, desc, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime, timedelta
 
-from app.models import Job, JobStatus, Branch, JobType, Workflow
+from app.models import Job, JobStatus, Branch, JobType, Workflow, UserSlot
 
+# attempts at appending to a branch while concurrent appends keep taking the tail position
+JOB_APPEND_RETRIES = 10
 
-def get_job_by_id(db: Session, job_id: str) -> Optional[Job]:
-    return db.query(Job).filter(Job.id == job_id).first()
 
+async def get_job_by_id(db: AsyncSession, job_id: str) -> Optional[Job]:
+    return await db.get(Job, job_id)
 
-def get_users_with_incomplete_jobs(db: Session) -> Set[str]:
+
+async def get_users_with_incomplete_jobs(db: AsyncSession) -> Set[str]:
     """
     help to check which users have incomplete jobs (PENDING or RUNNING)
     determine active users occupying slots
     """
-    results = (
-        db.query(Job.user_id)
-        .filter(Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING]))
+    results = await db.execute(
+        select(Job.user_id)
+        .where(Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING]))
         .distinct()
-        .all()
     )
     return {r[0] for r in results}
 
 
 
-def auto_cancel_blocked_jobs(db: Session) -> int:
+async def get_user_queue_heads(db: AsyncSession) -> Dict[str, datetime]:
     """
-    Fail-fast rule:
-        Scan all PENDING state jobs. If we find that its predecessor job in the same branch is FAILED or CANCELLED, 
-        then mark the current job as CANCELLED as well.
-    
-    
-    return the number of jobs that were auto-cancelled
+    Users with incomplete jobs (PENDING or RUNNING), mapped to the created_at of their
+    oldest one: how long each user has been waiting, for admission ordering.
     """
-    # 1. fetch all PENDING jobs
-    pending_jobs = db.query(Job).filter(Job.status == JobStatus.PENDING).all()
-    canceled_count = 0
+    results = await db.execute(
+        select(Job.user_id, func.min(Job.created_at))
+        .where(Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING]))
+        .group_by(Job.user_id)
+    )
+    return {user_id: created_at for user_id, created_at in results}
 
-    for job in pending_jobs:
-        # if current PENDING state job is the first job in the branch, skip
-        if job.order_index == 0:
-            continue
 
-        # 2. find predecessor job
-        prev_job = (
-            db.query(Job)
-            .filter(
-                Job.branch_id == job.branch_id,
-                Job.order_index == job.order_index - 1
-            )
-            .first()
+async def get_usage_since(db: AsyncSession, since: datetime) -> List[Tuple[str, str, datetime, datetime]]:
+    """
+    (user_id, workflow_id, started_at, finished_at) of jobs that ran and finished after `since`,
+    to seed the fair-share usage ledger on startup.
+    """
+    results = await db.execute(
+        select(Job.user_id, Job.workflow_id, Job.started_at, Job.finished_at)
+        .where(
+            Job.finished_at >= since,
+            Job.started_at.isnot(None),
+            Job.status.in_([JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED]),
         )
+    )
+    return [tuple(r) for r in results]
 
-        # 3. cascade cancel
-        if prev_job and prev_job.status in [JobStatus.FAILED, JobStatus.CANCELLED]:
-            print(f"[AutoCancel] Job {job.id} cancelled because prev job {prev_job.id} is {prev_job.status}")
-            job.status = JobStatus.CANCELLED
-            job.finished_at = datetime.utcnow()
-            canceled_count += 1
-    
-    if canceled_count > 0:
-        db.commit()
-    
-    return canceled_count
 
+async def requeue_orphaned_jobs(db: AsyncSession, *, owner: Optional[str] = None) -> List[Job]:
+    """
+    Crash recovery:
+        A RUNNING job whose lease has expired (or that never had one) lost the
+        replica running it. Put it back to PENDING so any scheduler dispatches it
+        again (segmentation resumes from its tile checkpoint).
+        `owner`: also re-queue this replica's own leases, left by its previous run.
+
+        Rows are locked with SKIP LOCKED, so replicas sweeping at the same time
+        never requeue the same job twice, and a row whose owner is renewing or
+        settling it right now is left alone.
+
+
+    return the re-queued jobs (for status events)
+    """
+    orphaned = or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < datetime.utcnow())
+    if owner is not None:
+        orphaned = or_(orphaned, Job.lease_owner == owner)
+
+    jobs = list((await db.scalars(
+        select(Job)
+        .where(Job.status == JobStatus.RUNNING, orphaned)
+        .with_for_update(skip_locked=True)
+    )).all())
+    for job in jobs:
+        job.status = JobStatus.PENDING
+        job.started_at = None
+        job.lease_owner = None
+        job.lease_expires_at = None
+    await db.commit()
+
+    if jobs:
+        print(f"[Recovery] {len(jobs)} orphaned RUNNING job(s) re-queued")
+    return jobs
+
+
+async def claim_job(db: AsyncSession, job: Job, *, owner: str, lease_seconds: float) -> bool:
+    """
+    Atomically move a PENDING job to RUNNING under a lease held by `owner`.
+
+    The row is taken with FOR UPDATE SKIP LOCKED, so replicas racing for the same
+    job never block on each other and exactly one wins. The claim also fails when
+    the owner's user holds no active slot, or when another job of the branch is
+    RUNNING (unique index ux_jobs_branch_running).
+
+    return whether this call claimed the job; on success `job` reflects the claim
+    """
+    now = datetime.utcnow()
+    expires = now + timedelta(seconds=lease_seconds)
+    locked = (
+        select(Job.id)
+        .where(
+            Job.id == job.id,
+            Job.status == JobStatus.PENDING,
+            exists().where(UserSlot.user_id == Job.user_id),
+        )
+        .with_for_update(skip_locked=True, of=Job)
+        .scalar_subquery()
+    )
+    try:
+        claimed = (await db.execute(
+            update(Job)
+            .where(Job.id == locked, Job.status == JobStatus.PENDING)
+            .values(status=JobStatus.RUNNING, started_at=now, lease_owner=owner, lease_expires_at=expires)
+            .returning(Job.id)
+            .execution_options(synchronize_session=False)
+        )).scalar_one_or_none()
+        await db.commit()
+    except IntegrityError:
+        # the branch already has a RUNNING job
+        await db.rollback()
+        return False
+    if claimed is None:
+        return False
+
+    for key, value in (("status", JobStatus.RUNNING), ("started_at", now), ("lease_owner", owner), ("lease_expires_at", expires)):
+        set_committed_value(job, key, value)
+    return True
+
+
+async def complete_pending_job(db: AsyncSession, job: Job) -> bool:
+    """
+    PENDING -> SUCCEEDED without running it (result served from cache), unless
+    another replica claimed it first. On success `job` reflects the new state.
+    """
+    now = datetime.utcnow()
+    done = (await db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == JobStatus.PENDING)
+        .values(status=JobStatus.SUCCEEDED, started_at=now, finished_at=now, progress=1.0)
+        .execution_options(synchronize_session=False)
+    )).rowcount == 1
+    await db.commit()
+    if done:
+        for key, value in (("status", JobStatus.SUCCEEDED), ("started_at", now), ("finished_at", now), ("progress", 1.0)):
+            set_committed_value(job, key, value)
+    return done
+
+
+async def renew_leases(db: AsyncSession, *, owner: str, job_ids: List[str], lease_seconds: float) -> Set[str]:
+    """
+    Heartbeat: extend the leases `owner` still holds on these RUNNING jobs.
+
+    return the ids renewed; the others were cancelled, finished or lost their lease
+    """
+    if not job_ids:
+        return set()
+    renewed = await db.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.lease_owner == owner, Job.status == JobStatus.RUNNING)
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = {r[0] for r in renewed}
+    await db.commit()
+    return ids
+
+
+async def get_lease_states(db: AsyncSession, job_ids: List[str]) -> Dict[str, Tuple[JobStatus, Optional[str]]]:
+    """
+    job_id -> (status, lease_owner)
+    """
+    if not job_ids:
+        return {}
+    rows = await db.execute(select(Job.id, Job.status, Job.lease_owner).where(Job.id.in_(job_ids)))
+    return {job_id: (status, owner) for job_id, status, owner in rows}
 
 
-def get_runnable_jobs(db: Session, allowed_user_ids: Set[str]) -> List[Job]:
+async def lock_branches(db: AsyncSession, branch_ids: Set[str]) -> None:
+    """
+    Take the branch rows for the rest of the transaction. Appending to a branch and
+    the fail-fast cascade both start with this, so they never interleave: either the
+    append sees the FAILED / CANCELLED tail and inserts its jobs CANCELLED, or the
+    cascade runs after the append committed and cancels them.
+
+    PostgreSQL: FOR UPDATE in id order (no deadlock between two multi-branch appends).
+    SQLite has no row locks, but any write takes the database write lock until commit.
+    """
+    if not branch_ids:
+        return
+    if db.bind.dialect.name == "sqlite":
+        await db.execute(
+            update(Branch)
+            .where(Branch.id.in_(branch_ids))
+            .values(name=Branch.name)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        await db.execute(
+            select(Branch.id).where(Branch.id.in_(branch_ids)).order_by(Branch.id).with_for_update()
+        )
+
+
+async def cancel_branch_successors(db: AsyncSession, branch_id: str, order_index: int) -> List[str]:
+    """
+    Fail-fast rule:
+        When a job FAILS or is CANCELLED, every later PENDING job in the same branch
+        can never run, so cancel them all with one bulk UPDATE.
+        Called from the failure / cancel event itself, not from the scheduling loop.
+        The branch is locked first, so a job appended concurrently is either seen
+        here or inserted CANCELLED (see lock_branches).
+
+
+    return the ids of the jobs that were auto-cancelled (for status events)
+    """
+    await lock_branches(db, {branch_id})
+    successors = await db.execute(select(Job.id).where(
+        Job.branch_id == branch_id,
+        Job.order_index > order_index,
+        Job.status == JobStatus.PENDING,
+    ))
+    canceled_ids = [r[0] for r in successors]
+    if canceled_ids:
+        await db.execute(
+            update(Job)
+            .where(Job.id.in_(canceled_ids), Job.status == JobStatus.PENDING)
+            .values(status=JobStatus.CANCELLED, finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        print(f"[AutoCancel] {len(canceled_ids)} job(s) cancelled in branch {branch_id} after order {order_index}")
+    await db.commit()
+
+    return canceled_ids
+
+
+async def get_runnable_jobs(db: AsyncSession, allowed_user_ids: Set[str]) -> List[Job]:
     """
     Find all runnable jobs
     
@@ -79,93 +258,170 @@ def get_runnable_jobs(db: Session, allowed_user_ids: Set[str]) -> List[Job]:
     2. User is in Active Slots pool
     3. Branch inner order:
        - either the 1st job in the branch (order=0) or predecessor jobs are done
-       
+
+    The frontier is computed in a single query: each PENDING job is outer-joined
+    to its predecessor on (branch_id, order_index - 1), so only branch heads come back.
+    It is not truncated: the scheduling policy orders the whole frontier, and jobs
+    served from the result cache or following a running one take no worker slot.
     """
     if not allowed_user_ids:
         return []
 
-    pending_jobs = (
-        db.query(Job)
-        .filter(
+    prev_job = aliased(Job)
+
+    query = (
+        select(Job)
+        .outerjoin(
+            prev_job,
+            and_(
+                prev_job.branch_id == Job.branch_id,
+                prev_job.order_index == Job.order_index - 1,
+            ),
+        )
+        .where(
             Job.status == JobStatus.PENDING,
-            Job.user_id.in_(allowed_user_ids)
+            Job.user_id.in_(allowed_user_ids),
+            or_(
+                Job.order_index == 0,
+                prev_job.status == JobStatus.SUCCEEDED,
+            ),
         )
-        .order_by(asc(Job.created_at)) 
-        .all()
+        .order_by(asc(Job.created_at))
     )
+    return list((await db.scalars(query)).all())
 
-    runnable = []
-    
-    
-    for job in pending_jobs:
-        if job.order_index == 0:
-            
-            runnable.append(job)
-        else:
-            
-            prev_job = (
-                db.query(Job)
-                .filter(
-                    Job.branch_id == job.branch_id,
-                    Job.order_index == job.order_index - 1
-                )
-                .first()
-            )
-            
-            if prev_job and prev_job.status == JobStatus.SUCCEEDED:
-                runnable.append(job)
-
-    return runnable
-
-
-def list_jobs_for_workflow(db: Session, workflow_id: str, user_id: str) -> List[Job]:
-    return (
-        db.query(Job)
-        .filter(Job.workflow_id == workflow_id, Job.user_id == user_id)
-        .order_by(asc(Job.branch_id), asc(Job.order_index))
-        .all()
-    )
 
-def get_or_create_branch(db: Session, workflow_id: str, branch_name: str) -> Branch:
-    branch = (
-        db.query(Branch)
-        .filter(Branch.workflow_id == workflow_id, Branch.name == branch_name)
-        .first()
+async def get_succeeded_branch_job(db: AsyncSession, *, branch_id: str, job_type: JobType, input_path: str, before_order_index: int) -> Optional[Job]:
+    """
+    Latest SUCCEEDED job of `job_type` on the same input earlier in the branch,
+    e.g. the tissue_mask step that precedes a segmentation step.
+    """
+    return await db.scalar(
+        select(Job)
+        .where(
+            Job.branch_id == branch_id,
+            Job.type == job_type,
+            Job.input_path == input_path,
+            Job.order_index < before_order_index,
+            Job.status == JobStatus.SUCCEEDED,
+        )
+        .order_by(desc(Job.order_index))
+        .limit(1)
     )
+
+
+async def list_jobs_for_workflow(db: AsyncSession, workflow_id: str, user_id: str) -> List[Job]:
+    return list((await db.scalars(
+        select(Job)
+        .where(Job.workflow_id == workflow_id, Job.user_id == user_id)
+        .order_by(asc(Job.branch_id), asc(Job.order_index))
+    )).all())
+
+async def get_or_create_branch(db: AsyncSession, workflow_id: str, branch_name: str) -> Branch:
+    """
+    Branches are unique per (workflow_id, name): if a concurrent request creates the
+    same one first, the insert fails and theirs is returned.
+    """
+    query = select(Branch).where(Branch.workflow_id == workflow_id, Branch.name == branch_name).limit(1)
+    branch = await db.scalar(query)
     if branch:
         return branch
 
     import uuid
     branch = Branch(id=str(uuid.uuid4()), workflow_id=workflow_id, name=branch_name)
     db.add(branch)
-    db.commit()
-    db.refresh(branch)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return await db.scalar(query)
     return branch
 
-def create_job(db: Session, *, workflow_id: str, branch: Branch, user_id: str, job_type: JobType, input_path: str, output_path: str) -> Job:
+async def create_job(db: AsyncSession, *, workflow_id: str, branch: Branch, user_id: str, job_type: JobType, input_path: str, output_path: str, params: Optional[dict] = None) -> Job:
+    """
+    Append a job to the branch. (branch_id, order_index) is unique: a concurrent
+    append that took the same position makes the insert fail, and it is retried
+    after the new tail. The branch is locked while the tail is read, so a job appended
+    behind a failing tail is cancelled here or by the cascade (see lock_branches).
+    """
     import uuid
-    
-    last_job = (
-        db.query(Job)
-        .filter(Job.branch_id == branch.id)
-        .order_by(desc(Job.order_index))
-        .first()
+
+    branch_id = branch.id
+    for attempt in range(JOB_APPEND_RETRIES):
+        await lock_branches(db, {branch_id})
+        tail = (await db.execute(
+            select(Job.order_index, Job.status)
+            .where(Job.branch_id == branch_id)
+            .order_by(desc(Job.order_index))
+            .limit(1)
+        )).first()
+        next_index = (tail.order_index + 1) if tail is not None else 0
+        # fail-fast: appended behind a failed / cancelled job, it can never run
+        blocked = tail is not None and tail.status in (JobStatus.FAILED, JobStatus.CANCELLED)
+
+        job = Job(
+            id=str(uuid.uuid4()),
+            workflow_id=workflow_id,
+            branch_id=branch_id,
+            user_id=user_id,
+            type=job_type,
+            input_path=input_path,
+            output_path=output_path,
+            params=params,
+            order_index=next_index,
+            status=JobStatus.CANCELLED if blocked else JobStatus.PENDING,
+            finished_at=datetime.utcnow() if blocked else None,
+            progress=0.0,
+        )
+        db.add(job)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            if attempt == JOB_APPEND_RETRIES - 1:
+                raise
+            continue
+        await db.refresh(job)
+        return job
+
+
+async def get_branches(db: AsyncSession, workflow_ids: Set[str]) -> Dict[Tuple[str, str], Branch]:
+    """
+    Existing branches of these workflows, keyed by (workflow_id, branch name).
+    """
+    if not workflow_ids:
+        return {}
+    rows = await db.scalars(select(Branch).where(Branch.workflow_id.in_(workflow_ids)))
+    return {(b.workflow_id, b.name): b for b in rows}
+
+
+async def get_branch_tails(db: AsyncSession, branch_ids: Set[str]) -> Dict[str, Tuple[int, JobStatus]]:
+    """
+    branch_id -> (highest order_index, status of that job), for appending after the
+    existing jobs (behind a FAILED / CANCELLED tail they are cancelled).
+    The branches stay locked until the caller commits (see lock_branches).
+    """
+    if not branch_ids:
+        return {}
+    await lock_branches(db, branch_ids)
+    last = (
+        select(Job.branch_id, func.max(Job.order_index).label("tail"))
+        .where(Job.branch_id.in_(branch_ids))
+        .group_by(Job.branch_id)
+        .subquery()
     )
-    next_index = (last_job.order_index + 1) if last_job else 0
-
-    job = Job(
-        id=str(uuid.uuid4()),
-        workflow_id=workflow_id,
-        branch_id=branch.id,
-        user_id=user_id,
-        type=job_type,
-        input_path=input_path,
-        output_path=output_path,
-        order_index=next_index,
-        status=JobStatus.PENDING,
-        progress=0.0,
+    rows = await db.execute(
+        select(Job.branch_id, Job.order_index, Job.status)
+        .join(last, and_(Job.branch_id == last.c.branch_id, Job.order_index == last.c.tail))
     )
-    db.add(job)
-    db.commit()
-    db.refresh(job)
-    return job
\ No newline at end of file
+    return {branch_id: (tail, status) for branch_id, tail, status in rows}
+
+
+async def bulk_insert(db: AsyncSession, *, workflows: List[dict], branches: List[dict], jobs: List[dict]) -> None:
+    """
+    Insert prepared rows with one executemany per table and a single commit.
+    """
+    for model, rows in ((Workflow, workflows), (Branch, branches), (Job, jobs)):
+        if rows:
+            await db.execute(insert(model), rows)
+    await db.commit()
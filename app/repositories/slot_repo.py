@@ -0,0 +1,87 @@
+# app/repositories/slot_repo.py
+
+from __future__ import annotations
+from typing import List, Set
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+
+from app.models import Job, JobStatus, UserSlot
+
+
+async def ensure_user_slots(db: AsyncSession, count: int) -> None:
+    """
+    Make slots 0..count-1 exist. Free slots beyond `count` are dropped;
+    occupied ones stay until their user is done (claims ignore them).
+    Safe to run from several replicas starting together.
+    """
+    existing = set((await db.scalars(select(UserSlot.slot))).all())
+    missing = [{"slot": n} for n in range(count) if n not in existing]
+    try:
+        if missing:
+            await db.execute(UserSlot.__table__.insert(), missing)
+        await db.execute(delete(UserSlot).where(UserSlot.slot >= count, UserSlot.user_id.is_(None)))
+        await db.commit()
+    except IntegrityError:
+        # another replica inserted them first
+        await db.rollback()
+
+
+async def get_admitted_users(db: AsyncSession) -> Set[str]:
+    results = await db.execute(select(UserSlot.user_id).where(UserSlot.user_id.isnot(None)))
+    return {r[0] for r in results}
+
+
+async def claim_user_slot(db: AsyncSession, user_id: str, count: int) -> bool:
+    """
+    Admit a user into a free slot among the first `count`. The slot row is taken
+    with FOR UPDATE SKIP LOCKED, so concurrent admissions by several replicas each
+    get a different slot and never exceed `count` users in total.
+
+    return whether the user holds a slot now (False: none free)
+    """
+    free = (
+        select(UserSlot.slot)
+        .where(UserSlot.user_id.is_(None), UserSlot.slot < count)
+        .order_by(UserSlot.slot)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    try:
+        admitted = (await db.execute(
+            update(UserSlot)
+            .where(UserSlot.slot == free, UserSlot.user_id.is_(None))
+            .values(user_id=user_id, admitted_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )).rowcount == 1
+        await db.commit()
+    except IntegrityError:
+        # unique user_id: another replica admitted this user meanwhile
+        await db.rollback()
+        return True
+    return admitted
+
+
+async def release_idle_user_slots(db: AsyncSession) -> List[str]:
+    """
+    Free the slots of users left with no PENDING or RUNNING job.
+
+    return the released users
+    """
+    incomplete = exists().where(
+        Job.user_id == UserSlot.user_id,
+        Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+    )
+    slots = list((await db.scalars(
+        select(UserSlot)
+        .where(UserSlot.user_id.isnot(None), ~incomplete)
+        .with_for_update(skip_locked=True, of=UserSlot)
+    )).all())
+    released = [s.user_id for s in slots]
+    for s in slots:
+        s.user_id = None
+        s.admitted_at = None
+    await db.commit()
+    return released
@@ -1,37 +1,52 @@
 # app/repositories/workflow_repo.py
 
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, select
 from app.models import Workflow
 from datetime import datetime
 import uuid
 
-def create_workflow(db: Session, user_id: str, name: str) -> Workflow:
+async def create_workflow(db: AsyncSession, user_id: str, name: str, weight: float = 1.0) -> Workflow:
     wf = Workflow(
         id=str(uuid.uuid4()),
         user_id=user_id,
         name=name,
+        weight=weight,
         created_at=datetime.utcnow(),
     )
     db.add(wf)
-    db.commit()
-    db.refresh(wf)
+    await db.commit()
+    await db.refresh(wf)
     return wf
 
-def get_workflow_by_id(db: Session, workflow_id: str, user_id: str) -> Optional[Workflow]:
-    return (
-        db.query(Workflow)
-        .filter(Workflow.id == workflow_id, Workflow.user_id == user_id)
-        .first()
+async def get_workflow_by_id(db: AsyncSession, workflow_id: str, user_id: str) -> Optional[Workflow]:
+    return await db.scalar(
+        select(Workflow)
+        .where(Workflow.id == workflow_id, Workflow.user_id == user_id)
+        .limit(1)
     )
 
 
-def list_workflows(db: Session, user_id: str) -> List[Workflow]:
+async def get_workflows_by_ids(db: AsyncSession, workflow_ids: Iterable[str], user_id: str) -> Dict[str, Workflow]:
+    ids = set(workflow_ids)
+    if not ids:
+        return {}
+    rows = await db.scalars(select(Workflow).where(Workflow.id.in_(ids), Workflow.user_id == user_id))
+    return {wf.id: wf for wf in rows}
+
+
+async def list_workflows(db: AsyncSession, user_id: str) -> List[Workflow]:
     
-    return (
-        db.query(Workflow)
-        .filter(Workflow.user_id == user_id)
+    return list((await db.scalars(
+        select(Workflow)
+        .where(Workflow.user_id == user_id)
         .order_by(desc(Workflow.created_at))
-        .all()
-    )
\ No newline at end of file
+    )).all())
+
+async def get_workflow_weights(db: AsyncSession, workflow_ids: Iterable[str]) -> Dict[str, float]:
+    ids = set(workflow_ids)
+    if not ids:
+        return {}
+    rows = await db.execute(select(Workflow.id, Workflow.weight).where(Workflow.id.in_(ids)))
+    return {wf_id: (weight if weight is not None else 1.0) for wf_id, weight in rows}
@@ -0,0 +1,147 @@
+# app/resources.py
+
+"""
+    Resource-weighted worker slots.
+
+    Every JobType declares what one job of it needs (CPU threads, and memory as a
+    base plus a per-megapixel term for the input slide). The scheduler admits jobs
+    against the node's budget (NODE_CPUS, NODE_MEMORY_MB) instead of counting them,
+    so a few cheap jobs can be backfilled next to a running segmentation.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import openslide
+from PIL import Image
+
+from .models import Job, JobType
+from . import config
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    cpus: float
+    base_mb: float
+    mb_per_megapixel: float = 0.0
+    max_mb: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class Demand:
+    cpus: float
+    memory_mb: float
+
+
+JOB_PROFILES: Dict[JobType, ResourceProfile] = {
+    # thumbnail + threshold; flat images are copied whole by the PIL backend
+    JobType.TISSUE_MASK: ResourceProfile(cpus=1, base_mb=256, mb_per_megapixel=8, max_mb=4096),
+    JobType.PREVIEW_DOWNSAMPLE: ResourceProfile(cpus=1, base_mb=128, mb_per_megapixel=8, max_mb=4096),
+    # read threads + its share of the inference pool, prefetched tiles, overlay
+    JobType.INSTANTSEG_CELL_SEG: ResourceProfile(cpus=2, base_mb=2048, mb_per_megapixel=8, max_mb=8192),
+}
+DEFAULT_PROFILE = ResourceProfile(cpus=1, base_mb=256)
+
+
+@lru_cache(maxsize=1024)
+def _dimensions(path: str, mtime_ns: int) -> Tuple[int, int]:
+    # header only: no pyramid build, no pixel decode
+    try:
+        slide = openslide.OpenSlide(path)
+        try:
+            return slide.dimensions
+        finally:
+            slide.close()
+    except Exception:
+        with Image.open(path) as img:
+            return img.size
+
+
+def slide_dimensions(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        return _dimensions(path, os.stat(path).st_mtime_ns)
+    except Exception:
+        return None
+
+
+def estimate(job: Job) -> Demand:
+    """
+    What `job` needs while it runs. params.cpus / params.memory_mb can raise the profile's
+    estimate, not lower it. Clamped to the node capacity so an oversized job can still run on its own.
+    """
+    profile = JOB_PROFILES.get(job.type, DEFAULT_PROFILE)
+    params = job.params or {}
+
+    memory = profile.base_mb
+    if profile.mb_per_megapixel and job.input_path:
+        dims = slide_dimensions(job.input_path)
+        if dims:
+            memory += profile.mb_per_megapixel * dims[0] * dims[1] / 1e6
+    if profile.max_mb is not None:
+        memory = min(memory, profile.max_mb)
+
+    return Demand(
+        cpus=_override(params.get("cpus"), profile.cpus, config.NODE_CPUS),
+        memory_mb=_override(params.get("memory_mb"), memory, config.NODE_MEMORY_MB),
+    )
+
+
+def _override(value, estimate: float, capacity: float) -> float:
+    """
+    A client-supplied demand may only raise the estimate: anything below it (0, negative)
+    would slip past admission. Invalid values are ignored; the result never exceeds capacity.
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        value = estimate
+    if not math.isfinite(value):
+        value = estimate
+    return min(max(value, estimate), capacity)
+
+
+class ResourceBudget:
+    """
+    Capacity of this node and what running slots hold of it.
+    """
+    def __init__(self, cpus: float, memory_mb: float) -> None:
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.used_cpus = 0.0
+        self.used_mb = 0.0
+        self._held: Dict[str, Demand] = {}
+
+    def fits(self, demand: Demand) -> bool:
+        return (
+            self.used_cpus + demand.cpus <= self.cpus + 1e-9
+            and self.used_mb + demand.memory_mb <= self.memory_mb + 1e-9
+        )
+
+    def acquire(self, key: str, demand: Demand) -> None:
+        self.release(key)
+        self._held[key] = demand
+        self.used_cpus += demand.cpus
+        self.used_mb += demand.memory_mb
+
+    def release(self, key: str) -> None:
+        demand = self._held.pop(key, None)
+        if demand is not None:
+            self.used_cpus -= demand.cpus
+            self.used_mb -= demand.memory_mb
+
+    def clear(self) -> None:
+        self._held.clear()
+        self.used_cpus = 0.0
+        self.used_mb = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "cpus": {"capacity": self.cpus, "used": round(self.used_cpus, 2)},
+            "memory_mb": {"capacity": self.memory_mb, "used": round(self.used_mb, 1)},
+            "slots": len(self._held),
+        }
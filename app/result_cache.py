@@ -0,0 +1,207 @@
+# app/result_cache.py
+
+"""
+    Content-addressed cache of finished job outputs.
+
+    Key = (input fingerprint, job type, result-affecting params, output format).
+    An entry is a directory holding a copy/hardlink of every artifact the job produced;
+    on a hit the artifacts are hardlinked (or copied) to the new job's output paths.
+    Entries are evicted least-recently-used once the cache exceeds `max_bytes`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+# params that change how a job runs, not what it produces
+EXECUTION_PARAMS = {"read_workers", "infer_concurrency", "prefetch_batches", "checkpoint", "cache"}
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    # publish via temp name + rename, so dst is never half written
+    tmp = dst + ".cachetmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp) # cross-device or no hardlink support
+    os.replace(tmp, dst)
+
+
+def copy_artifacts(src_paths: List[str], dest_paths: List[str]) -> None:
+    """
+    Hand one job's artifacts to another job (hardlink, copy fallback).
+    """
+    for src, dst in zip(src_paths, dest_paths):
+        if not os.path.isfile(src) or os.path.abspath(src) == os.path.abspath(dst):
+            continue
+        out_dir = os.path.dirname(dst)
+        if out_dir: os.makedirs(out_dir, exist_ok=True)
+        _link_or_copy(src, dst)
+
+
+class ResultCache:
+    def __init__(self, root: str, max_bytes: int, hash_content: bool = False) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict() # key -> bytes, LRU first
+        self._bytes = 0
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _load(self) -> None:
+        # rebuild the index from disk; directory mtime doubles as last-used time
+        found = []
+        for key in os.listdir(self.root):
+            meta_path = os.path.join(self._entry_dir(key), "meta.json")
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+            found.append((os.path.getmtime(self._entry_dir(key)), key, meta["bytes"]))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        if found:
+            print(f"[ResultCache] Loaded {len(found)} entries ({self._bytes / 1024 ** 2:.1f} MB)")
+
+    def _fingerprint(self, path: str) -> list:
+        st = os.stat(path)
+        if not self.hash_content:
+            return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+        memo_key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            digest = self._digests[memo_key] = h.hexdigest()
+        return [digest]
+
+    def key_for(self, input_path: str, job_type: str, params: Optional[dict], output_path: str) -> Optional[str]:
+        """
+        Cache key for a job, or None if it cannot be cached (missing input, params.cache = false).
+        """
+        params = params or {}
+        if not params.get("cache", True):
+            return None
+        if not input_path or not os.path.isfile(input_path):
+            return None
+
+        payload = json.dumps({
+            "input": self._fingerprint(input_path),
+            "type": job_type,
+            "params": {k: v for k, v in params.items() if k not in EXECUTION_PARAMS},
+            "output_ext": os.path.splitext(output_path or "")[1],
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def materialize(self, key: str, dest_paths: List[str]) -> bool:
+        """
+        On a hit, place the cached artifacts at `dest_paths` and return True.
+        A failed lookup is not counted: the same job may be looked up on every
+        scheduling pass, so the caller records one miss per job (record_miss) when
+        it actually computes it.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+
+            entry_dir = self._entry_dir(key)
+            with open(os.path.join(entry_dir, "meta.json")) as f:
+                files = json.load(f)["files"]
+
+            for name, dst in zip(files, dest_paths):
+                out_dir = os.path.dirname(dst)
+                if out_dir: os.makedirs(out_dir, exist_ok=True)
+                _link_or_copy(os.path.join(entry_dir, name), dst)
+
+            os.utime(entry_dir)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True
+
+    def contains(self, key: str) -> bool:
+        """
+        In-memory check, no I/O and no counting: whether materialize(key) can hit.
+        """
+        with self._lock:
+            return key in self._entries
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, artifact_paths: List[str]) -> None:
+        """
+        Store a finished job's artifacts. Skipped if any artifact is missing.
+        Callers must only pass a complete result (see jobs.artifacts_complete):
+        whatever is stored here is served to every later identical job.
+        """
+        if not all(os.path.isfile(p) for p in artifact_paths):
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            tmp_dir = self._entry_dir(f".tmp-{key}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+
+            files = []
+            for i, src in enumerate(artifact_paths):
+                name = f"{i}{os.path.splitext(src)[1]}"
+                _link_or_copy(src, os.path.join(tmp_dir, name))
+                files.append(name)
+            size = sum(os.path.getsize(os.path.join(tmp_dir, n)) for n in files)
+
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump({"files": files, "bytes": size}, f)
+            os.replace(tmp_dir, self._entry_dir(key))
+
+            self._entries[key] = size
+            self._bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -1,8 +1,34 @@
 # app/routers/status.py
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from ..image_tasks.slide_pool import slide_pool
+from ..status_cache import workflow_status_cache
 
 router = APIRouter()   
 
 @router.get("/health")
 async def health():
     return {"status": "ok"}
+
+@router.get("/cache")
+async def cache_stats(request: Request):
+    return request.app.state.scheduler.result_cache.stats()
+
+@router.get("/slides")
+async def slide_stats():
+    return slide_pool.stats()
+
+@router.get("/scheduling")
+async def scheduling_stats(request: Request):
+    return request.app.state.scheduler.policy.stats()
+
+@router.get("/resources")
+async def resource_stats(request: Request):
+    return request.app.state.scheduler.budget.stats()
+
+@router.get("/running")
+async def running_stats(request: Request):
+    return request.app.state.scheduler.running.stats()
+
+@router.get("/status-cache")
+async def status_cache_stats():
+    return workflow_status_cache.stats()
@@ -1,26 +1,59 @@
 # app/routers/workflows.py
 
+import asyncio
+import json
 from typing import List, Optional
-from fastapi import APIRouter, Depends, Header, HTTPException, Body, Request
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Body, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
-from app.db import get_db
+from app.db import SessionLocal, get_db
 from app.models import JobStatus, JobType
 from app.repositories import workflow_repo, job_repo
 from app.services import workflow_service
+from app.events import event_bus
+from app.status_cache import etag_matches
+from app import config
 
 router = APIRouter()
 
 class WorkflowCreateRequest(BaseModel):
     name: str
+    weight: float = Field(1.0, gt=0) # fair-share priority among this user's workflows
 
 class JobCreateRequest(BaseModel):
     branch_name: str
     job_type: str
     input_path: str
     output_path: str
+    params: Optional[dict] = None
+
+class BulkJobSpec(BaseModel):
+    job_type: JobType
+    input_path: str
+    output_path: str
+    params: Optional[dict] = None
+
+class BulkBranchSpec(BaseModel):
+    name: str = Field(..., min_length=1)
+    jobs: List[BulkJobSpec] = Field(..., min_length=1)
+
+class BulkWorkflowSpec(BaseModel):
+    workflow_id: Optional[str] = None # append to an existing workflow instead of creating one
+    name: Optional[str] = None
+    weight: float = Field(1.0, gt=0)
+    branches: List[BulkBranchSpec] = Field(..., min_length=1)
+
+    @model_validator(mode="after")
+    def _named(self):
+        if not self.workflow_id and not self.name:
+            raise ValueError("name is required for a new workflow")
+        return self
+
+class BulkSubmitRequest(BaseModel):
+    workflows: List[BulkWorkflowSpec] = Field(..., min_length=1)
 
 class WorkflowResponse(BaseModel):
     workflow_id: str
@@ -32,9 +65,9 @@ class WorkflowResponse(BaseModel):
 @router.get("/workflows")
 async def list_workflows(
     x_user_id: str = Header(..., alias="X-User-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    wfs = workflow_repo.list_workflows(db, x_user_id)
+    wfs = await workflow_repo.list_workflows(db, x_user_id)
     return [
         {
             "workflow_id": wf.id,
@@ -48,40 +81,161 @@ async def list_workflows(
 async def create_workflow(
     req: WorkflowCreateRequest,
     x_user_id: str = Header(..., alias="X-User-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    wf = workflow_service.create_workflow_for_user(db, x_user_id, req.name)
-    return {"workflow_id": wf.id, "name": wf.name}
+    wf = await workflow_service.create_workflow_for_user(db, x_user_id, req.name, weight=req.weight)
+    return {"workflow_id": wf.id, "name": wf.name, "weight": wf.weight}
+
+@router.post("/workflows/bulk")
+async def submit_workflows(
+    req: BulkSubmitRequest,
+    request: Request, # app.state
+    x_user_id: str = Header(..., alias="X-User-ID"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create whole workflows (branches and jobs) in one transaction, then wake the scheduler once.
+    """
+    n_jobs = sum(len(b.jobs) for wf in req.workflows for b in wf.branches)
+    if n_jobs > config.BULK_MAX_JOBS:
+        raise HTTPException(status_code=413, detail=f"{n_jobs} jobs in one request, the limit is {config.BULK_MAX_JOBS}")
+    try:
+        created = await workflow_service.submit_workflows(
+            db, x_user_id, [wf.model_dump(mode="json") for wf in req.workflows]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    request.app.state.scheduler.wakeup()
+    return {"workflows": created, "jobs": n_jobs}
 
 @router.get("/workflows/{workflow_id}")
 async def get_workflow_details(
     workflow_id: str,
     x_user_id: str = Header(..., alias="X-User-ID"),
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Conditional read: an unchanged workflow answers 304 to its last ETag, from memory.
+    """
+    try:
+        snap = await workflow_service.get_workflow_status_snapshot(db, x_user_id, workflow_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # private: the body depends on X-User-ID; no-cache: revalidate every time
+    headers = {"ETag": snap.etag, "Cache-Control": "private, no-cache", "Vary": "X-User-ID"}
+    if etag_matches(if_none_match, snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def _load_status(user_id: str, workflow_id: str):
+    async with SessionLocal() as db:
+        return await workflow_service.get_workflow_status(db, user_id, workflow_id)
+
+async def _stream(request: Request, sub, snapshot=None):
+    """
+    Server-Sent Events for one subscription: optional initial snapshot, then job /
+    progress events as they are published, a keep-alive comment when idle, and a
+    new snapshot (or a `resync` event) if the client fell behind and events were dropped.
+    """
+    try:
+        if snapshot is not None:
+            yield _sse("snapshot", await snapshot())
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), config.EVENT_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            if event["event"] == "resync":
+                # whatever queued up is older than the snapshot about to be taken
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.resync = False
+                if snapshot is not None:
+                    yield _sse("snapshot", await snapshot())
+                else:
+                    yield _sse("resync", {})
+                continue
+            yield _sse(event["event"], event)
+    finally:
+        event_bus.unsubscribe(sub)
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@router.get("/workflows/{workflow_id}/events")
+async def stream_workflow_events(
+    workflow_id: str,
+    request: Request,
+    user_id: Optional[str] = Query(None), # EventSource cannot send headers
+    x_user_id: Optional[str] = Header(None, alias="X-User-ID"),
 ):
+    """
+    Push stream for a workflow: `snapshot` (same body as GET /workflows/{id}), then
+    `job` (status transitions) and `progress` events.
+    """
+    uid = x_user_id or user_id
+    if not uid:
+        raise HTTPException(status_code=401, detail="X-User-ID header or user_id query parameter required")
+
+    # subscribe before the first snapshot, so nothing between the two is lost
+    sub = event_bus.subscribe(workflow_id=workflow_id, user_id=uid)
     try:
-        status_data = workflow_service.get_workflow_status(db, x_user_id, workflow_id)
-        return status_data
+        first = await _load_status(uid, workflow_id)
     except ValueError as e:
+        event_bus.unsubscribe(sub)
         raise HTTPException(status_code=404, detail=str(e))
 
+    async def snapshot():
+        nonlocal first
+        if first is not None:
+            data, first = first, None
+            return data
+        return await _load_status(uid, workflow_id)
+
+    return StreamingResponse(_stream(request, sub, snapshot), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+@router.get("/events")
+async def stream_user_events(
+    request: Request,
+    user_id: Optional[str] = Query(None),
+    x_user_id: Optional[str] = Header(None, alias="X-User-ID"),
+):
+    """
+    Push stream of every job event of a user, across workflows. On `resync` the client re-fetches.
+    """
+    uid = x_user_id or user_id
+    if not uid:
+        raise HTTPException(status_code=401, detail="X-User-ID header or user_id query parameter required")
+    sub = event_bus.subscribe(user_id=uid)
+    return StreamingResponse(_stream(request, sub), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 @router.post("/workflows/{workflow_id}/jobs")
 async def add_job(
     workflow_id: str,
     req: JobCreateRequest,
+    request: Request, # app.state
     x_user_id: str = Header(..., alias="X-User-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        job = workflow_service.add_job_to_workflow(
+        job = await workflow_service.add_job_to_workflow(
             db=db,
             user_id=x_user_id,
             workflow_id=workflow_id,
             branch_name=req.branch_name,
             job_type=req.job_type,
             input_path=req.input_path,
-            output_path=req.output_path
+            output_path=req.output_path,
+            params=req.params
         )
+        event_bus.job_changed(job)
+        request.app.state.scheduler.wakeup()
         return {"job_id": job.id, "status": job.status}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -91,12 +245,12 @@ async def cancel_job(
     job_id: str,
     request: Request, # app.state
     x_user_id: str = Header(..., alias="X-User-ID"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     取消任务 -> 触发 DB 更新 + 强制终止内存任务
     """
-    job = job_repo.get_job_by_id(db, job_id)
+    job = await job_repo.get_job_by_id(db, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
@@ -109,11 +263,13 @@ async def cancel_job(
     
     job.status = JobStatus.CANCELLED
     job.finished_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    event_bus.job_changed(job)
 
     scheduler = request.app.state.scheduler
     killed = await scheduler.kill_task(job_id)
 
-    job_repo.auto_cancel_blocked_jobs(db)
+    event_bus.successors_cancelled(job, await job_repo.cancel_branch_successors(db, job.branch_id, job.order_index))
+    scheduler.wakeup()
 
     return {"status": "cancelled", "job_id": job_id, "killed_running_task": killed}
\ No newline at end of file
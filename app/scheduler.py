@@ -7,12 +7,24 @@ from __future__ import annotations
 
 import asyncio
 import os
-from datetime import datetime
-from typing import Dict, Set, List
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set, List
 from .db import SessionLocal
 from .models import JobStatus
-from .jobs import execute_job
-from .repositories import job_repo
+from .jobs import artifacts_complete, execute_job, job_artifacts
+from .repositories import job_repo, slot_repo, workflow_repo
+from .result_cache import ResultCache, copy_artifacts
+from .scheduling_policy import SchedulingPolicy, make_policy
+from .resources import Demand, ResourceBudget, estimate
+from .quotas import RunningIndex, quota_allows
+from .progress import progress_tracker
+from .image_tasks.slide_pool import slide_pool
+from .events import event_bus
 from . import config
 
 
@@ -21,27 +33,77 @@ class Scheduler:
         self,
         max_workers: int | None = None,
         max_active_users: int | None = None,
+        result_cache: ResultCache | None = None,
+        policy: SchedulingPolicy | None = None,
     ) -> None:
         self.max_workers = max_workers or config.MAX_WORKERS
         self.max_active_users = max_active_users or config.MAX_ACTIVE_USERS
+        self.result_cache = result_cache or ResultCache(
+            config.RESULT_CACHE_DIR,
+            max_bytes=config.RESULT_CACHE_MAX_BYTES,
+            hash_content=config.RESULT_CACHE_HASH_CONTENT,
+        )
+        # who gets admitted and which runnable job goes next
+        self.policy = policy or make_policy()
+        # slots are weighted by each job's resource profile against the node's capacity
+        self.budget = ResourceBudget(config.NODE_CPUS, config.NODE_MEMORY_MB)
+        # job_id -> when it first did not fit; past BACKFILL_MAX_DELAY capacity is held for it
+        self._capacity_wait: Dict[str, float] = {}
+        # O(1) running counts per user / workflow / type and branch ownership, for quotas
+        self.running = RunningIndex()
 
         self._stop_event = asyncio.Event()
+        self._wakeup_event = asyncio.Event()
         self._lock = asyncio.Lock()
 
         self._running_tasks: Dict[str, dict] = {}
 
+        # admitted users as of the last pass; the user_slots table is authoritative
         self._active_users: Set[str] = set()
+
+        # several replicas may share the DB: jobs are claimed under leases in this name
+        self.replica_id = config.REPLICA_ID or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._heartbeat: Optional[asyncio.Task] = None
+
+        # single-flight: cache_key -> {'leader': job_id, 'followers': {job_id}, 'leader_cancelled': bool}
+        self._inflight: Dict[str, dict] = {}
+        self._follower_of: Dict[str, str] = {}
+        # result-cache key of each frontier job, computed once while it stays PENDING
+        self._cache_keys: Dict[str, Optional[str]] = {}
+
+        # shards of running jobs waiting for a worker slot; they go before new jobs
+        self._pending_shards: Deque[dict] = deque()
        
-        print(f"[Scheduler] initialized. Max Users={self.max_active_users}, Max Workers={self.max_workers}")
+        print(f"[Scheduler] initialized. Replica={self.replica_id}, Max Users={self.max_active_users}, Max Workers={self.max_workers}, Policy={self.policy.name}")
 
     
     async def kill_task(self, job_id: str) -> bool:
         
         async with self._lock:
+            cache_key = self._follower_of.pop(job_id, None)
+            if cache_key:
+                # follower: just detach, the shared execution carries on
+                group = self._inflight[cache_key]
+                group['followers'].discard(job_id)
+                progress_tracker.forget(job_id)
+                print(f"[Scheduler] Follower Job {job_id} detached")
+                leader = self._running_tasks.get(group['leader'])
+                if group['leader_cancelled'] and not group['followers'] and leader:
+                    # the execution was only kept for followers, and the last one is gone
+                    leader['task'].cancel()
+                    print(f"[Scheduler] Hard killing task for cancelled Job {group['leader']}, no followers left")
+                return True
+
             if job_id in self._running_tasks:
                 task_info = self._running_tasks[job_id]
                 task = task_info['task']
-                
+
+                group = self._inflight.get(task_info.get('cache_key'))
+                if group and group['followers']:
+                    # other jobs still wait on this execution: the leader job is cancelled, the work is not
+                    group['leader_cancelled'] = True
+                    print(f"[Scheduler] Job {job_id} cancelled, execution kept for {len(group['followers'])} follower(s)")
+                    return True
                 
                 task.cancel() 
                 
@@ -49,81 +111,195 @@ class Scheduler:
                 return True
             return False
 
-     
+    async def recover(self) -> None:
+        """
+        Rebuild in-memory state from the DB before the loop starts.
+        RUNNING jobs whose lease expired, or that this replica held before a restart, go
+        back to PENDING; jobs other live replicas hold are left alone. Admitted users keep
+        their active slots (user_slots table).
+        """
+        async with SessionLocal() as db:
+            await slot_repo.ensure_user_slots(db, self.max_active_users)
+            requeued = await job_repo.requeue_orphaned_jobs(db, owner=self.replica_id)
+            busy_users_in_db = await job_repo.get_users_with_incomplete_jobs(db)
+            active_users = await slot_repo.get_admitted_users(db)
+            # usage older than a few half-lives no longer matters for fair share
+            since = datetime.utcnow() - timedelta(seconds=4 * config.FAIR_SHARE_HALF_LIFE)
+            usage = await job_repo.get_usage_since(db, since)
+        for job in requeued:
+            event_bus.job_changed(job)
+
+        self._running_tasks.clear()
+        self._pending_shards.clear()
+        self.budget.clear()
+        self._capacity_wait.clear()
+        self.running.clear()
+        self._inflight.clear()
+        self._follower_of.clear()
+        self.policy.clear_running()
+        self.policy.load_usage(usage)
+        self._active_users = active_users
+        print(f"[Scheduler] Recovered. Active users={sorted(self._active_users)}, Queued users={len(busy_users_in_db)}")
+
+    def wakeup(self) -> None:
+        """
+        Ask the loop to run a scheduling pass now.
+        Called on job creation, job completion, cancellation and slot release.
+        Multiple calls before the next pass are coalesced into one.
+        """
+        self._wakeup_event.set()
+
 
     async def start(self) -> None:
         print("[Scheduler] Starting loop...")
+        self._heartbeat = asyncio.create_task(self._renew_leases())
         while not self._stop_event.is_set():
+            # clear before the pass: events raised while scheduling trigger another pass
+            self._wakeup_event.clear()
             try:
                 await self._schedule_once()
             except Exception as e:
                 import traceback
                 traceback.print_exc()
                 print(f"[Scheduler] Loop error: {e}")
-           
-            await asyncio.sleep(1.0)
+
+            # sleep until something changes; the periodic sweep is only a safety net
+            try:
+                await asyncio.wait_for(
+                    self._wakeup_event.wait(), timeout=config.SCHEDULER_SWEEP_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                # slides idle since the last job released them: nothing else would close them
+                await asyncio.to_thread(slide_pool.sweep)
         print("[Scheduler] Stopped.")
 
     async def stop(self) -> None:
         self._stop_event.set()
+        self._wakeup_event.set()
         async with self._lock:
             tasks = [t['task'] for t in self._running_tasks.values()]
         if tasks:
             for t in tasks: t.cancel()
             await asyncio.gather(*tasks, return_exceptions=True)
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
 
    
 
     async def _schedule_once(self) -> None:
-        db = SessionLocal()
-        try:
+        async with SessionLocal() as db:
             async with self._lock:
-                busy_users_in_db = job_repo.get_users_with_incomplete_jobs(db)
-                current_active_list = list(self._active_users)
-                
-                
-                for uid in current_active_list:
-                    if uid not in busy_users_in_db:
-                        self._active_users.remove(uid)
-                        print(f"[Scheduler] User {uid} finished. Slot released.")
+                # active slots live in the DB, shared with the other replicas
+                for uid in await slot_repo.release_idle_user_slots(db):
+                    print(f"[Scheduler] User {uid} finished. Slot released.")
+                    self.wakeup()
+                queue_heads = await job_repo.get_user_queue_heads(db)
+                self._active_users = await slot_repo.get_admitted_users(db)
 
                 
                 if len(self._active_users) < self.max_active_users:
-                    waiting_users = [u for u in busy_users_in_db if u not in self._active_users]
+                    waiting = {u: t for u, t in queue_heads.items() if u not in self._active_users}
                     slots_open = self.max_active_users - len(self._active_users)
-                    for i in range(min(slots_open, len(waiting_users))):
-                        new_user = waiting_users[i]
+                    for new_user in self.policy.admit(waiting, slots_open):
+                        if not await slot_repo.claim_user_slot(db, new_user, self.max_active_users):
+                            break  # taken by other replicas' admissions
                         self._active_users.add(new_user)
                         print(f"[Scheduler] User {new_user} admitted to Active Slot.")
 
-                
-                cancelled_count = job_repo.auto_cancel_blocked_jobs(db)
-                
-               
-                if cancelled_count > 0:
-                     await self._cleanup_zombies(db)
 
                 
-                if not self._active_users: return
-                if len(self._running_tasks) >= self.max_workers: return
+                # shards belong to jobs that already hold a slot: fill free workers with them first
+                while self._pending_shards and len(self._running_tasks) < self.max_workers:
+                    entry = self._pending_shards[0]
+                    parent = self._running_tasks.get(entry['parent'])
+                    if parent and not (
+                        (entry['demand'] is None or self.budget.fits(entry['demand']))
+                        and quota_allows(self.running, parent['user_id'], parent['workflow_id'], parent['job_type'])
+                    ): break
+                    self._start_shard(self._pending_shards.popleft())
 
-                candidates = job_repo.get_runnable_jobs(db, allowed_user_ids=self._active_users)
+                if not self._active_users: return
 
-                
+                # the whole frontier (one job per branch head): small jobs may backfill past big ones
+                candidates = await job_repo.get_runnable_jobs(db, allowed_user_ids=self._active_users)
+                candidates = self.policy.order(
+                    candidates,
+                    await workflow_repo.get_workflow_weights(db, {j.workflow_id for j in candidates}),
+                )
+                candidates = self._hold_for_starved(candidates)
+
+                # one thread hop for the keys of jobs new to the frontier; jobs that left it are dropped
+                fresh = [j for j in candidates if j.id not in self._cache_keys]
+                if fresh:
+                    self._cache_keys.update(await asyncio.to_thread(
+                        lambda: {j.id: self._cache_key(j) for j in fresh}
+                    ))
+                self._cache_keys = {j.id: self._cache_keys[j.id] for j in candidates}
+
+                # set when workers are all busy or a starved job holds capacity: from then on
+                # only jobs that need no worker slot (cache hits, followers) are dispatched
+                hold = False
                 for job in candidates:
-                    if len(self._running_tasks) >= self.max_workers: break
-                    if self._is_branch_running_in_memory(job.branch_id): continue
-
-                    
-                    job.status = JobStatus.RUNNING
-                    job.started_at = datetime.utcnow()
-                    db.commit()
-
-                    task = asyncio.create_task(self._run_single_job(job.id, job.user_id))
+                    if self.running.branch_running(job.branch_id): continue
+
+                    # identical job already computed: serve it without taking a worker slot
+                    cache_key = self._cache_keys[job.id]
+                    if (
+                        cache_key and self.result_cache.contains(cache_key)
+                        and await self._serve_from_cache(db, job, cache_key)
+                    ): continue
+
+                    # identical job running right now: follow it instead of computing twice (no worker slot either)
+                    if cache_key in self._inflight:
+                        await self._attach_follower(db, job, cache_key)
+                        continue
+
+                    if hold or len(self._running_tasks) >= self.max_workers:
+                        hold = True
+                        continue
+
+                    if not quota_allows(self.running, job.user_id, job.workflow_id, job.type): continue
+
+                    demand = await asyncio.to_thread(estimate, job)
+                    if not self.budget.fits(demand):
+                        self._capacity_wait.setdefault(job.id, time.monotonic())
+                        if self._is_starved(job.id):
+                            # no more backfill: let running jobs drain until this one fits
+                            hold = True
+                        continue
+                    self._capacity_wait.pop(job.id, None)
+
+                    # the input may have changed since the key was computed
+                    cache_key = self._cache_keys[job.id] = await asyncio.to_thread(self._cache_key, job)
+
+                    # atomic claim: another replica may have taken the job or its branch meanwhile
+                    if not await job_repo.claim_job(
+                        db, job, owner=self.replica_id, lease_seconds=config.JOB_LEASE_SECONDS,
+                    ):
+                        continue
+                    event_bus.job_changed(job)
+
+                    task = asyncio.create_task(self._run_single_job(job.id, job.user_id, cache_key))
                     self._running_tasks[job.id] = {
                         'task': task,
-                        'branch_id': job.branch_id
+                        'branch_id': job.branch_id,
+                        'cache_key': cache_key,
+                        'user_id': job.user_id,
+                        'workflow_id': job.workflow_id,
+                        'job_type': job.type,
+                        'demand': demand,
                     }
+                    self.budget.acquire(job.id, demand)
+                    self.running.add(
+                        job.id, user_id=job.user_id, workflow_id=job.workflow_id,
+                        job_type=job.type, branch_id=job.branch_id,
+                    )
+                    self.policy.job_started(job.id, job.user_id, job.workflow_id)
+                    if cache_key:
+                        # computed, not served: one miss per job, however many passes looked it up
+                        self.result_cache.record_miss()
+                        self._inflight[cache_key] = {'leader': job.id, 'followers': set(), 'leader_cancelled': False}
                     
                     
                     task.add_done_callback(
@@ -133,55 +309,361 @@ class Scheduler:
                     )
                     print(f"[Scheduler] Started Job {job.id} (Branch: {job.branch_id})")
 
+    def _cache_key(self, job) -> Optional[str]:
+        return self.result_cache.key_for(job.input_path, job.type.value, job.params, job.output_path)
+
+    async def _serve_from_cache(self, db, job, cache_key: str) -> bool:
+        def lookup():
+            # the key was computed when the job joined the frontier: check the input is unchanged
+            key = self._cache_key(job)
+            return key, key == cache_key and self.result_cache.materialize(cache_key, job_artifacts(job))
+
+        try:
+            self._cache_keys[job.id], hit = await asyncio.to_thread(lookup)
+        except Exception as e:
+            print(f"[Scheduler] Result cache error for Job {job.id}: {e}")
+            return False
+        if not hit:
+            return False
+
+        if not await job_repo.complete_pending_job(db, job):
+            return True  # claimed by another replica meanwhile; it writes the same outputs
+        event_bus.job_changed(job)
+        print(f"[Scheduler] Job {job.id} served from result cache ({cache_key[:12]})")
+
+        # successor in the branch may be runnable now
+        self.wakeup()
+        return True
+
+    async def _attach_follower(self, db, job, cache_key: str) -> None:
+        if not await job_repo.claim_job(db, job, owner=self.replica_id, lease_seconds=config.JOB_LEASE_SECONDS):
+            return
+        event_bus.job_changed(job)
+
+        group = self._inflight[cache_key]
+        group['followers'].add(job.id)
+        self._follower_of[job.id] = cache_key
+        print(f"[Scheduler] Job {job.id} follows running Job {group['leader']} (no worker slot)")
+
+    async def _mirror_progress(self, cache_key: str) -> None:
+        while True:
+            await asyncio.sleep(config.FOLLOWER_SYNC_INTERVAL)
+            group = self._inflight.get(cache_key)
+            if not group or not group['followers']:
+                continue
+            # in memory only; the tracker's next flush writes the followers' rows too
+            state = progress_tracker.get(group['leader'])
+            if not state:
+                continue
+            for fid in group['followers']:
+                progress_tracker.report(
+                    fid, state['progress'],
+                    processed_tiles=state.get('processed_tiles'), total_tiles=state.get('total_tiles'),
+                )
+
+    async def _finish_followers(self, db, leader, cache_key: str, status: JobStatus) -> None:
+        """
+        Settle the followers of a finished execution:
+        SUCCEEDED -> copy the leader's artifacts, FAILED -> fail (and fail-fast their branches),
+        PENDING -> execution stopped without a result, re-queue them.
+        """
+        group = self._inflight.get(cache_key)
+        if not group or group['leader'] != leader.id:
+            return
+        del self._inflight[cache_key]
+        for fid in group['followers']:
+            self._follower_of.pop(fid, None)
+        if not group['followers']:
+            return
+
+        now = datetime.utcnow()
+        failed = []
+        settled = []
+        for fid in group['followers']:
+            fjob = await job_repo.get_job_by_id(db, fid)
+            progress_tracker.forget(fid)
+            if not fjob or fjob.status != JobStatus.RUNNING or fjob.lease_owner != self.replica_id:
+                continue
+
+            settled.append(fjob)
+            if status == JobStatus.PENDING:
+                fjob.status = JobStatus.PENDING
+                fjob.started_at = None
+                fjob.lease_owner = None
+                fjob.lease_expires_at = None
+                continue
+
+            fstatus = status
+            if status == JobStatus.SUCCEEDED:
+                try:
+                    await asyncio.to_thread(copy_artifacts, job_artifacts(leader), job_artifacts(fjob))
+                except Exception as e:
+                    print(f"[Scheduler] Follower Job {fid} could not copy leader output: {e}")
+                    fstatus = JobStatus.FAILED
+
+            fjob.status = fstatus
+            fjob.finished_at = now
+            if fstatus == JobStatus.SUCCEEDED:
+                fjob.progress = 1.0
+                fjob.total_tiles = leader.total_tiles
+                fjob.processed_tiles = leader.processed_tiles
+            else:
+                failed.append(fjob)
+        await db.commit()
+        for fjob in settled:
+            event_bus.job_changed(fjob)
+
+        for fjob in failed:
+            event_bus.successors_cancelled(fjob, await job_repo.cancel_branch_successors(db, fjob.branch_id, fjob.order_index))
+        print(f"[Scheduler] {len(group['followers'])} follower(s) of Job {leader.id} settled: {status.value}")
+        self.wakeup()
+
+    async def run_shards(self, parent_id: str, factories: List[Callable[[], Awaitable]]) -> list:
+        """
+        Run one job's shards in parallel. The first runs in the parent's own slot, the rest
+        are queued for free worker slots (ahead of new jobs); shards still queued when the
+        parent's own shard is done run in its slot too. Returns their results in order.
+        Any shard failing, or the parent being cancelled, cancels every other shard.
+        The parent's demand is split evenly: it keeps one share, each shard slot takes another.
+        """
+        loop = asyncio.get_running_loop()
+        parent = self._running_tasks.get(parent_id)
+        share = None
+        if parent and parent['demand'] is not None:
+            share = Demand(
+                cpus=parent['demand'].cpus / len(factories),
+                memory_mb=parent['demand'].memory_mb / len(factories),
+            )
+            parent['demand'] = share
+            self.budget.acquire(parent_id, share)
+        queued = [
+            {
+                'parent': parent_id, 'key': f"{parent_id}#shard{i}", 'factory': factory,
+                'demand': share, 'future': loop.create_future(),
+            }
+            for i, factory in enumerate(factories[1:], start=1)
+        ]
+        async with self._lock:
+            self._pending_shards.extend(queued)
+        self.wakeup()
+
+        async def run_in_own_slot():
+            result = await factories[0]()
+            # our slot is free again: take over shards that found no capacity of their own
+            while True:
+                async with self._lock:
+                    entry = next((e for e in queued if e in self._pending_shards), None)
+                    if entry is not None:
+                        self._pending_shards.remove(entry)
+                if entry is None:
+                    return result
+                await self._run_shard(entry)
+
+        first = asyncio.ensure_future(run_in_own_slot())
+        try:
+            return await asyncio.gather(first, *(e['future'] for e in queued))
         finally:
-            db.close()
+            async with self._lock:
+                for e in queued:
+                    if e in self._pending_shards:
+                        self._pending_shards.remove(e)
+            tasks = [first] + [
+                self._running_tasks[e['key']]['task'] for e in queued if e['key'] in self._running_tasks
+            ]
+            for t in tasks: t.cancel()
+            for e in queued:
+                if not e['future'].done(): e['future'].cancel()
+                elif not e['future'].cancelled(): e['future'].exception()  # mark retrieved
+            # let cancelled shards clean up (abort their writers) before the parent settles
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-    async def _cleanup_zombies(self, db):
-        
-        for job_id in list(self._running_tasks.keys()):
-            job = job_repo.get_job_by_id(db, job_id)
-            if job and job.status in [JobStatus.CANCELLED, JobStatus.FAILED]:
-                await self.kill_task(job_id)
-
-    def _is_branch_running_in_memory(self, branch_id: str) -> bool:
-        for info in self._running_tasks.values():
-            if info['branch_id'] == branch_id:
-                return True
+    def _start_shard(self, entry: dict) -> None:
+        parent = self._running_tasks.get(entry['parent'])
+        task = asyncio.create_task(self._run_shard(entry))
+        self._running_tasks[entry['key']] = {
+            'task': task,
+            'branch_id': parent['branch_id'] if parent else None,
+            'cache_key': None,
+            'user_id': parent['user_id'] if parent else None,
+            'workflow_id': parent['workflow_id'] if parent else None,
+            'job_type': parent['job_type'] if parent else None,
+            'demand': entry['demand'],
+            'shard_of': entry['parent'],
+        }
+        if entry['demand'] is not None:
+            self.budget.acquire(entry['key'], entry['demand'])
+        if parent:
+            # counts toward the parent's quotas; the branch is already held by the parent
+            self.running.add(
+                entry['key'], user_id=parent['user_id'], workflow_id=parent['workflow_id'],
+                job_type=parent['job_type'],
+            )
+            # shard slots are charged to the parent's user and workflow
+            self.policy.job_started(entry['key'], parent['user_id'], parent['workflow_id'])
+        task.add_done_callback(
+            lambda t, key=entry['key']: asyncio.create_task(self._on_task_done(key, None))
+        )
+        print(f"[Scheduler] Started shard {entry['key']}")
+
+    async def _run_shard(self, entry: dict) -> None:
+        future = entry['future']
+        try:
+            result = await entry['factory']()
+        except asyncio.CancelledError:
+            if not future.done(): future.cancel()
+            raise
+        except Exception as e:
+            if not future.done(): future.set_exception(e)
+        else:
+            if not future.done(): future.set_result(result)
+
+    def _is_starved(self, job_id: str) -> bool:
+        since = self._capacity_wait.get(job_id)
+        return since is not None and time.monotonic() - since >= config.BACKFILL_MAX_DELAY
+
+    def _hold_for_starved(self, candidates: list) -> list:
+        """
+        Forget jobs that left the frontier, and move jobs that have waited too long
+        for capacity to the front so nothing smaller can backfill ahead of them.
+        """
+        ids = {j.id for j in candidates}
+        for job_id in [k for k in self._capacity_wait if k not in ids]:
+            del self._capacity_wait[job_id]
+        starved = [j for j in candidates if self._is_starved(j.id)]
+        if not starved:
+            return candidates
+        starved.sort(key=lambda j: self._capacity_wait[j.id])
+        return starved + [j for j in candidates if not self._is_starved(j.id)]
+
+    async def _holds_lease(self, db, job) -> bool:
+        """
+        Lock the job's row and re-read its status and lease before writing a final state.
+        If the lease was lost (expired and re-queued, maybe claimed by another replica),
+        the job is detached from the session so none of this run's changes are written.
+        """
+        await db.refresh(job, ["status", "lease_owner"], with_for_update=True)
+        if job.lease_owner == self.replica_id:
+            return True
+        print(f"[Scheduler] Job {job.id} lost its lease (now {job.status.value}, {job.lease_owner}), result dropped.")
+        progress_tracker.forget(job.id)
+        await db.commit()
+        db.expunge(job)
         return False
 
+    async def _renew_leases(self) -> None:
+        """
+        Heartbeat: every LEASE_HEARTBEAT_INTERVAL, extend the leases of the jobs this
+        replica runs (leaders and followers), stop the ones it no longer holds or that
+        were cancelled through another replica, and re-queue jobs whose lease expired.
+        """
+        while True:
+            await asyncio.sleep(config.LEASE_HEARTBEAT_INTERVAL)
+            try:
+                async with self._lock:
+                    held = [k for k, t in self._running_tasks.items() if 'shard_of' not in t] + list(self._follower_of)
+                async with SessionLocal() as db:
+                    renewed = await job_repo.renew_leases(
+                        db, owner=self.replica_id, job_ids=held, lease_seconds=config.JOB_LEASE_SECONDS,
+                    )
+                    states = await job_repo.get_lease_states(db, [k for k in held if k not in renewed])
+                    requeued = await job_repo.requeue_orphaned_jobs(db)
+
+                for job_id, (status, owner) in states.items():
+                    # finished meanwhile: nothing to stop
+                    if owner != self.replica_id or status == JobStatus.CANCELLED:
+                        await self.kill_task(job_id)
+                for job in requeued:
+                    event_bus.job_changed(job)
+                if requeued:
+                    self.wakeup()
+            except Exception as e:
+                print(f"[Scheduler] Lease heartbeat failed: {e}")
+
     async def _on_task_done(self, job_id: str, user_id: str) -> None:
         async with self._lock:
             self._running_tasks.pop(job_id, None)
+            self.policy.job_finished(job_id)
+            self.budget.release(job_id)
+            self.running.remove(job_id)
+        self.wakeup()
 
-    async def _run_single_job(self, job_id: str, user_id: str) -> None:
+    async def _run_single_job(self, job_id: str, user_id: str, cache_key: str | None = None) -> None:
         db = SessionLocal()
+        mirror = asyncio.create_task(self._mirror_progress(cache_key)) if cache_key else None
         try:
-            job = job_repo.get_job_by_id(db, job_id)
+            job = await job_repo.get_job_by_id(db, job_id)
             if not job: return
+            # end the read transaction: no pooled connection is held while the job computes
+            await db.commit()
 
             try:
-                await execute_job(db, job)
-
-                if job.status == JobStatus.RUNNING:
-                    job.status = JobStatus.SUCCEEDED
-                job.finished_at = datetime.utcnow()
-                if job.progress < 1.0: job.progress = 1.0
-                db.commit()
-                print(f"[Scheduler] Job {job_id} Finished: {job.status}")
+                await execute_job(db, job, run_shards=partial(self.run_shards, job_id))
+
+                if await self._holds_lease(db, job):
+                    progress_tracker.settle(job)
+                    if job.status == JobStatus.RUNNING:
+                        job.status = JobStatus.SUCCEEDED
+                    job.finished_at = datetime.utcnow()
+                    if job.progress < 1.0: job.progress = 1.0
+                    await db.commit()
+                    event_bus.job_changed(job)
+                    print(f"[Scheduler] Job {job_id} Finished: {job.status}")
+
+                # the execution itself succeeded even if the leader job was cancelled meanwhile
+                if cache_key:
+                    try:
+                        # only a complete result: a run that lost tiles raised above and never gets here
+                        if await asyncio.to_thread(artifacts_complete, job):
+                            await asyncio.to_thread(self.result_cache.put, cache_key, job_artifacts(job))
+                    except Exception as e:
+                        print(f"[Scheduler] Result cache store failed for Job {job_id}: {e}")
+                    await self._finish_followers(db, job, cache_key, JobStatus.SUCCEEDED)
 
             except asyncio.CancelledError:
+                held = await self._holds_lease(db, job)
+                # no result to share: followers go back to the queue
+                if cache_key:
+                    await self._finish_followers(db, job, cache_key, JobStatus.PENDING)
+                if not held:
+                    raise
+                progress_tracker.settle(job)
+
+                if self._stop_event.is_set() and job.status == JobStatus.RUNNING:
+                    # shutdown, not a user cancel: hand the job to the next process
+                    print(f"[Scheduler] Job {job_id} interrupted by shutdown, re-queued.")
+                    job.status = JobStatus.PENDING
+                    job.started_at = None
+                    job.lease_owner = None
+                    job.lease_expires_at = None
+                    await db.commit()
+                    event_bus.job_changed(job)
+                    raise
+
                 print(f"[Scheduler] Job {job_id} was CANCELLED (Interrupted).")
-                
-                db.refresh(job)
                 if job.status != JobStatus.CANCELLED:
                     job.status = JobStatus.CANCELLED
-                    db.commit()
+                await db.commit()
+                event_bus.job_changed(job)
                 raise 
 
             except Exception as e:
                 print(f"[Scheduler] Job {job_id} Failed: {e}")
-                job.status = JobStatus.FAILED
-                job.finished_at = datetime.utcnow()
-                db.commit()
+                if await self._holds_lease(db, job):
+                    progress_tracker.settle(job)
+                    job.status = JobStatus.FAILED
+                    job.finished_at = datetime.utcnow()
+                    await db.commit()
+                    event_bus.job_changed(job)
+                    event_bus.successors_cancelled(job, await job_repo.cancel_branch_successors(db, job.branch_id, job.order_index))
+                if cache_key:
+                    await self._finish_followers(db, job, cache_key, JobStatus.FAILED)
         finally:
-            db.close()
\ No newline at end of file
+            if mirror: mirror.cancel()
+            progress_tracker.forget(job_id)
+            group = self._inflight.get(cache_key)
+            if group and group['leader'] == job_id:
+                # leader vanished before settling (e.g. job row deleted): release followers' bookkeeping
+                del self._inflight[cache_key]
+                for fid in group['followers']:
+                    self._follower_of.pop(fid, None)
+            await db.close()
\ No newline at end of file
@@ -0,0 +1,213 @@
+# app/scheduling_policy.py
+
+"""
+    Scheduling policies: which waiting users get an active slot, and in which
+    order runnable jobs are dispatched.
+
+    Every policy keeps the same usage ledger: worker-seconds per user and per
+    workflow, charged while jobs (and their shards) hold a worker slot and decayed
+    with a half-life of FAIR_SHARE_HALF_LIFE, so past bursts are gradually forgiven.
+
+    - FifoPolicy: oldest waiting user first, jobs by creation time.
+    - FairSharePolicy: stride scheduling. Each user (and each workflow within a
+      user) has a virtual time = usage / weight; the lowest virtual time goes next,
+      and every dispatch advances it by FAIR_SHARE_QUANTUM / weight, so one pass
+      interleaves users in proportion to their weights instead of draining one queue.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from .models import Job
+from . import config
+
+
+def _epoch(dt: datetime) -> float:
+    # DB timestamps are naive UTC (datetime.utcnow)
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+class _DecayingLedger:
+    """
+    Worker-seconds per key with exponential decay, stored as (value, as-of time).
+    """
+    def __init__(self, half_life: float) -> None:
+        self.half_life = half_life
+        self._values: Dict[str, Tuple[float, float]] = {}
+
+    def _decayed(self, value: float, stamp: float, now: float) -> float:
+        if self.half_life <= 0:
+            return value
+        return value * math.pow(0.5, max(0.0, now - stamp) / self.half_life)
+
+    def add(self, key: str, amount: float, at: float) -> None:
+        value, stamp = self._values.get(key, (0.0, at))
+        if at < stamp:
+            # charged in the past (usage reloaded from the DB): decay the amount instead
+            self._values[key] = (value + self._decayed(amount, at, stamp), stamp)
+        else:
+            self._values[key] = (self._decayed(value, stamp, at) + amount, at)
+
+    def get(self, key: str, now: float) -> float:
+        entry = self._values.get(key)
+        return self._decayed(entry[0], entry[1], now) if entry else 0.0
+
+    def snapshot(self, now: float) -> Dict[str, float]:
+        return {k: self.get(k, now) for k in self._values}
+
+
+class SchedulingPolicy(ABC):
+    name = "base"
+
+    def __init__(self, user_weights: Optional[Dict[str, float]] = None) -> None:
+        self.user_weights = dict(config.USER_WEIGHTS if user_weights is None else user_weights)
+        self._user_usage = _DecayingLedger(config.FAIR_SHARE_HALF_LIFE)
+        self._workflow_usage = _DecayingLedger(config.FAIR_SHARE_HALF_LIFE)
+        # slot key (job id or shard key) -> (user_id, workflow_id, started at)
+        self._running: Dict[str, Tuple[str, str, float]] = {}
+
+    # --- usage ledger ---
+
+    def user_weight(self, user_id: str) -> float:
+        return max(1e-6, float(self.user_weights.get(user_id, 1.0)))
+
+    def job_started(self, key: str, user_id: str, workflow_id: str) -> None:
+        self._running[key] = (user_id, workflow_id, time.time())
+
+    def job_finished(self, key: str) -> None:
+        entry = self._running.pop(key, None)
+        if entry is None:
+            return
+        user_id, workflow_id, started = entry
+        now = time.time()
+        self._user_usage.add(user_id, now - started, now)
+        self._workflow_usage.add(workflow_id, now - started, now)
+
+    def load_usage(self, rows: Iterable[Tuple[str, str, datetime, datetime]]) -> None:
+        """
+        Seed the ledger from finished jobs: (user_id, workflow_id, started_at, finished_at).
+        """
+        for user_id, workflow_id, started_at, finished_at in rows:
+            seconds = (finished_at - started_at).total_seconds()
+            if seconds <= 0:
+                continue
+            self._user_usage.add(user_id, seconds, _epoch(finished_at))
+            self._workflow_usage.add(workflow_id, seconds, _epoch(finished_at))
+
+    def clear_running(self) -> None:
+        self._running.clear()
+
+    def user_usage(self, user_id: str, now: float) -> float:
+        # charged usage plus what its running jobs have consumed so far
+        running = sum(now - s for u, _, s in self._running.values() if u == user_id)
+        return self._user_usage.get(user_id, now) + running
+
+    def workflow_usage(self, workflow_id: str, now: float) -> float:
+        running = sum(now - s for _, w, s in self._running.values() if w == workflow_id)
+        return self._workflow_usage.get(workflow_id, now) + running
+
+    # --- decisions ---
+
+    @abstractmethod
+    def admit(self, waiting: Dict[str, datetime], slots: int) -> List[str]:
+        """
+        Pick up to `slots` users from `waiting` (user -> oldest incomplete job's created_at).
+        """
+
+    @abstractmethod
+    def order(self, jobs: List[Job], workflow_weights: Dict[str, float]) -> List[Job]:
+        """
+        Dispatch order for the runnable jobs of active users.
+        """
+
+    def stats(self) -> dict:
+        now = time.time()
+        users = set(self._user_usage.snapshot(now)) | {u for u, _, _ in self._running.values()}
+        return {
+            "policy": self.name,
+            "users": {
+                u: {"usage_seconds": round(self.user_usage(u, now), 1), "weight": self.user_weight(u)}
+                for u in sorted(users)
+            },
+        }
+
+
+class FifoPolicy(SchedulingPolicy):
+    name = "fifo"
+
+    def admit(self, waiting: Dict[str, datetime], slots: int) -> List[str]:
+        return sorted(waiting, key=lambda u: (waiting[u], u))[:slots]
+
+    def order(self, jobs: List[Job], workflow_weights: Dict[str, float]) -> List[Job]:
+        return sorted(jobs, key=lambda j: j.created_at)
+
+
+class FairSharePolicy(SchedulingPolicy):
+    name = "fair_share"
+
+    def admit(self, waiting: Dict[str, datetime], slots: int) -> List[str]:
+        # least served (per weight) first; ties go to whoever has waited longest
+        now = time.time()
+        return sorted(
+            waiting,
+            key=lambda u: (self.user_usage(u, now) / self.user_weight(u), waiting[u], u),
+        )[:slots]
+
+    def order(self, jobs: List[Job], workflow_weights: Dict[str, float]) -> List[Job]:
+        now = time.time()
+        quantum = config.FAIR_SHARE_QUANTUM
+
+        # per user: a stride heap over its workflows, each holding its jobs FIFO
+        per_user: Dict[str, Dict[str, Deque[Job]]] = {}
+        for job in sorted(jobs, key=lambda j: j.created_at):
+            per_user.setdefault(job.user_id, {}).setdefault(job.workflow_id, deque()).append(job)
+
+        def wf_weight(wf_id: str) -> float:
+            return max(1e-6, float(workflow_weights.get(wf_id) or 1.0))
+
+        wf_heaps: Dict[str, list] = {}
+        user_heap = []
+        for user_id, workflows in per_user.items():
+            heap = [
+                (self.workflow_usage(wf_id, now) / wf_weight(wf_id), wf_jobs[0].created_at, wf_id)
+                for wf_id, wf_jobs in workflows.items()
+            ]
+            heapq.heapify(heap)
+            wf_heaps[user_id] = heap
+            oldest = min(wf_jobs[0].created_at for wf_jobs in workflows.values())
+            user_heap.append((self.user_usage(user_id, now) / self.user_weight(user_id), oldest, user_id))
+        heapq.heapify(user_heap)
+
+        ordered: List[Job] = []
+        while user_heap:
+            u_pass, u_oldest, user_id = heapq.heappop(user_heap)
+            heap = wf_heaps[user_id]
+            w_pass, _, wf_id = heapq.heappop(heap)
+            wf_jobs = per_user[user_id][wf_id]
+            ordered.append(wf_jobs.popleft())
+
+            if wf_jobs:
+                heapq.heappush(heap, (w_pass + quantum / wf_weight(wf_id), wf_jobs[0].created_at, wf_id))
+            if heap:
+                heapq.heappush(user_heap, (u_pass + quantum / self.user_weight(user_id), u_oldest, user_id))
+        return ordered
+
+
+POLICIES = {
+    FifoPolicy.name: FifoPolicy,
+    FairSharePolicy.name: FairSharePolicy,
+}
+
+
+def make_policy(name: Optional[str] = None) -> SchedulingPolicy:
+    name = name or config.SCHEDULING_POLICY
+    if name not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {name!r}, expected one of {sorted(POLICIES)}")
+    return POLICIES[name]()
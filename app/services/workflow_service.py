@@ -2,15 +2,21 @@
 # app/services/workflow_service.py
 
 from __future__ import annotations
-from sqlalchemy.orm import Session, joinedload
-from app.models import Job, JobType, JobStatus, Branch
+import uuid
+from datetime import datetime
+from typing import List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Job, JobType, JobStatus
 from app.repositories import workflow_repo, job_repo
+from app.status_cache import StatusSnapshot, workflow_status_cache
+from app.events import event_bus
 
-def create_workflow_for_user(db: Session, user_id: str, name: str):
-    return workflow_repo.create_workflow(db, user_id, name)
+async def create_workflow_for_user(db: AsyncSession, user_id: str, name: str, weight: float = 1.0):
+    return await workflow_repo.create_workflow(db, user_id, name, weight=weight)
 
-def add_job_to_workflow(
-    db: Session,
+async def add_job_to_workflow(
+    db: AsyncSession,
     *,
     user_id: str,
     workflow_id: str,
@@ -18,17 +24,18 @@ def add_job_to_workflow(
     job_type: JobType | str,
     input_path: str,
     output_path: str,
+    params: dict | None = None,
 ) -> Job:
-    wf = workflow_repo.get_workflow_by_id(db, workflow_id, user_id)
+    wf = await workflow_repo.get_workflow_by_id(db, workflow_id, user_id)
     if not wf:
         raise ValueError("Workflow not found")
 
     if isinstance(job_type, str):
         job_type = JobType(job_type)
 
-    branch = job_repo.get_or_create_branch(db, workflow_id, branch_name)
+    branch = await job_repo.get_or_create_branch(db, workflow_id, branch_name)
 
-    job = job_repo.create_job(
+    job = await job_repo.create_job(
         db=db,
         workflow_id=workflow_id,
         branch=branch,
@@ -36,64 +43,107 @@ def add_job_to_workflow(
         job_type=job_type,
         input_path=input_path,
         output_path=output_path,
+        params=params,
     )
     return job
 
-def get_workflow_status(db: Session, user_id: str, workflow_id: str):
-    
-    wf = workflow_repo.get_workflow_by_id(db, workflow_id, user_id)
-    if not wf:
-        raise ValueError("Workflow not found")
+async def submit_workflows(db: AsyncSession, user_id: str, specs: List[dict]) -> List[dict]:
+    """
+    Bulk submission: create (or extend, when a spec has a workflow_id) whole workflows
+    in one transaction.
+
+    spec: {"name", "weight", "workflow_id"?, "branches": [{"name", "jobs": [
+        {"job_type", "input_path", "output_path", "params"?}, ...]}, ...]}
 
-    jobs = (
-        db.query(Job)
-        .options(joinedload(Job.branch))
-        .filter(Job.workflow_id == workflow_id, Job.user_id == user_id)
-        .order_by(Job.branch_id, Job.order_index)
-        .all()
+    Everything is validated and laid out in memory first (ids, branch order indexes),
+    then written with one bulk insert per table and a single commit; nothing is written
+    if any part is invalid. Returns the created ids, in spec order.
+
+    A concurrent submission to the same branches (same new branch name, same tail
+    position) makes the insert fail on a unique constraint; it is laid out again.
+    """
+    for attempt in range(job_repo.JOB_APPEND_RETRIES):
+        try:
+            return await _submit_workflows(db, user_id, specs)
+        except IntegrityError:
+            await db.rollback()
+            if attempt == job_repo.JOB_APPEND_RETRIES - 1:
+                raise
+
+async def _submit_workflows(db: AsyncSession, user_id: str, specs: List[dict]) -> List[dict]:
+    existing = await workflow_repo.get_workflows_by_ids(
+        db, {s["workflow_id"] for s in specs if s.get("workflow_id")}, user_id
     )
+    for s in specs:
+        if s.get("workflow_id") and s["workflow_id"] not in existing:
+            raise ValueError(f"Workflow {s['workflow_id']} not found")
+        if not s.get("workflow_id") and not s.get("name"):
+            raise ValueError("A new workflow needs a name")
+
+    known_branches = await job_repo.get_branches(db, set(existing))
+    tails = await job_repo.get_branch_tails(db, {b.id for b in known_branches.values()})
+    # fail-fast: jobs appended behind a FAILED / CANCELLED tail are cancelled on insert
+    blocked = {b for b, (_, status) in tails.items() if status in (JobStatus.FAILED, JobStatus.CANCELLED)}
+    tails = {b: index for b, (index, _) in tails.items()}
+
+    now = datetime.utcnow()
+    wf_rows, branch_rows, job_rows = [], [], []
+    result = []
+    branch_ids = {}   # (workflow_id, name) -> branch_id, for names repeated within the batch
+    for s in specs:
+        if s.get("workflow_id"):
+            wf_id = s["workflow_id"]
+        else:
+            wf_id = str(uuid.uuid4())
+            wf_rows.append({
+                "id": wf_id, "user_id": user_id, "name": s["name"],
+                "weight": s.get("weight", 1.0), "created_at": now,
+            })
+        wf_result = {"workflow_id": wf_id, "name": s.get("name") or existing.get(wf_id).name, "branches": []}
+
+        for b in s.get("branches", []):
+            key = (wf_id, b["name"])
+            if key not in branch_ids:
+                known = known_branches.get(key)
+                if known is not None:
+                    branch_ids[key] = known.id
+                else:
+                    branch_ids[key] = str(uuid.uuid4())
+                    branch_rows.append({"id": branch_ids[key], "workflow_id": wf_id, "name": b["name"]})
+            branch_id = branch_ids[key]
+
+            job_ids = []
+            for j in b["jobs"]:
+                index = tails.get(branch_id, -1) + 1
+                tails[branch_id] = index
+                job_id = str(uuid.uuid4())
+                job_rows.append({
+                    "id": job_id, "workflow_id": wf_id, "branch_id": branch_id, "user_id": user_id,
+                    "type": JobType(j["job_type"]),
+                    "input_path": j["input_path"], "output_path": j["output_path"],
+                    "params": j.get("params"),
+                    "status": JobStatus.CANCELLED if branch_id in blocked else JobStatus.PENDING,
+                    "progress": 0.0, "order_index": index, "created_at": now,
+                    "finished_at": now if branch_id in blocked else None,
+                })
+                job_ids.append(job_id)
+            wf_result["branches"].append({"branch_id": branch_id, "name": b["name"], "job_ids": job_ids})
+        result.append(wf_result)
+
+    await job_repo.bulk_insert(db, workflows=wf_rows, branches=branch_rows, jobs=job_rows)
+
+    for row in job_rows:
+        event_bus.job_status(
+            row["id"], row["workflow_id"], user_id, row["status"], progress=0.0,
+            branch_id=row["branch_id"], order_index=row["order_index"],
+        )
+    return result
+
+async def get_workflow_status_snapshot(db: AsyncSession, user_id: str, workflow_id: str) -> StatusSnapshot:
+    """
+    Versioned status (ETag, payload, serialized body), served from the materialized view.
+    """
+    return await workflow_status_cache.get(db, user_id, workflow_id)
 
-    if not jobs:
-        return {
-            "workflow_id": workflow_id,
-            "status": "EMPTY",
-            "progress": 0.0,
-            "jobs": [],
-        }
-
-    
-    progresses = [j.progress or 0.0 for j in jobs]
-    avg_progress = sum(progresses) / len(jobs) if jobs else 0.0
-
-    
-    if any(j.status == JobStatus.RUNNING for j in jobs):
-        wf_status = "RUNNING"
-    elif any(j.status == JobStatus.PENDING for j in jobs):
-        
-        wf_status = "PENDING"
-    elif any(j.status == JobStatus.FAILED for j in jobs):
-        wf_status = "FAILED"
-    elif any(j.status == JobStatus.CANCELLED for j in jobs):
-        wf_status = "CANCELLED"
-    else:
-        wf_status = "SUCCEEDED"
-
-    return {
-        "workflow_id": workflow_id,
-        "status": wf_status,
-        "progress": avg_progress,
-        "jobs": [
-            {
-                "job_id": j.id,
-                "branch_id": j.branch_id,
-                "branch_name": j.branch.name if j.branch else "unknown", 
-                "order_index": j.order_index,
-                "type": j.type.value if j.type else None,
-                "status": j.status.value if j.status else None,
-                "progress": j.progress or 0.0,
-                "input_path": j.input_path,
-                "output_path": j.output_path, 
-            }
-            for j in jobs
-        ],
-    }
\ No newline at end of file
+async def get_workflow_status(db: AsyncSession, user_id: str, workflow_id: str):
+    return (await workflow_status_cache.get(db, user_id, workflow_id)).payload
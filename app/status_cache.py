@@ -0,0 +1,251 @@
+# app/status_cache.py
+
+"""
+    Materialized workflow status for GET /workflows/{id}.
+
+    A workflow is loaded from the DB once; after that its view is kept current from
+    the event bus (job transitions and progress reports), with per-status counts and
+    a progress sum updated incrementally. Every change stamps the view with a new
+    version, and the serialized payload is cached for that version, so repeated
+    reads of an unchanged workflow cost a dict lookup, and a client sending the
+    version's ETag back gets a 304 without the jobs table being queried.
+
+    Versions come from one process-wide sequence, so a view that is evicted and
+    reloaded never reuses an old version; the ETag also carries a per-process epoch.
+    Views are LRU-bounded by STATUS_CACHE_MAX_WORKFLOWS. With several scheduler
+    replicas, the ChangeFeed (app/change_feed.py) publishes the other replicas'
+    transitions of cached workflows here within REPLICA_SYNC_INTERVAL, and every
+    view is reloaded after STATUS_CACHE_MAX_AGE seconds regardless.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from .models import Job, JobStatus
+from .repositories import workflow_repo
+from .progress import progress_tracker
+from .events import event_bus
+from . import config
+
+
+def workflow_state(counts: Counter, total: int) -> str:
+    if not total:
+        return "EMPTY"
+    for status in ("RUNNING", "PENDING", "FAILED", "CANCELLED"):
+        if counts[status]:
+            return status
+    return "SUCCEEDED"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return any((t[2:] if t.startswith("W/") else t) == etag for t in tags)
+
+
+class StatusSnapshot(NamedTuple):
+    etag: str
+    payload: dict  # shared, do not mutate
+    body: bytes
+
+
+class _WorkflowView:
+    def __init__(self, workflow_id: str, user_id: str, rows: List[dict], version: int) -> None:
+        self.workflow_id = workflow_id
+        self.user_id = user_id
+        self.rows = rows  # payload job rows, in (branch_id, order_index) order
+        self.by_id: Dict[str, dict] = {r["job_id"]: r for r in rows}
+        self.counts: Counter = Counter(r["status"] for r in rows)
+        self.progress_sum = sum(r["progress"] for r in rows)
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._built: Optional[StatusSnapshot] = None
+
+    def set_status(self, row: dict, status: str) -> None:
+        self.counts[row["status"]] -= 1
+        self.counts[status] += 1
+        row["status"] = status
+
+    def set_progress(self, row: dict, progress: float) -> None:
+        self.progress_sum += progress - row["progress"]
+        row["progress"] = progress
+
+    def snapshot(self, epoch: str) -> StatusSnapshot:
+        built = self._built
+        etag = f'"{epoch}-{self.version}"'
+        if built is None or built.etag != etag:
+            total = len(self.rows)
+            payload = {
+                "workflow_id": self.workflow_id,
+                "status": workflow_state(self.counts, total),
+                "progress": self.progress_sum / total if total else 0.0,
+                "jobs": [dict(r) for r in self.rows],
+            }
+            built = self._built = StatusSnapshot(etag, payload, json.dumps(payload).encode())
+        return built
+
+
+class WorkflowStatusCache:
+    def __init__(self, max_workflows: int, max_age: Optional[float] = None) -> None:
+        self.max_workflows = max_workflows
+        self.max_age = max_age
+        self._epoch = uuid.uuid4().hex[:8]
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._views: "OrderedDict[str, _WorkflowView]" = OrderedDict()  # LRU first
+        self._job_workflow: Dict[str, str] = {}
+        # workflow_id -> flags of loads in flight, set when an event arrives meanwhile
+        self._loading: Dict[str, List[list]] = {}
+        self.hits = 0
+        self.loads = 0
+
+    # --- reads ---
+
+    async def get(self, db: AsyncSession, user_id: str, workflow_id: str) -> StatusSnapshot:
+        """
+        Current status of a workflow owned by user_id. Raises ValueError if there is none.
+        """
+        with self._lock:
+            view = self._views.get(workflow_id)
+            if view is not None and self.max_age is not None and time.monotonic() - view.loaded_at > self.max_age:
+                self._invalidate(workflow_id)
+                view = None
+            if view is not None:
+                if view.user_id != user_id:
+                    raise ValueError("Workflow not found")
+                self._views.move_to_end(workflow_id)
+                self.hits += 1
+                return view.snapshot(self._epoch)
+            flag = [False]
+            self._loading.setdefault(workflow_id, []).append(flag)
+
+        try:
+            rows = await self._load(db, user_id, workflow_id)
+        finally:
+            with self._lock:
+                flags = self._loading[workflow_id]
+                flags.remove(flag)
+                if not flags:
+                    del self._loading[workflow_id]
+
+        with self._lock:
+            self.loads += 1
+            view = _WorkflowView(workflow_id, user_id, rows, next(self._seq))
+            if not flag[0] and workflow_id not in self._views:
+                self._install(view)
+            # else: changed while loading; serve it, but let the next read reload
+            return view.snapshot(self._epoch)
+
+    async def _load(self, db: AsyncSession, user_id: str, workflow_id: str) -> List[dict]:
+        wf = await workflow_repo.get_workflow_by_id(db, workflow_id, user_id)
+        if not wf:
+            raise ValueError("Workflow not found")
+
+        jobs = (await db.scalars(
+            select(Job)
+            .options(joinedload(Job.branch))
+            .where(Job.workflow_id == workflow_id, Job.user_id == user_id)
+            .order_by(Job.branch_id, Job.order_index)
+        )).all()
+
+        # running jobs: latest progress from the in-memory tracker (the DB copy lags by up to a flush interval)
+        def job_progress(j):
+            state = progress_tracker.get(j.id) if j.status == JobStatus.RUNNING else None
+            return state["progress"] if state else (j.progress or 0.0)
+
+        return [
+            {
+                "job_id": j.id,
+                "branch_id": j.branch_id,
+                "branch_name": j.branch.name if j.branch else "unknown",
+                "order_index": j.order_index,
+                "type": j.type.value if j.type else None,
+                "status": j.status.value if j.status else None,
+                "progress": job_progress(j),
+                "input_path": j.input_path,
+                "output_path": j.output_path,
+            }
+            for j in jobs
+        ]
+
+    def _install(self, view: _WorkflowView) -> None:
+        self._views[view.workflow_id] = view
+        for job_id in view.by_id:
+            self._job_workflow[job_id] = view.workflow_id
+        while len(self._views) > self.max_workflows:
+            _, old = self._views.popitem(last=False)
+            self._drop_jobs(old)
+
+    def _drop_jobs(self, view: _WorkflowView) -> None:
+        for job_id in view.by_id:
+            self._job_workflow.pop(job_id, None)
+
+    def invalidate(self, workflow_id: str) -> None:
+        with self._lock:
+            self._invalidate(workflow_id)
+
+    def _invalidate(self, workflow_id: str) -> None:
+        view = self._views.pop(workflow_id, None)
+        if view is not None:
+            self._drop_jobs(view)
+        for flag in self._loading.get(workflow_id, ()):
+            flag[0] = True
+
+    # --- updates (event bus listener) ---
+
+    def apply(self, event: dict) -> None:
+        kind = event.get("event")
+        with self._lock:
+            if kind == "job":
+                workflow_id = event["workflow_id"]
+                view = self._views.get(workflow_id)
+                if view is None:
+                    for flag in self._loading.get(workflow_id, ()):
+                        flag[0] = True
+                    return
+                row = view.by_id.get(event["job_id"])
+                if row is None:
+                    # a new job: its branch name and paths are not in the event, reload
+                    self._invalidate(workflow_id)
+                    return
+                view.set_status(row, event["status"])
+                if event.get("progress") is not None:
+                    view.set_progress(row, event["progress"])
+                view.version = next(self._seq)
+
+            elif kind == "progress":
+                workflow_id = self._job_workflow.get(event["job_id"])
+                view = self._views.get(workflow_id) if workflow_id else None
+                if view is None:
+                    return
+                row = view.by_id[event["job_id"]]
+                if row["status"] != "RUNNING" or row["progress"] == event["progress"]:
+                    return
+                view.set_progress(row, event["progress"])
+                view.version = next(self._seq)
+
+    def workflow_ids(self) -> Set[str]:
+        with self._lock:
+            return set(self._views)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workflows": len(self._views), "hits": self.hits, "loads": self.loads}
+
+
+workflow_status_cache = WorkflowStatusCache(config.STATUS_CACHE_MAX_WORKFLOWS, config.STATUS_CACHE_MAX_AGE)
+event_bus.add_listener(workflow_status_cache.apply)
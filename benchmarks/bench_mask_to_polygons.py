@@ -0,0 +1,80 @@
+# benchmarks/bench_mask_to_polygons.py
+
+"""
+    Microbenchmark: bbox-crop mask_to_polygons vs. the original per-label full-frame scan.
+
+    python -m benchmarks.bench_mask_to_polygons
+"""
+
+import time
+
+import numpy as np
+import cv2
+
+from app.image_tasks.polygons import mask_to_polygons
+
+
+TILE_SIZE = 512
+
+
+def mask_to_polygons_full_scan(mask_array, offset_x, offset_y):
+    # original implementation: one full-tile comparison + findContours per cell id
+    polygons = []
+    cell_ids = np.unique(mask_array)
+    
+    for cid in cell_ids:
+        if cid == 0: continue 
+        
+        binary = (mask_array == cid).astype(np.uint8)
+        
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        for contour in contours:
+            if len(contour) < 3: continue 
+            
+            points = []
+            for pt in contour:
+                px, py = pt[0]
+                points.append([int(px + offset_x), int(py + offset_y)])
+            
+            if len(points) >= 3:
+                polygons.append(points)
+    return polygons
+
+
+def synthetic_labels(n_cells, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = np.zeros((TILE_SIZE, TILE_SIZE), np.int32)
+    yy, xx = np.ogrid[:TILE_SIZE, :TILE_SIZE]
+    for cid in range(1, n_cells + 1):
+        cy, cx = rng.integers(0, TILE_SIZE, 2)
+        r = rng.integers(3, 9)
+        labels[(yy - cy) ** 2 + (xx - cx) ** 2 < r * r] = cid
+    return labels
+
+
+def _time(fn, labels, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(labels, 10_000, 20_000)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(repeat=5):
+    print(f"{'cells':>6} {'full scan (ms)':>15} {'bbox crop (ms)':>15} {'speedup':>8}")
+    for n_cells in (50, 200, 500, 1000):
+        labels = synthetic_labels(n_cells)
+
+        old = mask_to_polygons_full_scan(labels, 10_000, 20_000)
+        new = [p.tolist() for p in mask_to_polygons(labels, 10_000, 20_000)]
+        assert old == new, "polygon mismatch"
+
+        t_old = _time(mask_to_polygons_full_scan, labels, repeat)
+        t_new = _time(mask_to_polygons, labels, repeat)
+        print(f"{n_cells:>6} {t_old * 1e3:>15.2f} {t_new * 1e3:>15.2f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# benchmarks/bench_multi_replica.py
+
+"""
+    Several scheduler replicas sharing one database queue.
+
+    Seeds USERS x WORKFLOWS_PER_USER branches of JOBS_PER_BRANCH jobs, starts N
+    replica processes (each a Scheduler with its own worker slots, no API) and lets
+    them drain the queue. Job bodies are replaced by short sleeps, so what is measured
+    is claiming, leases and slot admission, not image processing.
+
+    From the executions every replica records, it then checks that
+      - every job ran once (a replica killed with --kill may leave a job to be re-run),
+      - no two jobs of a branch overlapped,
+      - no more than MAX_ACTIVE_USERS users had jobs running at the same time.
+
+    The default SQLite database has no row locks, so FOR UPDATE SKIP LOCKED claims are
+    only really raced against PostgreSQL (the table layout is created if missing,
+    existing jobs are left alone); --require-postgres refuses to run on anything else:
+    DATABASE_URL=postgresql://localhost/scheduler python -m benchmarks.bench_multi_replica --replicas 4 --kill --require-postgres
+    or, against the compose database: docker compose --profile bench run --rm bench-replicas
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+_tmp = tempfile.mkdtemp(prefix="bench_replicas_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/bench.db")
+
+from sqlalchemy import func, inspect, select
+
+from app import config
+from app.db import SessionLocal, create_tables, engine
+from app.models import Job, JobStatus, JobType
+from app.repositories import job_repo
+
+
+USERS = 6
+WORKFLOWS_PER_USER = 4
+JOBS_PER_BRANCH = 4
+JOB_SECONDS = 0.05
+
+
+async def _seed(run_id):
+    workflows, branches, jobs = [], [], []
+    for u in range(USERS):
+        user_id = f"{run_id}-user-{u}"
+        for w in range(WORKFLOWS_PER_USER):
+            workflow_id, branch_id = str(uuid.uuid4()), str(uuid.uuid4())
+            workflows.append({"id": workflow_id, "user_id": user_id, "name": f"wf-{w}"})
+            branches.append({"id": branch_id, "workflow_id": workflow_id, "name": "main"})
+            jobs.extend(
+                {
+                    "id": str(uuid.uuid4()), "workflow_id": workflow_id, "branch_id": branch_id,
+                    "user_id": user_id, "type": JobType.PREVIEW_DOWNSAMPLE,
+                    "input_path": "missing.png", "output_path": f"{_tmp}/out.png",
+                    "params": {"cache": False}, "status": JobStatus.PENDING,
+                    "progress": 0.0, "order_index": i,
+                }
+                for i in range(JOBS_PER_BRANCH)
+            )
+    async with SessionLocal() as db:
+        await job_repo.bulk_insert(db, workflows=workflows, branches=branches, jobs=jobs)
+    return {j["id"] for j in jobs}
+
+
+async def _remaining(run_id):
+    async with SessionLocal() as db:
+        return await db.scalar(
+            select(func.count(Job.id)).where(
+                Job.user_id.like(f"{run_id}-%"),
+                Job.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+            )
+        )
+
+
+def _replica(index, run_id, log_path, lease_seconds):
+    config.JOB_LEASE_SECONDS = lease_seconds
+    config.LEASE_HEARTBEAT_INTERVAL = lease_seconds / 4
+    config.SCHEDULER_SWEEP_INTERVAL = 0.2  # no API in this process to wake it on new work
+    from app import scheduler as scheduler_module
+
+    log = open(log_path, "a", buffering=1)
+
+    async def simulated_job(db, job, run_shards=None):
+        start = time.time()
+        await asyncio.sleep(JOB_SECONDS)
+        log.write(json.dumps({
+            "job": job.id, "branch": job.branch_id, "user": job.user_id,
+            "replica": index, "start": start, "end": time.time(),
+        }) + "\n")
+
+    scheduler_module.execute_job = simulated_job
+
+    async def run():
+        scheduler = scheduler_module.Scheduler()
+        await scheduler.recover()
+        loop = asyncio.create_task(scheduler.start())
+        while await _remaining(run_id):
+            await asyncio.sleep(0.2)
+        await scheduler.stop()
+        await loop
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def _check(executions, job_ids, killed):
+    runs = defaultdict(list)
+    for e in executions:
+        runs[e["job"]].append(e)
+    missing = job_ids - set(runs)
+    repeated = [
+        job for job, rs in runs.items()
+        if len(rs) > 1 and not any(r["replica"] == killed for r in rs)
+    ]
+
+    overlaps = 0
+    by_branch = defaultdict(list)
+    for e in executions:
+        by_branch[e["branch"]].append(e)
+    for rs in by_branch.values():
+        rs.sort(key=lambda r: r["start"])
+        overlaps += sum(1 for a, b in zip(rs, rs[1:]) if b["start"] < a["end"])
+
+    # sweep over start/end points: distinct users running at once
+    points = sorted(
+        [(e["start"], 1, e["user"]) for e in executions] + [(e["end"], -1, e["user"]) for e in executions],
+        key=lambda p: (p[0], p[1]),
+    )
+    running, peak_users = defaultdict(int), 0
+    for _, delta, user in points:
+        running[user] += delta
+        if not running[user]:
+            del running[user]
+        peak_users = max(peak_users, len(running))
+
+    return missing, repeated, overlaps, peak_users
+
+
+def _logged(path, n):
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        return sum(1 for _ in f) >= n
+
+
+async def _prepare():
+    await create_tables()
+    # create_all does not touch an existing table: check the branch index is really there
+    async with engine.connect() as conn:
+        indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("jobs")})
+    run_id = uuid.uuid4().hex[:8]
+    job_ids = await _seed(run_id)
+    await engine.dispose()
+    return run_id, job_ids, indexes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--kill", action="store_true", help="SIGKILL one replica mid-run")
+    parser.add_argument("--lease", type=float, default=2.0, help="JOB_LEASE_SECONDS for the run")
+    parser.add_argument("--require-postgres", action="store_true", help="fail unless DATABASE_URL is PostgreSQL")
+    args = parser.parse_args()
+
+    dialect = engine.dialect.name
+    if args.require_postgres and dialect != "postgresql":
+        parser.error(f"DATABASE_URL is {dialect}, not postgresql")
+    print(f"database: {dialect}" + ("" if dialect == "postgresql" else " (no row locks, SKIP LOCKED is not exercised)"))
+
+    run_id, job_ids, indexes = asyncio.run(_prepare())
+    if "ux_jobs_branch_running" not in indexes:
+        print("jobs table has no ux_jobs_branch_running index (created by an older version?)")
+    log_dir = tempfile.mkdtemp(prefix="replica_logs_")
+    ctx = multiprocessing.get_context("spawn")
+    t0 = time.perf_counter()
+    procs = [
+        ctx.Process(target=_replica, args=(i, run_id, f"{log_dir}/{i}.jsonl", args.lease))
+        for i in range(args.replicas)
+    ]
+    for p in procs:
+        p.start()
+
+    killed = None
+    if args.kill:
+        # mid-run: once replica 0 has finished a few jobs it very likely holds others
+        while procs[0].is_alive() and not _logged(f"{log_dir}/0.jsonl", 3):
+            time.sleep(0.01)
+        killed = 0
+        os.kill(procs[0].pid, signal.SIGKILL)
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - t0
+
+    executions = []
+    for i in range(args.replicas):
+        path = f"{log_dir}/{i}.jsonl"
+        if os.path.exists(path):
+            with open(path) as f:
+                executions.extend(json.loads(line) for line in f if line.strip())
+
+    missing, repeated, overlaps, peak_users = _check(executions, job_ids, killed)
+    per_replica = defaultdict(int)
+    for e in executions:
+        per_replica[e["replica"]] += 1
+
+    print(f"{len(job_ids)} jobs, {args.replicas} replicas, {elapsed:.1f} s ({len(job_ids) / elapsed:.0f} jobs/s)")
+    print(f"executions per replica: {dict(sorted(per_replica.items()))}")
+    print(f"never ran: {len(missing)}, ran twice: {len(repeated)}, branch overlaps: {overlaps}, "
+          f"peak concurrent users: {peak_users} (limit {config.MAX_ACTIVE_USERS})")
+    ok = (
+        not missing and not repeated and not overlaps and peak_users <= config.MAX_ACTIVE_USERS
+        and "ux_jobs_branch_running" in indexes
+    )
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
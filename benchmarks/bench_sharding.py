@@ -0,0 +1,131 @@
+# benchmarks/bench_sharding.py
+
+"""
+    One instanseg job on a slide, unsharded vs. split into shards by the scheduler.
+
+    The node budget is set to exactly what the job is estimated to need, so shards can
+    only start if they share the parent's demand instead of each asking for all of it.
+    Tile reads are replaced by a fixed per-tile latency (slide on network storage) and
+    inference by a short sleep in the pool processes, so what is measured is how well
+    the shards' pipelines overlap, not the model.
+
+    python -m benchmarks.bench_sharding --shards 4
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+_tmp = tempfile.mkdtemp(prefix="bench_sharding_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/bench.db")
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import select
+
+from app.db import SessionLocal, create_tables, engine
+from app.models import Job, JobStatus, JobType
+from app.repositories import job_repo
+from app.resources import ResourceBudget, estimate
+from app.image_tasks import instanseg_seg, worker_pool
+from app.image_tasks.slide_pool import open_slide
+
+
+SLIDE_SIZE = 4096     # 8 x 8 tiles
+READ_SECONDS = 0.02   # per tile
+INFER_SECONDS = 0.05  # per batch
+
+
+def _simulated_load():
+    pass
+
+
+def _simulated_segment(tiles, images):
+    time.sleep(INFER_SECONDS)
+    return [[] for _ in tiles]
+
+
+def _simulated_read(slide, tiles):
+    time.sleep(READ_SECONDS * len(tiles))
+    return [np.zeros((th, tw, 3), dtype=np.uint8) for _, _, tw, th in tiles]
+
+
+async def _seed(slide_path, shards):
+    workflow_id, branch_id, job_id = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+    user_id = f"bench-{job_id[:8]}"
+    async with SessionLocal() as db:
+        await job_repo.bulk_insert(
+            db,
+            workflows=[{"id": workflow_id, "user_id": user_id, "name": "sharding"}],
+            branches=[{"id": branch_id, "workflow_id": workflow_id, "name": "main"}],
+            jobs=[{
+                "id": job_id, "workflow_id": workflow_id, "branch_id": branch_id,
+                "user_id": user_id, "type": JobType.INSTANTSEG_CELL_SEG,
+                "input_path": slide_path, "output_path": f"{_tmp}/{job_id}.json",
+                "params": {"shards": shards, "cache": False, "checkpoint": False, "tissue_filter": False},
+                "status": JobStatus.PENDING, "progress": 0.0, "order_index": 0,
+            }],
+        )
+        return await db.get(Job, job_id)
+
+
+async def _run(scheduler_module, slide_path, shards):
+    job = await _seed(slide_path, shards)
+    scheduler = scheduler_module.Scheduler()
+    demand = estimate(job)
+    scheduler.budget = ResourceBudget(demand.cpus, demand.memory_mb)
+    await scheduler.recover()
+
+    t0 = time.perf_counter()
+    loop = asyncio.create_task(scheduler.start())
+    while True:
+        await asyncio.sleep(0.05)
+        async with SessionLocal() as db:
+            status = await db.scalar(select(Job.status).where(Job.id == job.id))
+        if status not in (JobStatus.PENDING, JobStatus.RUNNING):
+            break
+    elapsed = time.perf_counter() - t0
+    await scheduler.stop()
+    await loop
+    return status, elapsed
+
+
+async def _main(shards):
+    instanseg_seg.load_model = _simulated_load
+    instanseg_seg.segment_images = _simulated_segment
+    instanseg_seg.read_tiles = _simulated_read
+    from app import scheduler as scheduler_module
+
+    await create_tables()
+    slide_path = f"{_tmp}/slide.png"
+    Image.new("RGB", (SLIDE_SIZE, SLIDE_SIZE), (200, 120, 160)).save(slide_path)
+    # start every pool process and build the flat-image pyramid outside the timings
+    await asyncio.gather(*(
+        worker_pool.run_in_pool(_simulated_segment, [], []) for _ in range(worker_pool.pool_size())
+    ))
+    (await asyncio.to_thread(open_slide, slide_path)).close()
+
+    results = {}
+    for n in (1, shards):
+        status, elapsed = await _run(scheduler_module, slide_path, n)
+        results[n] = elapsed
+        print(f"shards={n}: {status.value} in {elapsed:.2f} s")
+    print(f"speedup: {results[1] / results[shards]:.2f}x "
+          f"(pool of {worker_pool.pool_size()} processes, budget = one job's demand)")
+
+    worker_pool.shutdown()
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(_main(args.shards))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/bench_status_polling.py
+
+"""
+    Load test: request latency of dashboard-style polling under concurrency, and how
+    long the event loop is blocked meanwhile (which is what running jobs feel).
+
+    Each client repeatedly lists its workflows and reads one workflow's status.
+    The app is driven in-process over ASGI, against a throwaway SQLite file (or
+    DATABASE_URL if set), without the scheduler.
+
+    python -m benchmarks.bench_status_polling
+"""
+
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_polling_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/bench.db")
+
+import httpx
+
+from app.db import create_tables
+from app.main import app
+
+
+USERS = 20
+WORKFLOWS_PER_USER = 10
+JOBS = [("tissue_mask", "mask.png"), ("instanseg_cell_seg", "cells.json"), ("preview_downsample", "thumb.png")]
+
+
+async def _seed(client):
+    targets = []
+    for u in range(USERS):
+        headers = {"X-User-ID": f"bench-user-{u}"}
+        spec = {"workflows": [
+            {"name": f"wf-{w}", "branches": [{"name": "main", "jobs": [
+                {"job_type": t, "input_path": f"data/slide-{w}.svs", "output_path": f"outputs/{u}-{w}-{out}"}
+                for t, out in JOBS
+            ]}]}
+            for w in range(WORKFLOWS_PER_USER)
+        ]}
+        r = await client.post("/api/workflows/bulk", json=spec, headers=headers)
+        r.raise_for_status()
+        targets.append((headers, r.json()["workflows"][0]["workflow_id"]))
+    return targets
+
+
+async def _client(client, headers, workflow_id, requests, latencies):
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        r = await client.get("/api/workflows", headers=headers)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        r = await client.get(f"/api/workflows/{workflow_id}", headers=headers)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+
+
+async def _loop_lag(stop, lags, interval=0.005):
+    # a stand-in for job tasks: how late does a 5 ms timer fire?
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t0 - interval)
+
+
+def _pct(values, q):
+    return sorted(values)[min(len(values) - 1, int(q * len(values)))] * 1e3
+
+
+async def main(concurrency=(1, 10, 50), requests=20):
+    await create_tables()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        targets = await _seed(client)
+
+        print(f"{'clients':>7} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'loop lag max (ms)':>18}")
+        for n in concurrency:
+            latencies, lags = [], []
+            stop = asyncio.Event()
+            ticker = asyncio.create_task(_loop_lag(stop, lags))
+            t0 = time.perf_counter()
+            await asyncio.gather(*(
+                _client(client, *targets[i % len(targets)], requests, latencies) for i in range(n)
+            ))
+            elapsed = time.perf_counter() - t0
+            stop.set()
+            await ticker
+            print(
+                f"{n:>7} {len(latencies) / elapsed:>8.0f} {statistics.median(latencies) * 1e3:>9.1f} "
+                f"{_pct(latencies, 0.95):>9.1f} {_pct(latencies, 0.99):>9.1f} {max(lags) * 1e3:>18.1f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,8 @@
+# tests/conftest.py
+
+import os
+import tempfile
+
+# before anything imports app.db: a throwaway SQLite file per test session
+_tmp = tempfile.mkdtemp(prefix="scheduler_tests_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
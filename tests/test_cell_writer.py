@@ -0,0 +1,70 @@
+# tests/test_cell_writer.py
+
+"""
+    CellWriter checkpoints: an interrupted run resumes after its last checkpointed
+    batch, cells written after it are dropped, and failed tiles block publishing.
+"""
+
+import numpy as np
+import pytest
+
+from app.image_tasks.cell_writer import CellWriter, iter_cells, read_metadata
+
+
+KEY = {"input": "slide.svs", "tile_size": 512}
+
+
+def _square(x, y):
+    return np.array([[x, y], [x + 4, y], [x + 4, y + 4], [x, y + 4]])
+
+
+def test_interrupted_run_resumes_after_the_last_checkpoint(tmp_path):
+    output = str(tmp_path / "cells.ndjson")
+    tiles = [(0, 0, 512, 512), (512, 0, 512, 512), (0, 512, 512, 512)]
+
+    writer = CellWriter(output, {"slide": "slide.svs"}, checkpoint_key=KEY)
+    writer.write_polygons([_square(1, 1), _square(10, 10)])
+    writer.checkpoint(tiles[:1])
+    writer.write_polygons([_square(600, 1)])  # written, never checkpointed
+    writer.abort()
+
+    resumed = CellWriter(output, {"slide": "slide.svs"}, checkpoint_key=KEY)
+    assert resumed.done_tiles == {tiles[0]} and resumed.cell_count == 2
+    for tile, x in zip(tiles[1:], (600, 1)):
+        resumed.write_polygons([_square(x, tile[1] + 1)])
+        resumed.checkpoint([tile])
+    resumed.commit()
+
+    cells = list(iter_cells(output))
+    assert [c["id"] for c in cells] == [1, 2, 3, 4]
+    assert [c["bbox"][:2] for c in cells] == [[1, 1], [10, 10], [600, 1], [1, 513]]
+    assert read_metadata(output) == {"slide": "slide.svs"}
+    assert not (tmp_path / "cells.ndjson.ckpt").exists() and not (tmp_path / "cells.ndjson.part").exists()
+
+
+def test_checkpoint_of_another_input_is_ignored(tmp_path):
+    output = str(tmp_path / "cells.ndjson")
+    writer = CellWriter(output, {}, checkpoint_key=KEY)
+    writer.write_polygons([_square(1, 1)])
+    writer.checkpoint([(0, 0, 512, 512)])
+    writer.abort()
+
+    fresh = CellWriter(output, {}, checkpoint_key={**KEY, "input": "other.svs"})
+    assert fresh.done_tiles == set() and fresh.cell_count == 0
+    fresh.abort()
+
+
+def test_failed_tiles_block_publishing_and_keep_the_checkpoint(tmp_path):
+    output = str(tmp_path / "cells.ndjson")
+    writer = CellWriter(output, {}, checkpoint_key=KEY)
+    writer.write_polygons([_square(1, 1)])
+    writer.checkpoint([(0, 0, 512, 512)])
+    writer.mark_failed([(512, 0, 512, 512)])
+    with pytest.raises(RuntimeError):
+        writer.commit()
+    writer.abort()
+
+    assert not (tmp_path / "cells.ndjson").exists()
+    resumed = CellWriter(output, {}, checkpoint_key=KEY)
+    assert resumed.done_tiles == {(0, 0, 512, 512)}
+    resumed.abort()
@@ -0,0 +1,102 @@
+# tests/test_fail_fast.py
+
+"""
+    A job appended to a branch whose tail fails at the same moment must not be left
+    PENDING behind the failure: the append and the fail-fast cascade both lock the
+    branch, so one of them cancels it.
+"""
+
+import asyncio
+import sqlite3
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete, event, update
+
+from app.db import SessionLocal, create_tables, engine
+from app.models import Branch, Job, JobStatus, JobType, UserSlot, Workflow
+from app.repositories import job_repo
+
+
+async def _seed_running_tail():
+    await create_tables()
+    async with SessionLocal() as db:
+        for model in (Job, Branch, Workflow):
+            await db.execute(delete(model))
+        await db.execute(update(UserSlot).values(user_id=None, admitted_at=None))
+        await db.commit()
+
+    workflow_id, branch_id, tail_id = str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4())
+    async with SessionLocal() as db:
+        await job_repo.bulk_insert(
+            db,
+            workflows=[{"id": workflow_id, "user_id": "u", "name": "wf"}],
+            branches=[{"id": branch_id, "workflow_id": workflow_id, "name": "main"}],
+            jobs=[{
+                "id": tail_id, "workflow_id": workflow_id, "branch_id": branch_id,
+                "user_id": "u", "type": JobType.PREVIEW_DOWNSAMPLE,
+                "input_path": "in.png", "output_path": "out.png",
+                "status": JobStatus.RUNNING, "progress": 0.0, "order_index": 0,
+            }],
+        )
+        return await db.get(Branch, branch_id), tail_id
+
+
+def _fail_from_another_connection(tail_id, branch_id):
+    """
+    What another replica does when the tail fails: mark it FAILED, cascade, commit.
+
+    return whether it got through (False: locked out until the append commits)
+    """
+    con = sqlite3.connect(engine.url.database, timeout=0.2)
+    try:
+        con.execute("UPDATE jobs SET status = 'FAILED' WHERE id = ?", (tail_id,))
+        con.execute(
+            "UPDATE jobs SET status = 'CANCELLED' WHERE branch_id = ? AND order_index > 0 AND status = 'PENDING'",
+            (branch_id,),
+        )
+        con.commit()
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        con.close()
+
+
+def test_append_racing_a_failing_tail_is_cancelled():
+    async def run():
+        branch, tail_id = await _seed_running_tail()
+        failed_during_append = []
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            # the tail was just read as RUNNING: the tail fails before the insert
+            if statement.startswith("SELECT jobs.order_index, jobs.status") and not failed_during_append:
+                failed_during_append.append(_fail_from_another_connection(tail_id, branch.id))
+
+        event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+        try:
+            async with SessionLocal() as db:
+                appended = await job_repo.create_job(
+                    db, workflow_id=branch.workflow_id, branch=branch, user_id="u",
+                    job_type=JobType.PREVIEW_DOWNSAMPLE, input_path="in.png", output_path="out2.png",
+                )
+        finally:
+            event.remove(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+
+        if not failed_during_append[0]:
+            # locked out: the failure lands after the append, as the scheduler does it
+            async with SessionLocal() as db:
+                tail = await job_repo.get_job_by_id(db, tail_id)
+                tail.status = JobStatus.FAILED
+                tail.finished_at = datetime.utcnow()
+                await db.commit()
+                await job_repo.cancel_branch_successors(db, tail.branch_id, tail.order_index)
+
+        async with SessionLocal() as db:
+            status = (await job_repo.get_job_by_id(db, appended.id)).status
+        await engine.dispose()
+        return failed_during_append[0], status
+
+    failed_during_append, status = asyncio.run(run())
+    assert not failed_during_append  # the branch lock held the failure off
+    assert status == JobStatus.CANCELLED
@@ -0,0 +1,60 @@
+# tests/test_instanseg_batching.py
+
+"""
+    Batched inference gives every tile the labels model.eval_small_image gives it alone,
+    whatever the batch size and whatever it is batched with. The network is a scripted
+    threshold on the normalised image, so the labels depend on the preprocessing.
+"""
+
+from typing import Optional
+
+import numpy as np
+import pytest
+
+pytest.importorskip("instanseg.inference_class")
+import instanseg
+import torch
+
+from app.image_tasks import instanseg_seg
+
+
+class _Threshold(torch.nn.Module):
+    def forward(self, x: torch.Tensor, target_segmentation: Optional[torch.Tensor] = None) -> torch.Tensor:
+        return (x.mean(dim=1, keepdim=True) < 0.5).to(torch.int32)
+
+
+def _tile(seed, height=64, width=64):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(180, 256, (height, width, 3)).astype(np.uint8)
+    for cy, cx in rng.integers(4, min(height, width) - 4, (6, 2)):
+        img[cy - 3:cy + 3, cx - 3:cx + 3] = rng.integers(0, 90, 3)
+    return img
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = instanseg.InstanSeg(torch.jit.script(_Threshold()), device="cpu", verbosity=0)
+    monkeypatch.setattr(instanseg_seg, "_model_cache", model)
+    return model
+
+
+def test_batch_of_one_and_batch_of_n_label_a_tile_alike(model):
+    tile = _tile(0)
+    others = [_tile(seed) for seed in range(1, 6)] + [_tile(9, height=40)]  # an edge tile
+
+    alone = model.eval_small_image(tile, return_image_tensor=False)
+    expected = instanseg_seg._label_plane(alone.cpu().numpy())
+
+    single = instanseg_seg._infer_tiles(model, [tile])[0]
+    batched = instanseg_seg._infer_tiles(model, others[:3] + [tile] + others[3:])[3]
+
+    assert expected.any()
+    np.testing.assert_array_equal(single, expected)
+    np.testing.assert_array_equal(batched, expected)
+
+    tiles = [(0, 0, 64, 64), (64, 0, 64, 64)]
+    polygons_single = instanseg_seg.segment_images(tiles[:1], [tile])[0]
+    polygons_batched = instanseg_seg.segment_images(tiles, [tile, others[0]])[0]
+    assert len(polygons_single) == len(polygons_batched) > 0
+    for a, b in zip(polygons_single, polygons_batched):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,62 @@
+# tests/test_quotas.py
+
+"""
+    RunningIndex counters and the per-user / per-workflow / per-type limits.
+"""
+
+import pytest
+
+from app import config
+from app.models import JobType
+from app.quotas import RunningIndex, quota_allows
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(config, "DEFAULT_USER_MAX_CONCURRENCY", 3)
+    monkeypatch.setattr(config, "USER_MAX_CONCURRENCY", {"vip": None})
+    monkeypatch.setattr(config, "DEFAULT_WORKFLOW_MAX_CONCURRENCY", None)
+    monkeypatch.setattr(config, "WORKFLOW_MAX_CONCURRENCY", {"w-small": 1})
+    monkeypatch.setattr(config, "JOB_TYPE_MAX_CONCURRENCY", {JobType.INSTANTSEG_CELL_SEG.value: 2})
+
+
+def test_user_limit_and_override(limits):
+    index = RunningIndex()
+    for i in range(3):
+        index.add(f"j{i}", user_id="u", workflow_id=f"w{i}", job_type=JobType.PREVIEW_DOWNSAMPLE, branch_id=f"b{i}")
+        index.add(f"v{i}", user_id="vip", workflow_id=f"x{i}", job_type=JobType.PREVIEW_DOWNSAMPLE)
+
+    assert not quota_allows(index, "u", "w9", JobType.PREVIEW_DOWNSAMPLE)
+    assert quota_allows(index, "vip", "x9", JobType.PREVIEW_DOWNSAMPLE)  # unlimited
+
+    index.remove("j0")
+    assert quota_allows(index, "u", "w9", JobType.PREVIEW_DOWNSAMPLE)
+    assert not index.branch_running("b0") and index.branch_running("b1")
+
+
+def test_workflow_and_type_limits(limits):
+    index = RunningIndex()
+    index.add("j1", user_id="u1", workflow_id="w-small", job_type=JobType.INSTANTSEG_CELL_SEG, branch_id="b1")
+    assert not quota_allows(index, "u2", "w-small", JobType.PREVIEW_DOWNSAMPLE)
+
+    # a shard counts against the limits but does not own the branch
+    index.add("j1:shard1", user_id="u1", workflow_id="w-other", job_type=JobType.INSTANTSEG_CELL_SEG)
+    assert not quota_allows(index, "u2", "w-big", JobType.INSTANTSEG_CELL_SEG)
+    assert quota_allows(index, "u2", "w-big", JobType.TISSUE_MASK)
+
+    index.remove("j1:shard1")
+    assert index.branch_running("b1")
+    assert index.stats() == {
+        "slots": 1,
+        "by_user": {"u1": 1},
+        "by_workflow": {"w-small": 1},
+        "by_type": {JobType.INSTANTSEG_CELL_SEG.value: 1},
+        "branches": 1,
+    }
+
+
+def test_re_adding_a_key_does_not_double_count(limits):
+    index = RunningIndex()
+    for _ in range(2):
+        index.add("j1", user_id="u", workflow_id="w", job_type=JobType.TISSUE_MASK, branch_id="b")
+    assert index.by_user["u"] == 1 and index.stats()["slots"] == 1
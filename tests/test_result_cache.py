@@ -0,0 +1,91 @@
+# tests/test_result_cache.py
+
+"""
+    ResultCache on its own: keys, hits and misses, LRU eviction, reload from disk.
+"""
+
+import os
+
+import pytest
+
+from app.result_cache import ResultCache
+
+
+def _write(path, size):
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+@pytest.fixture
+def slide(tmp_path):
+    return _write(tmp_path / "slide.png", 64)
+
+
+def test_key_ignores_execution_params(tmp_path, slide):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    key = cache.key_for(str(slide), "INSTANTSEG_CELL_SEG", {"batch_size": 8}, "a.json")
+
+    assert key == cache.key_for(str(slide), "INSTANTSEG_CELL_SEG", {"batch_size": 8, "read_workers": 4}, "b.json")
+    assert key != cache.key_for(str(slide), "INSTANTSEG_CELL_SEG", {"batch_size": 8, "min_tissue_fraction": 0.2}, "a.json")
+    assert key != cache.key_for(str(slide), "TISSUE_MASK", {"batch_size": 8}, "a.json")
+    assert key != cache.key_for(str(slide), "INSTANTSEG_CELL_SEG", {"batch_size": 8}, "a.geojson")
+    assert cache.key_for(str(slide), "INSTANTSEG_CELL_SEG", {"cache": False}, "a.json") is None
+    assert cache.key_for(str(tmp_path / "missing.png"), "INSTANTSEG_CELL_SEG", {}, "a.json") is None
+
+
+def test_key_follows_the_input_content(tmp_path, slide):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1 << 20, hash_content=True)
+    key = cache.key_for(str(slide), "TISSUE_MASK", {}, "m.png")
+    _write(slide, 128)
+    assert cache.key_for(str(slide), "TISSUE_MASK", {}, "m.png") != key
+
+
+def test_hit_places_the_artifacts_and_counts(tmp_path, slide):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    key = cache.key_for(str(slide), "PREVIEW_DOWNSAMPLE", {}, "p.png")
+
+    assert not cache.contains(key)
+    assert not cache.materialize(key, [str(tmp_path / "out1.png")])
+    cache.record_miss()  # what the scheduler does once it computes the job
+
+    result = _write(tmp_path / "computed.png", 100)
+    cache.put(key, [str(result)])
+    assert cache.contains(key)
+    assert cache.materialize(key, [str(tmp_path / "out2.png")])
+    assert (tmp_path / "out2.png").read_bytes() == result.read_bytes()
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert (stats["entries"], stats["bytes"]) == (1, 100)
+
+
+def test_incomplete_results_are_not_stored(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    done = _write(tmp_path / "cells.json", 10)
+    cache.put("k", [str(done), str(tmp_path / "overlay.png")])
+    assert not cache.contains("k")
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    for key in ("a", "b"):
+        cache.put(key, [str(_write(tmp_path / f"{key}.bin", 100))])
+    assert cache.materialize("a", [str(tmp_path / "a-again.bin")])  # b is now least recent
+
+    cache.put("c", [str(_write(tmp_path / "c.bin", 100))])
+    assert cache.contains("a") and cache.contains("c") and not cache.contains("b")
+    assert not os.path.exists(tmp_path / "cache" / "b")
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 200
+
+
+def test_entries_survive_a_restart(tmp_path, slide):
+    root = str(tmp_path / "cache")
+    cache = ResultCache(root, max_bytes=1 << 20)
+    key = cache.key_for(str(slide), "PREVIEW_DOWNSAMPLE", {}, "p.png")
+    cache.put(key, [str(_write(tmp_path / "computed.png", 50))])
+
+    reloaded = ResultCache(root, max_bytes=1 << 20)
+    assert reloaded.key_for(str(slide), "PREVIEW_DOWNSAMPLE", {}, "p.png") == key
+    assert reloaded.materialize(key, [str(tmp_path / "out.png")])
+    assert reloaded.stats()["bytes"] == 50
@@ -0,0 +1,114 @@
+# tests/test_scheduler_queries.py
+
+"""
+    The frontier of runnable jobs is one self-join query, and a scheduling pass issues
+    a fixed number of statements however many branches are queued. Statements are
+    counted with a before_cursor_execute listener on the engine.
+"""
+
+import asyncio
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import delete, event, update
+
+from app.db import SessionLocal, create_tables, engine
+from app.models import Branch, Job, JobStatus, JobType, UserSlot, Workflow
+from app.repositories import job_repo
+from app.result_cache import ResultCache
+
+
+# release_idle_user_slots, get_user_queue_heads, get_admitted_users,
+# get_runnable_jobs, get_workflow_weights
+QUERIES_PER_PASS = 5
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def _reset():
+    await create_tables()
+    async with SessionLocal() as db:
+        for model in (Job, Branch, Workflow):
+            await db.execute(delete(model))
+        await db.execute(update(UserSlot).values(user_id=None, admitted_at=None))
+        await db.commit()
+
+
+async def _seed(users, branches_per_user, jobs_per_branch):
+    """
+    Return the user ids and the ids of the branch heads (order_index 0).
+    """
+    run_id = uuid.uuid4().hex[:8]
+    workflows, branches, jobs, heads = [], [], [], set()
+    user_ids = [f"{run_id}-user-{u}" for u in range(users)]
+    for user_id in user_ids:
+        workflow_id = str(uuid.uuid4())
+        workflows.append({"id": workflow_id, "user_id": user_id, "name": "wf"})
+        for b in range(branches_per_user):
+            branch_id = str(uuid.uuid4())
+            branches.append({"id": branch_id, "workflow_id": workflow_id, "name": f"b{b}"})
+            for i in range(jobs_per_branch):
+                job_id = str(uuid.uuid4())
+                if i == 0:
+                    heads.add(job_id)
+                jobs.append({
+                    "id": job_id, "workflow_id": workflow_id, "branch_id": branch_id,
+                    "user_id": user_id, "type": JobType.PREVIEW_DOWNSAMPLE,
+                    "input_path": "missing.png", "output_path": "out.png",
+                    "params": {"cache": False}, "status": JobStatus.PENDING,
+                    "progress": 0.0, "order_index": i,
+                })
+    async with SessionLocal() as db:
+        await job_repo.bulk_insert(db, workflows=workflows, branches=branches, jobs=jobs)
+    return set(user_ids), heads
+
+
+def test_frontier_is_one_query():
+    async def run():
+        await _reset()
+        users, heads = await _seed(users=2, branches_per_user=20, jobs_per_branch=3)
+        async with SessionLocal() as db:
+            with count_statements() as statements:
+                frontier = await job_repo.get_runnable_jobs(db, allowed_user_ids=users)
+        await engine.dispose()
+        return statements, {j.id for j in frontier}, heads
+
+    statements, frontier, heads = asyncio.run(run())
+    assert len(statements) == 1
+    assert frontier == heads
+
+
+def test_scheduling_pass_query_count_does_not_grow_with_the_queue():
+    from app.scheduler import Scheduler
+
+    async def pass_statements(branches_per_user):
+        await _reset()
+        await _seed(users=2, branches_per_user=branches_per_user, jobs_per_branch=3)
+
+        scheduler = Scheduler(result_cache=ResultCache(tempfile.mkdtemp(), max_bytes=1 << 20))
+        # every worker busy: a pass looks at the whole frontier but starts nothing
+        scheduler.max_workers = 0
+        await scheduler.recover()
+        await scheduler._schedule_once()  # admits the users
+        with count_statements() as statements:
+            await scheduler._schedule_once()
+        await engine.dispose()
+        return statements
+
+    small = asyncio.run(pass_statements(branches_per_user=5))
+    large = asyncio.run(pass_statements(branches_per_user=50))
+    assert len(small) == QUERIES_PER_PASS, small
+    assert len(large) == QUERIES_PER_PASS, large
@@ -0,0 +1,58 @@
+# tests/test_scheduling_policy.py
+
+"""
+    Admission and dispatch order of the scheduling policies, on transient Job objects.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import Job
+from app.scheduling_policy import FairSharePolicy, FifoPolicy, SchedulingPolicy, make_policy
+
+
+T0 = datetime(2026, 1, 1)
+
+
+def _jobs(spec):
+    """
+    spec: (user_id, workflow_id) per job, in creation order
+    """
+    return [
+        Job(id=f"j{i}", user_id=user_id, workflow_id=workflow_id, created_at=T0 + timedelta(seconds=i))
+        for i, (user_id, workflow_id) in enumerate(spec)
+    ]
+
+
+def test_base_policy_is_abstract():
+    with pytest.raises(TypeError):
+        SchedulingPolicy()
+    with pytest.raises(ValueError):
+        make_policy("lottery")
+
+
+def test_fifo_orders_by_creation():
+    jobs = _jobs([("a", "wa")] * 3 + [("b", "wb")] * 2)
+    ordered = FifoPolicy(user_weights={}).order(list(reversed(jobs)), {})
+    assert [j.id for j in ordered] == [j.id for j in jobs]
+
+
+def test_fair_share_interleaves_users_instead_of_draining_one_queue():
+    jobs = _jobs([("a", "wa")] * 4 + [("b", "wb")] * 2)
+    ordered = FairSharePolicy(user_weights={}).order(jobs, {})
+    assert [j.user_id for j in ordered] == ["a", "b", "a", "b", "a", "a"]
+
+
+def test_fair_share_follows_weights():
+    jobs = _jobs([("a", "wa")] * 6 + [("b", "wb")] * 6)
+    ordered = FairSharePolicy(user_weights={"a": 2.0}).order(jobs, {})
+    assert [j.user_id for j in ordered[:6]].count("a") == 4
+
+
+def test_fair_share_admits_the_least_served_user_first():
+    policy = FairSharePolicy(user_weights={})
+    now = datetime.utcnow()
+    policy.load_usage([("a", "wa", now - timedelta(minutes=10), now)])
+    waiting = {"a": T0, "b": T0 + timedelta(hours=1)}
+    assert policy.admit(waiting, slots=1) == ["b"]
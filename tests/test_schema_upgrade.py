@@ -0,0 +1,99 @@
+# tests/test_schema_upgrade.py
+
+"""
+    A database created by the first release (no params / weight / lease columns, no
+    user_slots table, none of the later indexes) is brought up to the models at startup.
+"""
+
+import asyncio
+
+from sqlalchemy import inspect, text
+
+from app.db import Base, SessionLocal, create_tables, engine
+from app.models import Job, JobStatus, Workflow
+from app.repositories import job_repo, workflow_repo
+
+
+# DDL of the first release, as create_all emitted it
+OLD_SCHEMA = [
+    """CREATE TABLE workflows (
+        id VARCHAR NOT NULL, user_id VARCHAR, name VARCHAR, created_at DATETIME,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX ix_workflows_id ON workflows (id)",
+    "CREATE INDEX ix_workflows_user_id ON workflows (user_id)",
+    """CREATE TABLE branches (
+        id VARCHAR NOT NULL, workflow_id VARCHAR, name VARCHAR,
+        PRIMARY KEY (id), FOREIGN KEY(workflow_id) REFERENCES workflows (id)
+    )""",
+    "CREATE INDEX ix_branches_id ON branches (id)",
+    """CREATE TABLE jobs (
+        id VARCHAR NOT NULL, workflow_id VARCHAR, branch_id VARCHAR, user_id VARCHAR,
+        type VARCHAR(19) NOT NULL, input_path VARCHAR, output_path VARCHAR,
+        status VARCHAR(9) NOT NULL, progress FLOAT, order_index INTEGER NOT NULL,
+        total_tiles INTEGER, processed_tiles INTEGER,
+        created_at DATETIME, started_at DATETIME, finished_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(workflow_id) REFERENCES workflows (id),
+        FOREIGN KEY(branch_id) REFERENCES branches (id)
+    )""",
+    "CREATE INDEX ix_jobs_workflow_id ON jobs (workflow_id)",
+    "CREATE INDEX ix_jobs_branch_id ON jobs (branch_id)",
+    "CREATE INDEX ix_jobs_user_id ON jobs (user_id)",
+    "CREATE INDEX ix_jobs_id ON jobs (id)",
+    "INSERT INTO workflows (id, user_id, name) VALUES ('w-old', 'u-old', 'old')",
+    "INSERT INTO branches (id, workflow_id, name) VALUES ('b-old', 'w-old', 'main')",
+    """INSERT INTO jobs (id, workflow_id, branch_id, user_id, type, input_path, output_path,
+                         status, progress, order_index)
+       VALUES ('j-old', 'w-old', 'b-old', 'u-old', 'PREVIEW_DOWNSAMPLE', 'in.png', 'out.png',
+               'PENDING', 0.0, 0)""",
+]
+
+
+def _schema(conn):
+    inspector = inspect(conn)
+    return {
+        name: (
+            {c["name"] for c in inspector.get_columns(name)},
+            {i["name"] for i in inspector.get_indexes(name)},
+        )
+        for name in inspector.get_table_names()
+    }
+
+
+def test_old_database_is_upgraded_in_place():
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            for statement in OLD_SCHEMA:
+                await conn.execute(text(statement))
+
+        await create_tables()
+        await create_tables()  # idempotent
+
+        async with engine.connect() as conn:
+            schema = await conn.run_sync(_schema)
+        async with SessionLocal() as db:
+            job = await db.get(Job, "j-old")
+            weights = await workflow_repo.get_workflow_weights(db, {"w-old"})
+            workflow = await db.get(Workflow, "w-old")
+            frontier = await job_repo.get_runnable_jobs(db, allowed_user_ids={"u-old"})
+
+        # leave a current, empty schema for the other tests
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await create_tables()
+        await engine.dispose()
+        return schema, job, workflow, weights, frontier
+
+    schema, job, workflow, weights, frontier = asyncio.run(run())
+
+    jobs_columns, jobs_indexes = schema["jobs"]
+    assert {"params", "lease_owner", "lease_expires_at"} <= jobs_columns
+    assert {"ix_jobs_branch_order", "ux_jobs_branch_running", "ix_jobs_status_lease"} <= jobs_indexes
+    assert "uq_branches_workflow_name" in schema["branches"][1]
+    assert "user_slots" in schema
+
+    assert job.status == JobStatus.PENDING and job.params is None
+    assert workflow.weight == 1.0 and weights == {"w-old": 1.0}
+    assert [j.id for j in frontier] == ["j-old"]
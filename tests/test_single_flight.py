@@ -0,0 +1,167 @@
+# tests/test_single_flight.py
+
+"""
+    Single-flight: a job identical to one already running follows it instead of taking a
+    worker slot. Cancelling the leader keeps the execution while followers wait on it;
+    once the last of them is cancelled too, the execution is stopped.
+"""
+
+import asyncio
+import tempfile
+import uuid
+from datetime import datetime
+
+import pytest
+from PIL import Image
+from sqlalchemy import delete, update
+
+from app import scheduler as scheduler_module
+from app.db import SessionLocal, create_tables, engine
+from app.models import Branch, Job, JobStatus, JobType, UserSlot, Workflow
+from app.repositories import job_repo
+from app.resources import ResourceBudget
+from app.result_cache import ResultCache
+
+
+class FakeExecution:
+    """
+    Stands in for execute_job: records each run and blocks until released.
+    """
+    def __init__(self):
+        self.started = []
+        self.cancelled = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, db, job, run_shards=None):
+        self.started.append(job.id)
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(job.id)
+            raise
+        Image.new("RGB", (8, 8)).save(job.output_path)
+
+
+async def _setup(tmp, n_jobs):
+    await create_tables()
+    async with SessionLocal() as db:
+        for model in (Job, Branch, Workflow):
+            await db.execute(delete(model))
+        await db.execute(update(UserSlot).values(user_id=None, admitted_at=None))
+        await db.commit()
+
+    input_path = f"{tmp}/slide.png"
+    Image.new("RGB", (64, 64), (200, 100, 150)).save(input_path)
+    user_id, workflow_id = f"user-{uuid.uuid4().hex[:8]}", str(uuid.uuid4())
+    branch_ids = [str(uuid.uuid4()) for _ in range(n_jobs)]
+    async with SessionLocal() as db:
+        await job_repo.bulk_insert(
+            db,
+            workflows=[{"id": workflow_id, "user_id": user_id, "name": "wf"}],
+            branches=[{"id": b, "workflow_id": workflow_id, "name": f"b{i}"} for i, b in enumerate(branch_ids)],
+            # same input, type and params: one cache key, different outputs
+            jobs=[
+                {
+                    "id": str(uuid.uuid4()), "workflow_id": workflow_id, "branch_id": b,
+                    "user_id": user_id, "type": JobType.PREVIEW_DOWNSAMPLE,
+                    "input_path": input_path, "output_path": f"{tmp}/out{i}.png",
+                    "params": {}, "status": JobStatus.PENDING, "progress": 0.0, "order_index": 0,
+                }
+                for i, b in enumerate(branch_ids)
+            ],
+        )
+
+    scheduler = scheduler_module.Scheduler(result_cache=ResultCache(f"{tmp}/cache", max_bytes=1 << 20))
+    scheduler.budget = ResourceBudget(cpus=8, memory_mb=16384)
+    await scheduler.recover()
+    await scheduler._schedule_once()
+
+    (cache_key, group), = scheduler._inflight.items()
+    return scheduler, group["leader"], sorted(group["followers"])
+
+
+async def _cancel(scheduler, job_id):
+    # what POST /jobs/{id}/cancel does
+    async with SessionLocal() as db:
+        job = await job_repo.get_job_by_id(db, job_id)
+        job.status = JobStatus.CANCELLED
+        job.finished_at = datetime.utcnow()
+        await db.commit()
+    await scheduler.kill_task(job_id)
+    await asyncio.sleep(0.2)  # let the task and its done-callback settle
+
+
+async def _statuses(job_ids):
+    async with SessionLocal() as db:
+        return [(await job_repo.get_job_by_id(db, j)).status for j in job_ids]
+
+
+@pytest.fixture
+def execution(monkeypatch):
+    fake = FakeExecution()
+    monkeypatch.setattr(scheduler_module, "execute_job", fake)
+    return fake
+
+
+def test_identical_jobs_share_one_execution(execution):
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler, leader, followers = await _setup(tmp, n_jobs=3)
+            assert execution.started == [leader]
+            assert len(followers) == 2
+            assert len(scheduler._running_tasks) == 1  # followers hold no worker slot
+
+            execution.release.set()
+            await asyncio.sleep(0.3)
+            statuses = await _statuses([leader] + followers)
+            stats = scheduler.result_cache.stats()
+        await engine.dispose()
+        return statuses, stats
+
+    statuses, stats = asyncio.run(run())
+    assert statuses == [JobStatus.SUCCEEDED] * 3
+    assert stats["entries"] == 1 and stats["misses"] == 1
+
+
+def test_cancelled_leader_keeps_running_for_its_followers(execution):
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler, leader, followers = await _setup(tmp, n_jobs=2)
+            await _cancel(scheduler, leader)
+            kept = leader in scheduler._running_tasks and not execution.cancelled
+
+            execution.release.set()
+            await asyncio.sleep(0.3)
+            statuses = await _statuses([leader] + followers)
+        await engine.dispose()
+        return kept, statuses
+
+    kept, statuses = asyncio.run(run())
+    assert kept
+    assert statuses == [JobStatus.CANCELLED, JobStatus.SUCCEEDED]
+
+
+def test_cancelling_leader_then_every_follower_stops_the_execution(execution):
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler, leader, followers = await _setup(tmp, n_jobs=3)
+            await _cancel(scheduler, leader)
+            await _cancel(scheduler, followers[0])
+            still_running = leader in scheduler._running_tasks and not execution.cancelled
+
+            await _cancel(scheduler, followers[1])
+            state = {
+                "cancelled": list(execution.cancelled),
+                "running": dict(scheduler._running_tasks),
+                "inflight": dict(scheduler._inflight),
+                "budget_slots": scheduler.budget.stats()["slots"],
+                "statuses": await _statuses([leader] + followers),
+            }
+        await engine.dispose()
+        return still_running, state, leader
+
+    still_running, state, leader = asyncio.run(run())
+    assert still_running  # one follower still waited on it
+    assert state["cancelled"] == [leader]
+    assert state["running"] == {} and state["inflight"] == {} and state["budget_slots"] == 0
+    assert state["statuses"] == [JobStatus.CANCELLED] * 3
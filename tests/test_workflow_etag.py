@@ -0,0 +1,49 @@
+# tests/test_workflow_etag.py
+
+"""
+    GET /api/workflows/{id} is a conditional read: the client's last ETag gets a 304
+    until something in the workflow changes.
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import scheduler as scheduler_module
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def execute(db, job, run_shards=None):
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(scheduler_module, "execute_job", execute)
+    from app.main import app
+    with TestClient(app) as client:
+        yield client
+
+
+def test_unchanged_workflow_answers_304(client):
+    owner = {"X-User-ID": "etag-user"}
+    workflow_id = client.post("/api/workflows", json={"name": "w"}, headers=owner).json()["workflow_id"]
+
+    first = client.get(f"/api/workflows/{workflow_id}", headers=owner)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get(f"/api/workflows/{workflow_id}", headers={**owner, "If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag
+    assert client.get(f"/api/workflows/{workflow_id}", headers={"X-User-ID": "someone-else"}).status_code == 404
+
+    client.post(
+        f"/api/workflows/{workflow_id}/jobs",
+        json={
+            "branch_name": "main", "job_type": "preview_downsample",
+            "input_path": "missing.png", "output_path": "out.png",
+        },
+        headers=owner,
+    )
+    changed = client.get(f"/api/workflows/{workflow_id}", headers={**owner, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag and len(changed.json()["jobs"]) == 1